@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        """ connect the api signals receivers, register the background jobs, time the queries """
+        from . import signals, pictures, bulk, deletion, instrumentation
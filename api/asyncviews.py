@@ -0,0 +1,48 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+# database threads of the async views, every thread keeps its own database connection
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_DB_THREADS', 16),
+    thread_name_prefix='db'
+)
+
+
+def call_in_pool(function, *args, **kwargs):
+    """ database thread call, the outdated connection (CONN_MAX_AGE, errors) is closed first """
+    close_old_connections()
+    return function(*args, **kwargs)
+
+
+async def run_in_pool(function, *args, **kwargs):
+    """ run the blocking function on the database threads pool, in a copy of the caller context """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, call_in_pool, function, *args, **kwargs))
+
+
+def rendered_view(view, request, *args, **kwargs):
+    """ call the view and render its response, off the event loop """
+    response = view(request, *args, **kwargs)
+    if callable(getattr(response, 'render', None)):
+        response.render()
+    return response
+
+
+def async_view(view):
+    """ async version of a sync (api) view, the event loop holds the waiting clients and the
+        view (authentication, queries, serialization, rendering) runs on the database threads pool """
+    async def handler(request, *args, **kwargs):
+        return await run_in_pool(rendered_view, view, request, *args, **kwargs)
+    handler.csrf_exempt = getattr(view, 'csrf_exempt', False)
+    handler.view_class = getattr(view, 'view_class', None)
+    return handler
+
+
+def read_view(view):
+    """ the read view, async when enabled for the asgi application (ASYNC_READ_VIEWS) """
+    return async_view(view) if getattr(settings, 'ASYNC_READ_VIEWS', False) else view
@@ -0,0 +1,201 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .models import User
+from .instrumentation import timed
+from .metrics import count_cache
+
+
+class LRUTokenCache:
+    """ in-process bounded token cache, least recently used entries are evicted first,
+        the entries hold the user stamp of the `alias` django cache they were read at,
+        changed by the invalidations: with a shared CACHES backend (redis, memcached) they
+        reach every process at once, with an in-process one the other processes entries
+        stay in use until their timeout """
+    prefix = 'tokenauth'
+
+    def __init__(self, max_entries, timeout, alias=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.alias = alias
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.lock = threading.Lock()
+
+    def user_stamp(self, user_id):
+        """ stamp of the user in the shared cache, None when unset or without alias """
+        return caches[self.alias].get(f'{self.prefix}:stamp:{user_id}') if self.alias else None
+
+    def outdate(self, user_id):
+        """ change the user stamp, the entries of every process sharing the cache are outdated """
+        if self.alias:
+            caches[self.alias].set(f'{self.prefix}:stamp:{user_id}', uuid.uuid4().hex, self.timeout)
+
+    def get(self, key):
+        """ return the cached entry of the token key or None """
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is None:
+                return None
+            expires_at, stamp, entry = cached
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+        if stamp != self.user_stamp(entry[0]):
+            self.delete(key)
+            return None
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key, user_id, entry):
+        """ cache the token key entry """
+        stamp = self.user_stamp(user_id)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, stamp, entry)
+            self.entries.move_to_end(key)
+            self.user_keys[user_id] = key
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, key, user_id=None):
+        """ remove the token key entry """
+        with self.lock:
+            self._remove(key)
+        if user_id is not None:
+            self.outdate(user_id)
+
+    def delete_user(self, user_id):
+        """ remove the user token entry """
+        with self.lock:
+            key = self.user_keys.pop(user_id, None)
+            if key is not None:
+                self._remove(key)
+        self.outdate(user_id)
+
+    def clear(self):
+        """ remove every entry """
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+
+    def _remove(self, key):
+        cached = self.entries.pop(key, None)
+        if cached is not None:
+            user_id = cached[2][0]
+            if self.user_keys.get(user_id) == key:
+                del self.user_keys[user_id]
+
+
+class DjangoTokenCache:
+    """ token cache stored in a django cache backend, shared by the workers
+        when the backend is (redis, memcached, database) """
+    prefix = 'tokenauth'
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        """ return the cached entry of the token key or None """
+        return self.cache.get(f'{self.prefix}:key:{key}')
+
+    def set(self, key, user_id, entry):
+        """ cache the token key entry """
+        self.cache.set_many({
+            f'{self.prefix}:key:{key}': entry,
+            f'{self.prefix}:user:{user_id}': key,
+        }, self.timeout)
+
+    def delete(self, key, user_id=None):
+        """ remove the token key entry """
+        self.cache.delete(f'{self.prefix}:key:{key}')
+
+    def delete_user(self, user_id):
+        """ remove the user token entry """
+        key = self.cache.get(f'{self.prefix}:user:{user_id}')
+        if key is not None:
+            self.cache.delete_many([f'{self.prefix}:key:{key}', f'{self.prefix}:user:{user_id}'])
+
+    def clear(self):
+        """ nothing to do, entries expire with the backend timeout """
+
+
+def build_token_cache():
+    """ build the token cache from the TOKEN_AUTHENTICATION_CACHE setting """
+    options = getattr(settings, 'TOKEN_AUTHENTICATION_CACHE', {})
+    timeout = options.get('TIMEOUT', 300)
+    if options.get('BACKEND', 'lru') == 'django':
+        return DjangoTokenCache(options.get('CACHE_ALIAS', 'default'), timeout)
+    return LRUTokenCache(options.get('MAX_ENTRIES', 10000), timeout, options.get('CACHE_ALIAS', 'default'))
+
+
+token_cache = build_token_cache()
+
+
+def invalidate_token(key, user_id=None):
+    """ remove a token from the authentication cache, again once the transaction is committed
+        (a concurrent request may cache the row read before the commit meanwhile) """
+    token_cache.delete(key, user_id)
+    transaction.on_commit(lambda: token_cache.delete(key, user_id))
+
+
+def invalidate_user_token(user_id):
+    """ remove the user token from the authentication cache, again once the transaction is committed """
+    token_cache.delete_user(user_id)
+    transaction.on_commit(lambda: token_cache.delete_user(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ token authentication keeping the token -> user lookups in the token cache, a cache
+        hit reads no database row """
+
+    def authenticate(self, request):
+        """ authenticate the request, timed as the instrumentation auth phase """
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        """ return the (user, token) of the token key, from the cache when possible """
+        entry = token_cache.get(key)
+        count_cache('token', '', entry is not None)
+        if entry is None:
+            return self.read_credentials(key)
+
+        user_id, created, values = entry
+        user = User.from_db('default', [field.attname for field in User._meta.concrete_fields], values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token = Token(key=key, user=user, created=created)
+        token._state.adding = False
+        token._state.db = 'default'
+        return (user, token)
+
+    def read_credentials(self, key):
+        """ read the (user, token) of the token key, in one query, and cache them """
+        try:
+            token = Token.objects.select_related('user').get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user = token.user
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token_cache.set(key, user.id, (
+            user.id,
+            token.created,
+            tuple(getattr(user, field.attname) for field in User._meta.concrete_fields),
+        ))
+        return (user, token)
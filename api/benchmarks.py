@@ -0,0 +1,243 @@
+import asyncio
+import io
+import json
+import time
+import uuid
+from datetime import timedelta
+from itertools import count
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from .models import User, Task, Job
+
+# employees (and their tasks) the scenarios requests cycle through, at most
+SAMPLE_SIZE = 100
+# last employees deleted by the delete_employee scenario
+DELETED_EMPLOYEES = 1000
+
+
+def percentile(latencies, percent):
+    """ nearest rank percentile of the sorted latencies """
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, max(0, -(-percent * len(latencies) // 100) - 1))]
+
+
+def http_request(method, path, host, token=None, body=b'', content_type='application/json'):
+    """ keep alive http/1.1 request bytes """
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {host}']
+    if token:
+        lines.append(f'Authorization: Token {token}')
+    if body:
+        lines += [f'Content-Type: {content_type}', f'Content-Length: {len(body)}']
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+
+def multipart(fields, files=()):
+    """ multipart/form-data body of the fields and (name, filename, content) files, and its content type """
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    for name, filename, content in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    return b''.join(parts) + f'--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+async def read_response(reader):
+    """ read a response, return (status, keep alive) """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def connection_loop(host, port, next_request, deadline, timeout, results):
+    """ send the requests on one keep alive connection until the deadline, reconnect on errors """
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            request = next_request()
+            sent = time.monotonic()
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+            results['latencies'].append(time.monotonic() - sent)
+            results['statuses'][status] = results['statuses'].get(status, 0) + 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            results['errors'] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(host, port, next_request, connections, duration, timeout):
+    """ send the `next_request()` requests on concurrent keep alive connections for the duration,
+        return the latencies, errors count, statuses counts and measured duration """
+    results = {'latencies': [], 'errors': 0, 'statuses': {}}
+    started = time.monotonic()
+    await asyncio.gather(*(
+        connection_loop(host, port, next_request, started + duration, timeout, results)
+        for _ in range(connections)
+    ))
+    results['duration'] = time.monotonic() - started
+    return results
+
+
+def load_summary(results, percents=(50, 95, 99)):
+    """ requests, errors, statuses, throughput and latency percentiles (ms) of a load results """
+    latencies = sorted(results['latencies'])
+    summary = {
+        'requests': len(latencies),
+        'errors': results['errors'],
+        'statuses': {str(status): number for status, number in sorted(results['statuses'].items())},
+        'requests_per_second': round(len(latencies) / results['duration'], 1),
+    }
+    for percent in percents:
+        value = percentile(latencies, percent)
+        summary[f'p{percent}_ms'] = round(value * 1000, 1) if value is not None else None
+    return summary
+
+
+class EndpointScenarios:
+    """ requests of every api url (by url name), on the rows generated by seed_bench, each
+        scenario is a function of the request index returning the request bytes """
+
+    def __init__(self, host, prefix='bench'):
+        self.host = host
+        self.run = uuid.uuid4().hex[:8]
+        admin = User.objects.filter(username=f'{prefix}_admin', auth_token__isnull=False).first()
+        if admin is None:
+            raise LookupError(f'no {prefix}_admin user, generate the rows with seed_bench first')
+        self.admin_token = Token.objects.get(user=admin).key
+        employees = User.objects.filter(
+            username__startswith=f'{prefix}_', is_staff=False, is_active=True, auth_token__isnull=False
+        )
+        # half of the employees at most, the others can be deleted
+        sample_size = min(SAMPLE_SIZE, max(1, employees.count() // 2))
+        self.employees = list(employees.order_by('id').values_list('id', 'auth_token__key')[:sample_size])
+        sample = [employee_id for employee_id, _ in self.employees]
+        self.deleted = list(employees.exclude(id__in=sample).order_by('-id').values_list('id', flat=True)[:DELETED_EMPLOYEES])
+        self.tasks = list(Task.objects.filter(employee_id__in=sample).order_by('id').values_list('id', flat=True)[:SAMPLE_SIZE * 10])
+        if not self.employees or not self.tasks:
+            raise LookupError(f'no {prefix}_ employees with tasks, generate the rows with seed_bench first')
+        job = Job.objects.order_by('-id').first() or Job.objects.create(
+            name='bench', status=Job.DONE, run_at=timezone.now(), finished_at=timezone.now()
+        )
+        self.job_id = job.id
+        content = io.BytesIO()
+        Image.new('RGB', (64, 64), (40, 120, 200)).save(content, 'PNG')
+        self.picture = content.getvalue()
+        self.scenarios = {
+            'is_admin': self.employee_get(reverse('api:is_admin')),
+            'get_user': self.employee_get(reverse('api:get_user')),
+            'session_bootstrap': self.employee_get(reverse('api:session_bootstrap')),
+            'get_employees': self.admin_get(f"{reverse('api:get_employees')}?page_size=100"),
+            'add_employee': self.add_employee,
+            'payroll_summary': self.admin_get(reverse('api:payroll_summary')),
+            'export_employees': lambda index: self.request('GET', f"{reverse('api:export_employees')}?employee={self.employee(index)[0]}"),
+            'bulk_add_employees': self.bulk_add_employees,
+            'update_employee': lambda index: self.request('PATCH', reverse('api:update_employee'), {
+                'employee_id': self.employee(index)[0], 'salary': 300 + index % 500,
+            }),
+            'get_tasks': self.admin_get(f"{reverse('api:get_tasks')}?page_size=100"),
+            'add_task': lambda index: self.request('POST', reverse('api:add_task'), {
+                'employee_id': self.employee(index)[0], 'title': f'bench task {index}',
+                'description': 'benchmark task', 'deadline': (timezone.now() + timedelta(days=7)).isoformat(),
+            }),
+            'update_task': lambda index: self.request('PATCH', reverse('api:update_task'), {
+                'task_id': self.task(index), 'title': f'bench task {index}',
+            }),
+            'export_tasks': lambda index: self.request('GET', f"{reverse('api:export_tasks')}?employee={self.employee(index)[0]}"),
+            'tasks_dashboard': self.admin_get(reverse('api:tasks_dashboard')),
+            'tasks_batch': lambda index: self.request('POST', reverse('api:tasks_batch'), {
+                'mode': 'best_effort',
+                'operations': [{'op': 'update', 'task_ids': [self.task(index + offset) for offset in range(10)], 'title': f'batch {index}'}],
+            }),
+            'get_employee_tasks': self.employee_get(reverse('api:get_employee_tasks')),
+            'changes': self.employee_get(reverse('api:changes')),
+            'job_metrics': self.admin_get(reverse('api:job_metrics')),
+            'job_status': self.admin_get(reverse('api:job_status', args=[self.job_id])),
+            'cache_stats': self.admin_get(reverse('api:cache_stats')),
+            'instrumentation': self.admin_get(reverse('api:instrumentation')),
+            'metrics': self.admin_get(reverse('api:metrics')),
+            'user_profil': lambda index: self.request('GET', reverse('api:user_profil', args=[self.employee(index)[0]]), token=self.employee(index)[1]),
+            # the deletions last, they remove rows the other scenarios use, the sample tasks are
+            # deleted from the last one (then answered 400)
+            'delete_task': lambda index: self.request('DELETE', reverse('api:delete_task'), {
+                'task_id': self.tasks[-1 - index % len(self.tasks)],
+            }),
+            'delete_employee': lambda index: self.request('DELETE', reverse('api:delete_employee'), {
+                'employee_id': self.deleted[index % len(self.deleted)] if self.deleted else 0,
+            }),
+        }
+
+    def employee(self, index):
+        """ (id, token) of a sample employee """
+        return self.employees[index % len(self.employees)]
+
+    def task(self, index):
+        """ id of a sample task """
+        return self.tasks[index % len(self.tasks)]
+
+    def request(self, method, path, data=None, token=None, content_type='application/json'):
+        """ request bytes, by the admin unless a token is given, data as json """
+        body = data if isinstance(data, bytes) else json.dumps(data).encode() if data is not None else b''
+        return http_request(method, path, self.host, token or self.admin_token, body, content_type)
+
+    def admin_get(self, path):
+        """ scenario of a get by the admin """
+        request = self.request('GET', path)
+        return lambda index: request
+
+    def employee_get(self, path):
+        """ scenario of a get by the sample employees """
+        requests = [self.request('GET', path, token=token) for _, token in self.employees]
+        return lambda index: requests[index % len(requests)]
+
+    def add_employee(self, index):
+        """ new employee with a picture """
+        body, content_type = multipart(
+            {'username': f'new_{self.run}_{index}', 'password': 'password', 'salary': 400},
+            [('picture', 'picture.png', self.picture)]
+        )
+        return self.request('POST', reverse('api:add_employee'), body, content_type=content_type)
+
+    def bulk_add_employees(self, index):
+        """ 10 new employees csv import """
+        rows = ''.join(f'bulk_{self.run}_{index}_{row},password,{400 + row}\n' for row in range(10))
+        body, content_type = multipart({}, [('file', 'employees.csv', f'username,password,salary\n{rows}'.encode())])
+        return self.request('POST', reverse('api:bulk_add_employees'), body, content_type=content_type)
+
+    def next_request(self, name):
+        """ the scenario requests generator, each call returns the next request bytes """
+        scenario, indexes = self.scenarios[name], count()
+        return lambda: scenario(next(indexes))
@@ -0,0 +1,45 @@
+from django.db.models import Count, Q
+from django.utils import timezone
+from .filters import order_tasks
+from .models import User, Task
+from .serializers import UserSerializer, TaskSerializer
+
+
+def admin_summary(now=None):
+    """ active employees, tasks and overdue tasks counts, in two queries """
+    now = now or timezone.now()
+    counts = Task.objects.filter(employee__is_active=True).aggregate(
+        tasks=Count('id'),
+        overdue=Count('id', filter=Q(deadline__lt=now)),
+    )
+    return {
+        'employees': User.objects.filter(profil__isnull=False, is_active=True).count(),
+        'tasks': counts['tasks'],
+        'overdue_tasks': counts['overdue'],
+    }
+
+
+def session_bootstrap(user, sections, tasks_page_size, query_params):
+    """ the client start data of the user, one query per section: the user with its
+        profil and token, the first page of its tasks and, for the admins, the summary counts """
+    data = {}
+    if 'user' in sections or 'roles' in sections:
+        user = User.objects.select_related('profil', 'auth_token').get(id=user.id)
+    if 'user' in sections:
+        data['user'] = UserSerializer(user).data
+    if 'roles' in sections:
+        data['roles'] = {
+            'is_admin': user.is_staff,
+            'is_employee': hasattr(user, 'profil'),
+        }
+    if 'tasks' in sections:
+        tasks = list(order_tasks(
+            Task.objects.filter(employee_id=user.id).select_related('employee'), query_params
+        )[:tasks_page_size + 1])
+        data['tasks'] = {
+            'results': TaskSerializer(tasks[:tasks_page_size], many=True).data,
+            'has_more': len(tasks) > tasks_page_size,
+        }
+    if 'summary' in sections and user.is_staff:
+        data['summary'] = admin_summary()
+    return data
@@ -0,0 +1,378 @@
+import csv
+import io
+import json
+import os
+import time
+import zipfile
+from collections import Counter
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+from .models import User, Profil, Task, CollectionVersion
+from .jobs import job
+from .payroll import apply_salary_changes
+from .pictures import picture_name, store_picture, process_picture
+from .versions import bump_versions, deferred_versions, TASKS, PROFILS, USERS
+from .sync import record_tombstones
+from .events import publish
+from .serializers import (BulkEmployeeRowSerializer,
+                            AddNewTaskSerializer,
+                            BatchUpdateTaskSerializer,
+                            BatchDeleteTaskSerializer,
+                            BatchReassignTaskSerializer
+                            )
+
+
+def detect_format(upload, requested=None):
+    """ return the upload format, 'csv' or 'ndjson' """
+    if requested:
+        return requested
+    extension = os.path.splitext(upload.name or '')[1].lower()
+    if extension in ('.ndjson', '.jsonl') or 'json' in (upload.content_type or ''):
+        return 'ndjson'
+    return 'csv'
+
+
+def iter_rows(upload, file_format):
+    """ stream the upload rows as (row number, data or parse error) """
+    text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, row
+        return
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, serializers.ValidationError({'row': ['invalid json line']})
+            continue
+        if not isinstance(row, dict):
+            row = serializers.ValidationError({'row': ['a json object is expected']})
+        yield number, row
+
+
+def iter_chunks(rows, size):
+    """ group the rows in lists of `size` rows """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class EmployeesImport:
+    """ bulk employees import, rows are validated and inserted chunk by chunk """
+
+    def __init__(self, pictures=None, chunk_size=None):
+        self.pictures = zipfile.ZipFile(pictures) if pictures is not None else None
+        self.chunk_size = chunk_size or getattr(settings, 'BULK_IMPORT_CHUNK_SIZE', 500)
+        self.usernames = set()
+        self.created = 0
+        self.rows = 0
+        self.errors = []
+
+    def run(self, rows):
+        """ import the rows, return the import report """
+        started = time.monotonic()
+        for chunk in iter_chunks(rows, self.chunk_size):
+            self.import_chunk(chunk)
+        duration = time.monotonic() - started
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+            'duration': round(duration, 3),
+            'rows_per_second': round(self.rows / duration) if duration else self.rows,
+        }
+
+    def import_chunk(self, chunk):
+        """ validate then insert a chunk of rows in one transaction """
+        valid = []
+        for number, row in chunk:
+            self.rows += 1
+            if isinstance(row, serializers.ValidationError):
+                self.errors.append({'row': number, 'errors': row.detail})
+                continue
+            serializer = BulkEmployeeRowSerializer(data=row)
+            if not serializer.is_valid():
+                self.errors.append({'row': number, 'errors': serializer.errors})
+                continue
+            data = serializer.validated_data
+            if data['username'] in self.usernames:
+                self.errors.append({'row': number, 'errors': {'username': ['duplicated username']}})
+                continue
+            try:
+                picture = self.get_picture(data.get('picture'))
+            except serializers.ValidationError as error:
+                self.errors.append({'row': number, 'errors': {'picture': error.detail}})
+                continue
+            self.usernames.add(data['username'])
+            valid.append((number, data, picture))
+        if not valid:
+            return
+
+        existing = set(
+            User.objects.filter(username__in=[data['username'] for _, data, _ in valid])
+            .values_list('username', flat=True)
+        )
+        rows = []
+        for number, data, picture in valid:
+            if data['username'] in existing:
+                self.errors.append({'row': number, 'errors': {'username': ['username already exists']}})
+            else:
+                rows.append((number, data, picture))
+        if not rows:
+            return
+
+        # the pictures are named by their content, stored once the rows are committed
+        rows = [(number, data, (picture_name(picture), picture) if picture else None) for number, data, picture in rows]
+        while rows:
+            try:
+                self.insert_rows([(data, picture) for _, data, picture in rows])
+                return
+            except IntegrityError:
+                rows = self.concurrent_rows(rows)
+
+    def concurrent_rows(self, rows):
+        """ report the rows of the usernames inserted meanwhile (by a concurrent request), return
+            the other rows, none when the insert failed on another constraint (reported on every row) """
+        taken = set(
+            User.objects.filter(username__in=[data['username'] for _, data, _ in rows])
+            .values_list('username', flat=True)
+        )
+        for number, data, _ in rows:
+            if not taken:
+                self.errors.append({'row': number, 'errors': {'row': ['could not be inserted']}})
+            elif data['username'] in taken:
+                self.errors.append({'row': number, 'errors': {'username': ['username already exists']}})
+        return [row for row in rows if taken and row[1]['username'] not in taken]
+
+    def insert_rows(self, rows):
+        """ insert the (data, (picture name, picture) or None) rows users and profils in one
+            transaction, then store their pictures (identical pictures once), a rolled back
+            insert stores none """
+        with transaction.atomic():
+            User.objects.bulk_create(
+                [User(username=data['username'], password=make_password(data['password'])) for data, _ in rows],
+                batch_size=self.chunk_size
+            )
+            # sqlite does not return the bulk inserted ids
+            ids = dict(
+                User.objects.filter(username__in=[data['username'] for data, _ in rows])
+                .values_list('username', 'id')
+            )
+            Profil.objects.bulk_create(
+                [
+                    Profil(
+                        user_id=ids[data['username']], salary=data['salary'],
+                        picture=picture[0] if picture else '', change_stamp=stamp
+                    )
+                    for (data, picture), stamp in zip(rows, CollectionVersion.objects.reserve_stamps(len(rows)))
+                ],
+                batch_size=self.chunk_size
+            )
+            apply_salary_changes(Counter(data['salary'] for data, _ in rows))
+        bump_versions(USERS, PROFILS)
+        for name, picture in dict(picture for _, picture in rows if picture).items():
+            process_picture(store_picture(picture, name))
+        self.created += len(rows)
+
+    def get_picture(self, name):
+        """ return the validated picture file named in the pictures zip or None """
+        if not name:
+            return None
+        if self.pictures is None:
+            raise serializers.ValidationError(['no pictures zip uploaded'])
+        try:
+            content = self.pictures.read(name)
+        except KeyError:
+            raise serializers.ValidationError([f'{name} not found in the pictures zip'])
+        upload = SimpleUploadedFile(os.path.basename(name), content)
+        serializers.ImageField().run_validation(upload)
+        return ContentFile(content, name=os.path.basename(name))
+
+
+@job('import_employees', max_attempts=1)
+def import_employees(file, file_format, pictures=None):
+    """ background employees import of the stored upload files, removed once imported """
+    try:
+        with default_storage.open(file) as upload:
+            pictures_file = default_storage.open(pictures) if pictures else None
+            try:
+                return EmployeesImport(pictures=pictures_file).run(iter_rows(upload, file_format))
+            finally:
+                if pictures_file is not None:
+                    pictures_file.close()
+    finally:
+        for name in (file, pictures):
+            if name:
+                default_storage.delete(name)
+
+
+def delete_tasks(tasks):
+    """ delete the tasks of the queryset by one DELETE statement, without the per row signals
+        (nothing references the tasks): the tombstones are recorded together, the callers bump
+        the versions and publish the events per employee, return the {employee id: deleted count} """
+    rows = list(tasks.select_for_update().values_list('id', 'employee_id'))
+    if not rows:
+        return Counter()
+    record_tombstones(TASKS, rows)
+    Task.objects.filter(id__in=[task_id for task_id, _ in rows])._raw_delete(Task.objects.db)
+    return Counter(employee_id for _, employee_id in rows)
+
+
+class TasksBatch:
+    """ tasks batch operations run as set based statements, consecutive creations
+        are inserted together, in one transaction (atomic mode) or one transaction
+        per statement (best effort mode) """
+    operation_serializers = {
+        'create': AddNewTaskSerializer,
+        'update': BatchUpdateTaskSerializer,
+        'delete': BatchDeleteTaskSerializer,
+        'reassign': BatchReassignTaskSerializer,
+    }
+
+    def __init__(self, operations, atomic=True):
+        self.operations = operations
+        self.atomic = atomic
+        self.results = [None] * len(operations)
+        self.valid = []
+        self.employee_ids = set()
+
+    def run(self):
+        """ validate then run the operations, return True if every operation succeeded """
+        with deferred_versions():
+            done = self.run_operations()
+            # set based statements do not send the models signals
+            bump_versions(TASKS, *(f'{TASKS}:{employee_id}' for employee_id in sorted(self.employee_ids)))
+        for employee_id in sorted(self.employee_ids):
+            publish(f'{TASKS}:{employee_id}', {'type': 'tasks.changed'})
+        return done
+
+    def run_operations(self):
+        """ validate then run the operations """
+        self.validate()
+        if self.atomic and len(self.valid) != len(self.operations):
+            self.skip_remaining('not applied')
+            return False
+        groups = self.group()
+        if self.atomic:
+            try:
+                with transaction.atomic():
+                    for group in groups:
+                        self.execute_group(group)
+            except DatabaseError:
+                for index, _, _ in self.valid:
+                    if self.results[index] and self.results[index]['status'] == 'ok':
+                        self.results[index] = {'op': self.operations[index]['op'], 'status': 'rolled back'}
+                self.skip_remaining('not applied')
+                return False
+            return True
+        for group in groups:
+            try:
+                with transaction.atomic():
+                    self.execute_group(group)
+            except DatabaseError:
+                pass
+        return all(result['status'] == 'ok' for result in self.results)
+
+    def validate(self):
+        """ validate the operations data and the referenced employees """
+        validated = []
+        for index, operation in enumerate(self.operations):
+            op = operation.get('op')
+            serializer_class = self.operation_serializers.get(op) if isinstance(op, str) else None
+            if serializer_class is None:
+                self.fail(index, {'op': [f'expected one of {", ".join(self.operation_serializers)}']})
+                continue
+            serializer = serializer_class(data=operation)
+            if not serializer.is_valid():
+                self.fail(index, serializer.errors)
+                continue
+            validated.append((index, operation['op'], serializer.validated_data))
+
+        employee_ids = {
+            data.get('employee_id', data.get('to_employee_id'))
+            for _, op, data in validated if op in ('create', 'reassign')
+        }
+        employees = set(
+            User.objects.filter(id__in=employee_ids, is_staff=False, is_active=True).values_list('id', flat=True)
+        ) if employee_ids else set()
+        for index, op, data in validated:
+            employee_id = data.get('employee_id', data.get('to_employee_id'))
+            if op in ('create', 'reassign') and employee_id not in employees:
+                self.fail(index, {'text': 'employee not exists'})
+                continue
+            self.valid.append((index, op, data))
+
+    def group(self):
+        """ group the consecutive creations together """
+        groups = []
+        for operation in self.valid:
+            if groups and operation[1] == 'create' and groups[-1][0][1] == 'create':
+                groups[-1].append(operation)
+            else:
+                groups.append([operation])
+        return groups
+
+    def execute_group(self, group):
+        """ run one statement for the group """
+        op = group[0][1]
+        try:
+            if op == 'create':
+                stamps = CollectionVersion.objects.reserve_stamps(len(group))
+                Task.objects.bulk_create([Task(**data, change_stamp=stamp) for (_, _, data), stamp in zip(group, stamps)])
+                self.employee_ids.update(data['employee_id'] for _, _, data in group)
+                for index, _, _ in group:
+                    self.results[index] = {'op': op, 'status': 'ok', 'count': 1}
+                return
+            index, _, data = group[0]
+            if op == 'update':
+                fields = {name: data[name] for name in ('title', 'description', 'deadline') if name in data}
+                tasks = Task.objects.filter(id__in=data['task_ids'])
+                self.employee_ids.update(tasks.values_list('employee_id', flat=True).distinct())
+                count = tasks.update(
+                    **fields, version=F('version') + 1,
+                    change_stamp=CollectionVersion.objects.reserve_stamps(1)[0], changed_at=timezone.now()
+                )
+            elif op == 'delete':
+                deleted = delete_tasks(Task.objects.filter(id__in=data['task_ids']))
+                self.employee_ids.update(deleted)
+                count = sum(deleted.values())
+            else:
+                self.employee_ids.update((data['from_employee_id'], data['to_employee_id']))
+                tasks = Task.objects.filter(employee_id=data['from_employee_id'])
+                # the tasks are gone for the employee delta sync
+                record_tombstones(TASKS, [
+                    (task_id, data['from_employee_id']) for task_id in tasks.values_list('id', flat=True)
+                ])
+                count = tasks.update(
+                    employee_id=data['to_employee_id'], version=F('version') + 1,
+                    change_stamp=CollectionVersion.objects.reserve_stamps(1)[0], changed_at=timezone.now()
+                )
+            self.results[index] = {'op': op, 'status': 'ok', 'count': count}
+        except DatabaseError as error:
+            for index, _, _ in group:
+                self.fail(index, {'text': str(error)})
+            raise
+
+    def fail(self, index, errors):
+        """ record an operation error """
+        self.results[index] = {'op': self.operations[index].get('op'), 'status': 'error', 'errors': errors}
+
+    def skip_remaining(self, status):
+        """ mark the operations without result """
+        for index, result in enumerate(self.results):
+            if result is None:
+                self.results[index] = {'op': self.operations[index].get('op'), 'status': status}
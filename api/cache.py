@@ -0,0 +1,144 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, Counter
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from .metrics import count_cache
+from .versions import get_versions, resolve_scopes, version_tokens
+
+
+class LRUResponseCache:
+    """ in-process bounded responses cache, least recently used entries are evicted first """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ return the cached entry or None """
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is None:
+                return None
+            expires_at, entry = cached
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """ cache the entry """
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, entry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """ remove every entry """
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DjangoResponseCache:
+    """ responses cache stored in a django cache backend """
+    prefix = 'response'
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    def get(self, key):
+        """ return the cached entry or None """
+        return caches[self.alias].get(f'{self.prefix}:{key}')
+
+    def set(self, key, entry):
+        """ cache the entry """
+        caches[self.alias].set(f'{self.prefix}:{key}', entry, self.timeout)
+
+    def clear(self):
+        """ nothing to do, entries expire with the backend timeout """
+
+    def __len__(self):
+        return 0
+
+
+def build_response_cache():
+    """ build the responses cache from the RESPONSE_CACHE setting """
+    options = getattr(settings, 'RESPONSE_CACHE', {})
+    timeout = options.get('TIMEOUT', 60)
+    if options.get('BACKEND', 'lru') == 'django':
+        return DjangoResponseCache(options.get('CACHE_ALIAS', 'default'), timeout)
+    return LRUResponseCache(options.get('MAX_ENTRIES', 1000), timeout)
+
+
+response_cache = build_response_cache()
+cache_hits = Counter()
+cache_misses = Counter()
+
+
+def cache_stats():
+    """ return the responses cache hits, misses per view of this process """
+    views = sorted(set(cache_hits) | set(cache_misses))
+    hits = sum(cache_hits.values())
+    misses = sum(cache_misses.values())
+    return {
+        'entries': len(response_cache),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        'views': {view: {'hits': cache_hits[view], 'misses': cache_misses[view]} for view in views},
+    }
+
+
+def response_cache_key(view, request, scopes, per_user):
+    """ cache key of the request: view, user or role, request and scopes versions """
+    names = resolve_scopes(request, scopes)
+    versions = get_versions(request, names) if names else {}
+    user = request.user
+    key = '|'.join([
+        view.__class__.__name__,
+        str(user.pk) if per_user else ('staff' if user.is_staff else 'user'),
+        request.get_host(),
+        request.get_full_path(),
+        request.accepted_media_type,
+        *version_tokens(versions),
+    ])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def cached_response(*scopes, per_user=True):
+    """ api view get method decorator caching the rendered response bytes, per user
+        (or per role), the key holds the scopes versions so the entries are outdated
+        by the models signals as soon as the underlying rows change """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            name = view.__class__.__name__
+            key = response_cache_key(view, request, scopes, per_user)
+            cached = response_cache.get(key)
+            count_cache('response', name, cached is not None)
+            if cached is not None:
+                cache_hits[name] += 1
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            cache_misses[name] += 1
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                response.accepted_renderer = request.accepted_renderer
+                response.accepted_media_type = request.accepted_media_type
+                response.renderer_context = view.get_renderer_context()
+                response.render()
+                response_cache.set(key, (response.content, response['Content-Type']))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+import gzip
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESPONSE_COMPRESSION = {
+    # smallest compressed response body, in bytes
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    # compressed content types (prefixes)
+    'CONTENT_TYPES': ('application/json', 'application/x-ndjson', 'text/'),
+}
+
+
+def compression_settings():
+    """ RESPONSE_COMPRESSION setting over the defaults, read per response """
+    return {**RESPONSE_COMPRESSION, **getattr(settings, 'RESPONSE_COMPRESSION', {})}
+
+
+def accepted_encodings(header):
+    """ {encoding: quality} of an Accept-Encoding header """
+    encodings = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def negotiate_encoding(header):
+    """ the response encoding for an Accept-Encoding header, brotli (when installed) then gzip
+        at equal qualities, None for an identity response """
+    encodings = accepted_encodings(header or '')
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = encodings.get(encoding, encodings.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content, encoding, options):
+    """ compressed bytes of the content """
+    if encoding == 'br':
+        return brotli.compress(content, quality=options['BROTLI_QUALITY'])
+    return gzip.compress(content, compresslevel=options['GZIP_LEVEL'], mtime=0)
+
+
+def compress_stream(chunks, encoding, options):
+    """ compressed chunks of a streamed content, flushed with every chunk """
+    if encoding == 'gzip':
+        yield from compress_sequence(chunks)
+        return
+    compressor = brotli.Compressor(quality=options['BROTLI_QUALITY'])
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """ brotli or gzip compression of the responses negotiated from the Accept-Encoding header,
+        for the compressible content types bigger than MIN_SIZE (every streamed response) """
+
+    def process_response(self, request, response):
+        """ compress the response """
+        if response.has_header('Content-Encoding') or response.status_code < 200 or response.status_code == 204:
+            return response
+        options = compression_settings()
+        if not response.get('Content-Type', '').startswith(tuple(options['CONTENT_TYPES'])):
+            return response
+        if not response.streaming and len(response.content) < options['MIN_SIZE']:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding, options)
+            del response['Content-Length']
+        else:
+            content = compress(response.content, encoding, options)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        # the compressed content is not the same bytes, its etag is a weak one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
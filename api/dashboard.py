@@ -0,0 +1,47 @@
+from datetime import timedelta
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import Task
+
+
+def deadline_bounds(now):
+    """ return the (start of tomorrow, start of next week) bounds in the current timezone """
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1)
+    next_week = today + timedelta(days=7 - today.weekday())
+    return tomorrow, next_week
+
+
+def deadline_dashboard(now=None):
+    """ per employee overdue, due today and due this week tasks counts,
+        computed by one grouped query """
+    now = now or timezone.now()
+    tomorrow, next_week = deadline_bounds(now)
+    rows = (
+        Task.objects.filter(deadline__lt=next_week, employee__is_active=True)
+        .values('employee_id', 'employee__username')
+        .annotate(
+            overdue=Count('id', filter=Q(deadline__lt=now)),
+            due_today=Count('id', filter=Q(deadline__gte=now, deadline__lt=tomorrow)),
+            due_this_week=Count('id', filter=Q(deadline__gte=now)),
+        )
+        .order_by('employee_id')
+    )
+    employees = [
+        {
+            'employee_id': row['employee_id'],
+            'employee': row['employee__username'],
+            'overdue': row['overdue'],
+            'due_today': row['due_today'],
+            'due_this_week': row['due_this_week'],
+        }
+        for row in rows
+    ]
+    return {
+        'generated_at': now,
+        'totals': {
+            bucket: sum(employee[bucket] for employee in employees)
+            for bucket in ('overdue', 'due_today', 'due_this_week')
+        },
+        'employees': employees,
+    }
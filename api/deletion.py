@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import transaction
+from .jobs import job, report_progress
+from .models import User, Task
+from .bulk import delete_tasks
+from .events import publish
+from .versions import bump_versions, deferred_versions, TASKS
+from .sync import deferred_tombstones
+
+
+@job('delete_employee')
+def delete_employee(employee_id):
+    """ delete an employee (marked inactive) tasks chunk by chunk, each chunk in its
+        own short transaction, then the employee with its profil and token """
+    chunk_size = getattr(settings, 'EMPLOYEE_DELETE_CHUNK_SIZE', 500)
+    tasks = Task.objects.filter(employee_id=employee_id)
+    total = tasks.count()
+    deleted = 0
+    report_progress(tasks_deleted=deleted, tasks_total=total)
+    while True:
+        with transaction.atomic():
+            task_ids = list(tasks.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not task_ids:
+                break
+            # one DELETE statement per chunk, the versions and the event once per chunk
+            delete_tasks(Task.objects.filter(id__in=task_ids))
+            bump_versions(TASKS, f'{TASKS}:{employee_id}')
+            publish(f'{TASKS}:{employee_id}', {'type': 'tasks.changed'})
+        deleted += len(task_ids)
+        report_progress(tasks_deleted=deleted, tasks_total=max(total, deleted))
+    with transaction.atomic(), deferred_versions(), deferred_tombstones():
+        User.objects.filter(id=employee_id).delete()
+    return {'employee_id': employee_id, 'tasks_deleted': deleted}
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from .jobs import job, enqueue_at
+from .models import Event, Job
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """ events of a channel, delivered to a bounded queue on the subscriber event loop,
+        the oldest event is dropped for a too slow subscriber """
+
+    def __init__(self, broker, channel, max_size=100):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_size)
+
+    def deliver(self, event):
+        """ queue the event from any thread """
+        self.loop.call_soon_threadsafe(self.put, event)
+
+    def put(self, event):
+        """ queue the event, on the subscriber loop """
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        """ wait for the next event """
+        return await self.queue.get()
+
+    def close(self):
+        """ stop receiving the channel events """
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """ in-process pub/sub, the events only reach the subscribers of the publishing process """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """ subscribe to the channel events, from the event loop """
+        subscription = Subscription(self, channel)
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """ remove the subscription """
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscribers.pop(subscription.channel, None)
+
+    def dispatch(self, channel, event):
+        """ deliver the event to the channel subscribers of this process """
+        with self.lock:
+            subscriptions = list(self.subscribers.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def publish(self, channel, event):
+        """ publish the event to the channel subscribers """
+        self.dispatch(channel, event)
+
+
+class DatabaseBroker(LocalBroker):
+    """ pub/sub shared by the processes through the events table, every process with
+        subscribers polls the new events and dispatches them to its subscribers, the events
+        ids are not committed in order (concurrent transactions): each poll reads again the
+        ids of the last `lookback` seconds and dispatches the ones not seen yet """
+
+    def __init__(self, poll_interval, lookback=10):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.lookback = lookback
+        self.poller = None
+
+    def publish(self, channel, event):
+        """ store the event for the polling processes """
+        Event.objects.create(channel=channel, payload=event)
+
+    def subscribe(self, channel):
+        """ subscribe to the channel events, the process poller is started by the first subscription """
+        subscription = super().subscribe(channel)
+        if self.poller is None or self.poller.done():
+            self.poller = asyncio.get_running_loop().create_task(self.poll())
+        return subscription
+
+    async def poll(self):
+        """ dispatch the new events while the process has subscribers """
+        last, seen = await sync_to_async(self.position)()
+        while self.subscribers:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                events = await sync_to_async(self.events_after)(last, seen)
+            except Exception:
+                logger.exception('events polling failed')
+                continue
+            for event_id, channel, payload, created_at in events:
+                self.dispatch(channel, payload)
+                seen[event_id] = created_at
+                last = max(last, event_id)
+            cutoff = self.window_start()
+            seen = {event_id: created_at for event_id, created_at in seen.items() if created_at >= cutoff}
+
+    def window_start(self):
+        """ creation time from which the committed events ids are read again """
+        return timezone.now() - timedelta(seconds=self.lookback)
+
+    def position(self):
+        """ id of the newest stored event and creation times of the look-back window events,
+            the events stored before the subscription are not dispatched """
+        last = Event.objects.aggregate(last=Max('id'))['last'] or 0
+        return last, dict(Event.objects.filter(created_at__gte=self.window_start()).values_list('id', 'created_at'))
+
+    def events_after(self, last, seen):
+        """ (id, channel, payload, created_at) of the events stored after the id and of the
+            look-back window events not seen (committed after a newer id) """
+        late = set(
+            Event.objects.filter(id__lte=last, created_at__gte=self.window_start()).values_list('id', flat=True)
+        ) - seen.keys()
+        events = Event.objects.filter(Q(id__gt=last) | Q(id__in=late)).order_by('id')
+        return list(events.values_list('id', 'channel', 'payload', 'created_at')[:1000 + len(late)])
+
+
+def build_broker():
+    """ build the events broker from the EVENTS_BROKER setting """
+    options = getattr(settings, 'EVENTS_BROKER', {})
+    if options.get('BACKEND', 'database') == 'database':
+        return DatabaseBroker(options.get('POLL_INTERVAL', 1.0), options.get('LOOKBACK', 10))
+    return LocalBroker()
+
+
+broker = build_broker()
+
+
+def schedule_events_pruning(run_at=None):
+    """ queue the events pruning job (now by default) unless one is queued already """
+    if not Job.objects.filter(name='prune_events', status=Job.QUEUED).exists():
+        enqueue_at('prune_events', run_at or timezone.now())
+
+
+@job('prune_events')
+def prune_events():
+    """ delete the events stored for longer than the retention (the pollers only read the
+        last seconds), queued again every PRUNE_INTERVAL seconds by each run """
+    options = getattr(settings, 'EVENTS_BROKER', {})
+    now = timezone.now()
+    deleted, _ = Event.objects.filter(created_at__lt=now - timedelta(seconds=options.get('RETENTION', 3600))).delete()
+    schedule_events_pruning(now + timedelta(seconds=options.get('PRUNE_INTERVAL', 600)))
+    return {'deleted': deleted}
+
+
+def publish(channel, event):
+    """ publish the event once the current transaction is committed, the events are
+        notifications, the clients get the changed rows from the delta sync """
+    transaction.on_commit(lambda: broker.publish(channel, event))
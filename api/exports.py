@@ -0,0 +1,49 @@
+import csv
+import json
+from django.http import StreamingHttpResponse
+
+# rows fetched per database round trip, the rows are never all in memory
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """ csv writer pseudo buffer returning the written line """
+
+    def write(self, value):
+        return value
+
+
+def to_text(value):
+    """ export value representation, datetimes as the api json output """
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+    return value
+
+
+def iter_csv(columns, rows):
+    """ yield the csv header then the rows lines """
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([to_text(value) for value in row])
+
+
+def iter_ndjson(columns, rows):
+    """ yield one json object line per row """
+    for row in rows:
+        yield json.dumps(dict(zip(columns, (to_text(value) for value in row)))) + '\n'
+
+
+def stream_export(queryset, fields, columns, output, filename):
+    """ stream the queryset fields values in csv or ndjson through a server side cursor """
+    rows = queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    if output == 'ndjson':
+        response = StreamingHttpResponse(iter_ndjson(columns, rows), content_type='application/x-ndjson')
+        filename = f'{filename}.ndjson'
+    else:
+        response = StreamingHttpResponse(iter_csv(columns, rows), content_type='text/csv')
+        filename = f'{filename}.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,44 @@
+from rest_framework import serializers
+
+# tasks lists allowed orderings (id as tie breaker), the first one is the default
+TASK_ORDERINGS = (
+    ('id',),
+    ('-id',),
+    ('deadline', 'id'),
+    ('-deadline', '-id'),
+)
+
+
+class TaskFilterSerializer(serializers.Serializer):
+    """ tasks list filters query parameters serializer """
+    employee = serializers.IntegerField(required=False)
+    deadline_after = serializers.DateTimeField(required=False)
+    deadline_before = serializers.DateTimeField(required=False)
+    title = serializers.CharField(required=False)
+    ordering = serializers.ChoiceField(choices=[ordering[0] for ordering in TASK_ORDERINGS], required=False)
+
+
+def filter_tasks(queryset, query_params):
+    """ apply the tasks filters query parameters to the queryset,
+        raise a ValidationError for an invalid parameter """
+    serializer = TaskFilterSerializer(data=query_params)
+    serializer.is_valid(raise_exception=True)
+    filters = serializer.validated_data
+    if 'employee' in filters:
+        queryset = queryset.filter(employee_id=filters['employee'])
+    if 'deadline_after' in filters:
+        queryset = queryset.filter(deadline__gte=filters['deadline_after'])
+    if 'deadline_before' in filters:
+        queryset = queryset.filter(deadline__lt=filters['deadline_before'])
+    if 'title' in filters:
+        queryset = queryset.filter(title__startswith=filters['title'])
+    return queryset
+
+
+def order_tasks(queryset, query_params):
+    """ order the queryset by the `ordering` query parameter """
+    requested = query_params.get('ordering')
+    for ordering in TASK_ORDERINGS:
+        if ordering[0] == requested:
+            return queryset.order_by(*ordering)
+    return queryset.order_by(*TASK_ORDERINGS[0])
@@ -0,0 +1,245 @@
+import asyncio
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+from .metrics import observe_request
+
+INSTRUMENTATION = {
+    'ENABLED': True,
+    # Server-Timing header of the staff users responses, of every response with DEBUG and
+    # of the requests with the profile header (and key)
+    'SERVER_TIMING': True,
+    # profiled share of the requests
+    'PROFILE_SAMPLE_RATE': 0.0,
+    # header profiling a request, when set to PROFILE_KEY (any value with DEBUG)
+    'PROFILE_HEADER': 'X-Profile',
+    'PROFILE_KEY': None,
+    # directory of the profiles .prof dumps, kept in memory only when None
+    'PROFILE_DIR': None,
+    # recent requests and profiles kept per process
+    'RECENT': 100,
+    'PROFILES': 20,
+}
+
+# metrics of the request being served (copied into the threads serving it)
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def instrumentation_settings():
+    """ INSTRUMENTATION setting over the defaults """
+    return {**INSTRUMENTATION, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class RequestMetrics:
+    """ sql queries count and time and phases (auth, serializer, render, storage) times of a request """
+    __slots__ = ('queries', 'query_time', 'phases')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.phases = defaultdict(float)
+
+
+def record_query(execute, sql, params, many, context):
+    """ database execute wrapper timing the queries of the instrumented requests """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.query_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """ time the queries of every database connection (each thread has its own), first in the
+        wrappers: the execute_wrapper() blocks (query budgets) opening the connection pop the last one """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def timed(phase):
+    """ add the block duration to a phase of the instrumented request """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[phase] += time.perf_counter() - started
+
+
+class ViewStats:
+    """ per view requests totals, recent requests and profiles of the process """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """ forget the recorded requests """
+        options = instrumentation_settings()
+        self.views = defaultdict(lambda: defaultdict(float))
+        self.recent = deque(maxlen=options['RECENT'])
+        self.profiles = deque(maxlen=options['PROFILES'])
+
+    def record(self, record, profile=None):
+        """ record a request (and its profile) """
+        with self.lock:
+            totals = self.views[record['view']]
+            totals['requests'] += 1
+            totals['wall_ms'] += record['wall_ms']
+            totals['max_wall_ms'] = max(totals['max_wall_ms'], record['wall_ms'])
+            totals['db_queries'] += record['db_queries']
+            totals['db_ms'] += record['db_ms']
+            for phase, duration in record['phases'].items():
+                totals[f'{phase}_ms'] += duration
+            totals['response_bytes'] += record['response_bytes'] or 0
+            self.recent.append(record)
+            if profile is not None:
+                self.profiles.append({**record, 'profile': profile})
+
+    def summary(self):
+        """ per view averages, recent requests and profiles """
+        with self.lock:
+            views = {}
+            for view, totals in sorted(self.views.items()):
+                count = totals['requests']
+                views[view] = {'requests': int(count), 'max_wall_ms': round(totals['max_wall_ms'], 2)}
+                for name, total in totals.items():
+                    if name not in ('requests', 'max_wall_ms'):
+                        views[view][f'avg_{name}'] = round(total / count, 2)
+            return {'views': views, 'recent': list(self.recent), 'profiles': list(self.profiles)}
+
+
+view_stats = ViewStats()
+
+
+def view_names(request):
+    """ (view class or function name, url name) of the served request """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', None
+    view = getattr(match.func, 'view_class', match.func)
+    return getattr(view, '__name__', repr(view)), match.view_name
+
+
+def profile_requested(request, options):
+    """ whether the request has the profile header, with the profile key (any value with DEBUG) """
+    value = request.headers.get(options['PROFILE_HEADER'])
+    return value is not None and (settings.DEBUG or bool(options['PROFILE_KEY'] and value == options['PROFILE_KEY']))
+
+
+def should_profile(request, options):
+    """ profile the sampled requests and the requests with the profile header (and key) """
+    return profile_requested(request, options) or random.random() < options['PROFILE_SAMPLE_RATE']
+
+
+def shows_server_timing(request, options):
+    """ the Server-Timing header tells the queries count and the phases times (the
+        cache hits, the rows counts): only for the staff users, DEBUG and the profile header """
+    if not options['SERVER_TIMING']:
+        return False
+    if settings.DEBUG or profile_requested(request, options):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+def profile_report(profiler, record, options):
+    """ cumulative time top functions of a profile, dumped to PROFILE_DIR when set """
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(30)
+    report = {'top': output.getvalue()}
+    if options['PROFILE_DIR']:
+        os.makedirs(options['PROFILE_DIR'], exist_ok=True)
+        name = f'{timezone.now():%Y%m%dT%H%M%S%f}-{record["view"]}-{os.getpid()}.prof'
+        report['file'] = os.path.join(options['PROFILE_DIR'], name)
+        profiler.dump_stats(report['file'])
+    return report
+
+
+def server_timing(record):
+    """ Server-Timing header of a request record """
+    timings = [f'total;dur={record["wall_ms"]}', f'db;dur={record["db_ms"]};desc="{record["db_queries"]} queries"']
+    timings += [f'{phase};dur={duration}' for phase, duration in record['phases'].items()]
+    return ', '.join(timings)
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    """ per request wall time, sql queries count and time, auth, serializer, render and storage
+        times and response size, recorded per view (and per url name in the metrics store) and
+        answered as the Server-Timing header (staff users, DEBUG or profile header),
+        the sampled requests (and asked with the profile header) are profiled with cProfile
+        (the request thread, the async views threads are not profiled) """
+
+    def __call__(self, request):
+        """ instrument a sync request """
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        options = instrumentation_settings()
+        if not options['ENABLED']:
+            return self.get_response(request)
+        profiler = cProfile.Profile() if should_profile(request, options) else None
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = profiler.runcall(self.get_response, request) if profiler else self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started, profiler, options)
+
+    async def __acall__(self, request):
+        """ instrument an async request """
+        options = instrumentation_settings()
+        if not options['ENABLED']:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started, None, options)
+
+    def finish(self, request, response, metrics, wall, profiler, options):
+        """ record the request and add its Server-Timing header """
+        view, url_name = view_names(request)
+        record = {
+            'view': view,
+            'url_name': url_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'at': timezone.now().isoformat(),
+            'wall_ms': round(wall * 1000, 2),
+            'db_queries': metrics.queries,
+            'db_ms': round(metrics.query_time * 1000, 2),
+            'phases': {phase: round(duration * 1000, 2) for phase, duration in metrics.phases.items()},
+            'response_bytes': None if response.streaming else len(response.content),
+        }
+        view_stats.record(record, profile_report(profiler, record, options) if profiler else None)
+        observe_request(record)
+        if shows_server_timing(request, options):
+            response['Server-Timing'] = server_timing(record)
+        return response
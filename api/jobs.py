@@ -0,0 +1,129 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# registered jobs functions by name
+JOBS = {}
+
+# id of the job running in the thread, for the progress reports
+_current = threading.local()
+
+
+def job(name, max_attempts=3):
+    """ register a function as a background job, called with the job payload
+        keyword arguments, its return value (json) is the job result """
+    def decorator(function):
+        JOBS[name] = (function, max_attempts)
+        return function
+    return decorator
+
+
+def enqueue(job_name, /, **payload):
+    """ queue a registered job, return the Job """
+    return enqueue_at(job_name, timezone.now(), **payload)
+
+
+def enqueue_at(job_name, run_at, /, **payload):
+    """ queue a registered job to run at `run_at`, return the Job """
+    if job_name not in JOBS:
+        raise KeyError(f'unknown job {job_name}')
+    return Job.objects.create(name=job_name, payload=payload, max_attempts=JOBS[job_name][1], run_at=run_at)
+
+
+def claim_jobs(limit, worker):
+    """ claim up to `limit` queued jobs due now for the worker, return their ids,
+        a job is claimed by a conditional update so concurrent workers never share one """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at').values_list('id', flat=True)
+    claimed = []
+    for job_id in candidates[:limit * 2]:
+        if Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, started_at=now, attempts=F('attempts') + 1
+        ):
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def report_progress(**progress):
+    """ record the progress of the job running in the thread, ignored outside of a job """
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is not None:
+        Job.objects.filter(id=job_id).update(progress=progress)
+
+
+def retry_delay(attempts):
+    """ exponential retry backoff """
+    return timedelta(seconds=min(2 ** attempts, 300))
+
+
+def run_job(job_id):
+    """ run a claimed job and record its result, or queue it again until its last attempt """
+    instance = Job.objects.get(id=job_id)
+    function = JOBS.get(instance.name, (None, 0))[0]
+    _current.job_id = job_id
+    try:
+        if function is None:
+            raise KeyError(f'unknown job {instance.name}')
+        result = function(**instance.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('job %s failed (attempt %s/%s)', instance, instance.attempts, instance.max_attempts)
+        if instance.attempts < instance.max_attempts:
+            Job.objects.filter(id=job_id).update(
+                status=Job.QUEUED, error=error, run_at=timezone.now() + retry_delay(instance.attempts)
+            )
+        else:
+            Job.objects.filter(id=job_id).update(status=Job.FAILED, error=error, finished_at=timezone.now())
+        return False
+    finally:
+        _current.job_id = None
+    Job.objects.filter(id=job_id).update(status=Job.DONE, result=result, finished_at=timezone.now())
+    return True
+
+
+def run_pending_jobs(limit=100, worker='inline'):
+    """ claim and run the due jobs in the current thread, return the ran jobs count """
+    job_ids = claim_jobs(limit, worker)
+    for job_id in job_ids:
+        run_job(job_id)
+    return len(job_ids)
+
+
+def requeue_stale_jobs(timeout):
+    """ queue again the jobs running for longer than `timeout` (crashed worker), the lost run
+        counts as an attempt (counted when claimed): the jobs at their last attempt are failed,
+        a job crashing its workers is not run forever, return the queued and failed counts """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, started_at__lt=now - timeout)
+    error = f'lost, still running after {timeout}'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Job.FAILED, error=error, finished_at=now)
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(status=Job.QUEUED, error=error, run_at=now)
+    return requeued, failed
+
+
+def job_metrics(window=timedelta(hours=1)):
+    """ queue depth per status, oldest queued job age, wait and run durations of
+        the jobs finished in the window """
+    now = timezone.now()
+    depth = dict(Job.objects.values_list('status').annotate(count=Count('id')).order_by())
+    oldest = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+    durations = Job.objects.filter(finished_at__gte=now - window).aggregate(
+        wait=Avg(ExpressionWrapper(F('started_at') - F('created_at'), output_field=DurationField())),
+        run=Avg(ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())),
+        count=Count('id'),
+    )
+    return {
+        'depth': {status: depth.get(status, 0) for status, _ in Job.STATUSES},
+        'oldest_queued_age': (now - oldest).total_seconds() if oldest else 0,
+        'finished_last_hour': durations['count'],
+        'average_wait': durations['wait'].total_seconds() if durations['wait'] else None,
+        'average_run': durations['run'].total_seconds() if durations['run'] else None,
+    }
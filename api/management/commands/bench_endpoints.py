@@ -0,0 +1,104 @@
+import asyncio
+import json
+import platform
+import subprocess
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from api import urls
+from api.benchmarks import EndpointScenarios, run_load, load_summary
+from api.models import User, Task
+
+
+class Command(BaseCommand):
+    """ api end points load benchmark, on the rows generated by seed_bench """
+    help = 'Load every api url in turn and report its throughput and latency percentiles as json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='base url of the running server')
+        parser.add_argument('--prefix', default='bench', help='seed_bench usernames prefix')
+        parser.add_argument('--connections', type=int, default=10, help='concurrent keep alive connections')
+        parser.add_argument('--duration', type=float, default=10.0, help='seconds of measure per url')
+        parser.add_argument('--timeout', type=float, default=30.0, help='request timeout in seconds')
+        parser.add_argument('--only', nargs='+', default=[], help='urls names to measure, all by default')
+        parser.add_argument('--output', help='json results file, printed when not given')
+        parser.add_argument('--compare', help='json results file of a previous run to compare with')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('only http urls are supported')
+        try:
+            scenarios = EndpointScenarios(url.netloc, options['prefix'])
+        except LookupError as error:
+            raise CommandError(str(error))
+        names = [pattern.name for pattern in urls.urlpatterns]
+        unknown = set(options['only']) - set(names)
+        if unknown:
+            raise CommandError(f'unknown urls {", ".join(sorted(unknown))}')
+        results = {
+            'run': {
+                'started_at': timezone.now().isoformat(),
+                'commit': self.commit(),
+                'url': options['url'],
+                'connections': options['connections'],
+                'duration': options['duration'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'employees': User.objects.filter(profil__isnull=False).count(),
+                'tasks': Task.objects.count(),
+            },
+            'endpoints': {},
+        }
+        # the scenarios order, the urls without scenario are reported as skipped
+        for name in [*scenarios.scenarios, *(name for name in names if name not in scenarios.scenarios)]:
+            if options['only'] and name not in options['only']:
+                continue
+            if name not in scenarios.scenarios:
+                results['endpoints'][name] = {'skipped': 'no scenario'}
+                continue
+            load = asyncio.run(run_load(
+                url.hostname, url.port or 80, scenarios.next_request(name),
+                options['connections'], options['duration'], options['timeout']
+            ))
+            results['endpoints'][name] = load_summary(load)
+            self.stderr.write(self.line(name, results['endpoints'][name]))
+        content = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+        else:
+            self.stdout.write(content)
+        if options['compare']:
+            with open(options['compare']) as previous:
+                self.compare(json.load(previous), results)
+
+    def commit(self):
+        """ current git commit, None outside of a checkout """
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def line(self, name, summary):
+        """ human readable summary line """
+        return (
+            f'{name:<20}{summary["requests_per_second"]:>10.1f} req/s  p50 {summary["p50_ms"]}ms'
+            f'  p95 {summary["p95_ms"]}ms  p99 {summary["p99_ms"]}ms  statuses {summary["statuses"]}'
+        )
+
+    def compare(self, previous, results):
+        """ throughput and p99 changes from a previous run """
+        self.stderr.write(f'compared with {previous["run"].get("commit")} ({previous["run"]["started_at"]})')
+        for name, summary in results['endpoints'].items():
+            before = previous['endpoints'].get(name, {})
+            if 'requests_per_second' not in summary or not before.get('requests_per_second'):
+                continue
+            throughput = (summary['requests_per_second'] / before['requests_per_second'] - 1) * 100
+            p99 = f'{before["p99_ms"]}ms -> {summary["p99_ms"]}ms'
+            self.stderr.write(f'{name:<20}{throughput:>+8.1f}% req/s  p99 {p99}')
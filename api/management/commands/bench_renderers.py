@@ -0,0 +1,64 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.compression import brotli, compress, compression_settings
+from api.renderers import FastJSONRenderer
+from api.values import TaskValuesSerializer
+
+
+def best_time(function, repeat):
+    """ best time of the function calls, and its result """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+class Command(BaseCommand):
+    """ json renderers and compression benchmark """
+    help = 'Measure the tasks list json encoding time and the compressed sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000], help='tasks counts')
+        parser.add_argument('--repeat', type=int, default=3, help='measures per case, the best one is kept')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        encodings = ('gzip', 'br') if brotli is not None else ('gzip',)
+        compression = compression_settings()
+        self.stdout.write(f'gzip level {compression["GZIP_LEVEL"]}, brotli quality {compression["BROTLI_QUALITY"]}')
+        self.stdout.write(
+            f'{"rows":>8}{"json":>10}{"orjson":>10}{"size":>12}'
+            + ''.join(f'{encoding + " size":>14}{encoding + " time":>12}' for encoding in encodings)
+        )
+        for count in sorted(options['rows']):
+            data = {'next': None, 'previous': None, 'results': self.tasks(count)}
+            json_time, content = best_time(lambda: JSONRenderer().render(data), repeat)
+            orjson_time, fast_content = best_time(lambda: FastJSONRenderer().render(data), repeat)
+            if fast_content != content:
+                raise CommandError('the renderers outputs differ')
+            line = f'{count:>8}{json_time * 1000:>8.1f}ms{orjson_time * 1000:>8.1f}ms{len(content):>12}'
+            for encoding in encodings:
+                compress_time, compressed = best_time(lambda: compress(content, encoding, compression), repeat)
+                line += f'{len(compressed):>14}{compress_time * 1000:>10.1f}ms'
+            self.stdout.write(line)
+
+    def tasks(self, count):
+        """ tasks list results of `count` tasks """
+        now = timezone.now()
+        rows = (
+            {
+                'id': index,
+                'title': f'task {index}',
+                'description': f'description of the task {index}, to finish before its deadline',
+                'deadline': now + timedelta(minutes=index),
+                'employee__username': f'employee {index % 1000}',
+                'version': 1 + index % 3,
+            }
+            for index in range(count)
+        )
+        return TaskValuesSerializer(rows).data
@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from api.models import Profil, Task
+from api.serializers import UserSerializer, TaskSerializer
+from api.values import VALUES_SERIALIZERS
+
+
+class Rollback(Exception):
+    """ benchmark rows transaction rollback """
+
+
+class Command(BaseCommand):
+    """ model serializers and values() serializers list benchmark """
+    help = 'Measure the employees and tasks lists serialization with the model and the values() serializers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000], help='rows counts')
+        parser.add_argument('--repeat', type=int, default=3, help='measures per case, the best one is kept')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.measure(sorted(options['rows']), options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def measure(self, counts, repeat):
+        """ grow the benchmark rows to each count then measure the lists """
+        self.stdout.write(f'{"list":<10}{"rows":>8}{"serializer":>12}{"values()":>12}{"speedup":>9}')
+        created = 0
+        for count in counts:
+            self.create_rows(created, count)
+            created = count
+            employees = User.objects.filter(profil__isnull=False, username__startswith='bench ').order_by('id')
+            tasks = Task.objects.filter(employee__username__startswith='bench ').order_by('id')
+            for name, serializer_class, queryset in (('employees', UserSerializer, employees), ('tasks', TaskSerializer, tasks)):
+                model_time, model_content = self.best(serializer_class, queryset, repeat)
+                values_time, values_content = self.best(VALUES_SERIALIZERS[serializer_class], queryset, repeat)
+                if values_content != model_content:
+                    raise CommandError(f'{name} values() serializer output differs')
+                self.stdout.write(
+                    f'{name:<10}{count:>8}{model_time * 1000:>10.0f}ms{values_time * 1000:>10.0f}ms'
+                    f'{model_time / values_time:>8.1f}x'
+                )
+
+    def best(self, serializer_class, queryset, repeat):
+        """ best time of reading and serializing the rows, and the rendered content """
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serializer_class(serializer_class.sparse_queryset(queryset, None), many=True).data
+            times.append(time.perf_counter() - started)
+        return min(times), JSONRenderer().render(data)
+
+    def create_rows(self, start, count):
+        """ bulk insert the employees (profil, token) and tasks from `start` to `count` """
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(username=f'bench {index}', email=f'bench{index}@example.com', password='!', date_joined=now)
+            for index in range(start, count)
+        )
+        if users and users[0].pk is None:
+            users = list(User.objects.filter(username__startswith='bench ').order_by('id')[start:count])
+        Profil.objects.bulk_create(
+            Profil(user=user, salary=300 + index % 500, picture=f'pictures/00/{index:064d}.jpg' if index % 2 else '')
+            for index, user in enumerate(users, start)
+        )
+        Token.objects.bulk_create(Token(user=user, key=f'{index:040d}') for index, user in enumerate(users, start))
+        Task.objects.bulk_create(
+            Task(employee=user, title=f'task {index}', description='description ' * 10, deadline=now + timedelta(minutes=index))
+            for index, user in enumerate(users, start)
+        )
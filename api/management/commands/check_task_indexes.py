@@ -0,0 +1,54 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from api.models import Task
+
+
+class Command(BaseCommand):
+    """ check the tasks filters query plans use the tasks indexes """
+    help = 'Explain the tasks filters queries and check they use the task indexes'
+
+    def get_queries(self):
+        """ (description, queryset, expected index) of the tasks filters """
+        now = timezone.now()
+        week = now + timedelta(days=7)
+        return [
+            (
+                'employee tasks in a deadline range',
+                Task.objects.filter(employee_id=1, deadline__gte=now, deadline__lt=week),
+                'api_task_employee_deadline',
+            ),
+            (
+                'employee tasks ordered by deadline',
+                Task.objects.filter(employee_id=1).order_by('deadline', 'id'),
+                'api_task_employee_deadline',
+            ),
+            (
+                'tasks in a deadline range',
+                Task.objects.filter(deadline__gte=now, deadline__lt=week),
+                'api_task_deadline',
+            ),
+            (
+                'tasks page after a deadline cursor',
+                Task.objects.filter(deadline__gt=now).order_by('deadline', 'id')[:101],
+                'api_task_deadline',
+            ),
+        ]
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # small tables are sequentially scanned, check the indexes are usable
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for description, queryset, index in self.get_queries():
+                plan = queryset.explain()
+                used = index in plan
+                self.stdout.write(f'{"ok" if used else "MISSING"} {description} ({index})')
+                self.stdout.write(f'    {plan}'.replace('\n', '\n    '))
+                if not used:
+                    failures.append(description)
+        if failures:
+            raise CommandError(f'task indexes not used for: {", ".join(failures)}')
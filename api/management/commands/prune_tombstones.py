@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    """ delete the old delta sync tombstones """
+    help = 'Delete the delta sync tombstones older than the retention, older sync tokens need a full sync'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'SYNC_TOMBSTONES_RETENTION_DAYS', 30),
+            help='tombstones retention in days'
+        )
+
+    def handle(self, *args, **options):
+        count = prune_tombstones(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(f'{count} tombstones deleted')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.payroll import payroll_summary, live_payroll_summary, rebuild_payroll_summary
+
+
+class Command(BaseCommand):
+    """ rebuild the payroll summary from the profils, or check it against them """
+    help = 'Rebuild the maintained payroll summary from the profils (--check only compares them)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='compare the maintained summary with the live data without rebuilding it'
+        )
+
+    def handle(self, *args, **options):
+        live = live_payroll_summary()
+        if not options['check']:
+            rebuild_payroll_summary()
+            self.stdout.write(f'payroll summary rebuilt: {live["headcount"]} employees, total {live["total"]}')
+            return
+        maintained = payroll_summary()
+        differences = [key for key in live if live[key] != maintained[key]]
+        if differences:
+            for key in differences:
+                self.stdout.write(f'{key}: maintained {maintained[key]}, live {live[key]}')
+            raise CommandError(f'payroll summary differs from the live data: {", ".join(differences)}')
+        self.stdout.write(f'payroll summary matches the live data: {live["headcount"]} employees, total {live["total"]}')
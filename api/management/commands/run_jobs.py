@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def close_connections():
+    """ job cleanup, every pool worker uses its own connection """
+    connections.close_all()
+
+
+def setup_process():
+    """ spawned process worker initializer """
+    django.setup()
+
+
+def run_job_in_worker(job_id):
+    """ pool worker job, the spawned processes import this module before django is set up,
+        the api modules are imported once it is """
+    from api.jobs import run_job
+    try:
+        return run_job(job_id)
+    finally:
+        close_connections()
+
+
+class Command(BaseCommand):
+    """ background jobs worker """
+    help = 'Run the queued background jobs on a pool of threads or processes'
+
+    def add_arguments(self, parser):
+        options = getattr(settings, 'JOBS_WORKER', {})
+        parser.add_argument('--workers', type=int, default=options.get('WORKERS', 4), help='pool size')
+        parser.add_argument(
+            '--pool', choices=('thread', 'process'), default=options.get('POOL', 'thread'),
+            help='run the jobs on threads or processes'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=options.get('POLL_INTERVAL', 1.0),
+            help='seconds between the queue polls when it is empty'
+        )
+        parser.add_argument(
+            '--stale-timeout', type=int, default=options.get('STALE_TIMEOUT', 3600),
+            help='seconds after which a running job is considered lost and queued again'
+        )
+        parser.add_argument(
+            '--stale-check-interval', type=float, default=options.get('STALE_CHECK_INTERVAL', 60),
+            help='seconds between the checks for the lost running jobs'
+        )
+        parser.add_argument('--once', action='store_true', help='exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        from api.events import schedule_events_pruning
+        from api.jobs import claim_jobs
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        workers = options['workers']
+        if options['pool'] == 'process':
+            # spawned rather than forked, the processes must not share the database connection
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=setup_process
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+        self.requeue_stale(options)
+        # periodic job, queued again by each run
+        schedule_events_pruning()
+        self.stdout.write(f'worker {worker} running jobs on {workers} {options["pool"]}s')
+        running = set()
+        checked = time.monotonic()
+        try:
+            while True:
+                # the jobs lost by the other (crashed) workers
+                if time.monotonic() - checked >= options['stale_check_interval']:
+                    checked = time.monotonic()
+                    self.requeue_stale(options)
+                free = workers - len(running)
+                job_ids = claim_jobs(free, worker) if free else []
+                for job_id in job_ids:
+                    running.add(executor.submit(run_job_in_worker, job_id))
+                if running:
+                    timeout = None if len(running) >= workers else options['poll_interval']
+                    _, running = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                    running = set(running)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('stopping, waiting for the running jobs')
+        finally:
+            executor.shutdown(wait=True)
+
+    def requeue_stale(self, options):
+        """ queue again (or fail at their last attempt) the jobs running for longer than the stale timeout """
+        from api.jobs import requeue_stale_jobs
+        requeued, failed = requeue_stale_jobs(timedelta(seconds=options['stale_timeout']))
+        if requeued or failed:
+            self.stdout.write(f'{requeued} stale jobs queued again, {failed} failed at their last attempt')
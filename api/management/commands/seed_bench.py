@@ -0,0 +1,136 @@
+import random
+import secrets
+import time
+from datetime import datetime, time as day_start, timedelta
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from api.models import User, Profil, Task, CollectionVersion
+from api.payroll import rebuild_payroll_summary
+from api.versions import bump_versions, TASKS, PROFILS, USERS
+
+FIRST_NAMES = (
+    'ama', 'kofi', 'yao', 'akossiwa', 'komlan', 'esi', 'lea', 'hugo', 'ines', 'noah',
+    'sara', 'omar', 'lina', 'adam', 'maya', 'ivan', 'nora', 'paul', 'rose', 'theo',
+)
+LAST_NAMES = (
+    'mensah', 'agbeko', 'kodjo', 'dupont', 'martin', 'bernard', 'diallo', 'traore',
+    'garcia', 'silva', 'nguyen', 'kim', 'smith', 'brown', 'muller', 'rossi',
+)
+TASK_VERBS = ('review', 'deploy', 'write', 'fix', 'plan', 'test', 'update', 'prepare', 'audit', 'call')
+TASK_OBJECTS = (
+    'the quarterly report', 'the payroll export', 'the client contract', 'the api docs',
+    'the release notes', 'the onboarding checklist', 'the invoices', 'the backlog',
+    'the security review', 'the budget', 'the supplier list', 'the training plan',
+)
+WORDS = (
+    'before', 'after', 'the', 'team', 'meeting', 'client', 'deadline', 'with', 'check', 'every',
+    'item', 'send', 'summary', 'manager', 'update', 'status', 'files', 'shared', 'folder', 'notes',
+)
+
+
+class Command(BaseCommand):
+    """ benchmark rows generator, employees (user, profil, token), tasks and an admin, the
+        rows are deterministic, the credentials (admin password, tokens) random """
+    help = 'Generate deterministic benchmark employees, profils and tasks with bulk inserts (DEBUG or --force only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=100000, help='employees count')
+        parser.add_argument('--tasks', type=int, default=5000000, help='tasks count, spread over the employees')
+        parser.add_argument('--seed', type=int, default=42, help='random generator seed')
+        parser.add_argument('--prefix', default='bench', help='usernames prefix, the admin is <prefix>_admin')
+        parser.add_argument('--batch-size', type=int, default=5000, help='employees per insert transaction')
+        parser.add_argument(
+            '--base-date', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+            default=timezone.now().date(), help='tasks deadlines center (YYYY-MM-DD), today by default'
+        )
+        parser.add_argument(
+            '--force', action='store_true', help='generate the rows without DEBUG (a staff account is created)'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('seed_bench creates an admin account, run it with DEBUG or --force')
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'{prefix}_ users exist already, use another --prefix')
+        employees, tasks = options['employees'], options['tasks']
+        # the same seed and prefix generate the same rows
+        self.random = random.Random(f'{prefix}:{options["seed"]}')
+        # the employees can not log in, the benchmark uses their tokens
+        self.password = make_password(None)
+        self.base = timezone.make_aware(datetime.combine(options['base_date'], day_start()))
+        started = time.monotonic()
+        admin_password = secrets.token_urlsafe(16)
+        admin = User.objects.create(username=f'{prefix}_admin', password=make_password(admin_password), is_staff=True)
+        Token.objects.create(user=admin)
+        # explicit ids, the inserted rows need no read back
+        self.user_id = User.objects.aggregate(last=Max('id'))['last'] or 0
+        self.profil_id = Profil.objects.aggregate(last=Max('id'))['last'] or 0
+        self.task_id = Task.objects.aggregate(last=Max('id'))['last'] or 0
+        for start in range(0, employees, options['batch_size']):
+            end = min(start + options['batch_size'], employees)
+            # tasks spread evenly, the first employees take the remainder
+            counts = [tasks // employees + (index < tasks % employees) for index in range(start, end)]
+            with transaction.atomic():
+                self.insert_batch(prefix, start, counts)
+            self.stdout.write(f'{end}/{employees} employees, {time.monotonic() - started:.1f}s')
+        self.reset_sequences()
+        rebuild_payroll_summary()
+        bump_versions(USERS, PROFILS, TASKS)
+        duration = time.monotonic() - started
+        self.stdout.write(
+            f'{employees} employees and {tasks} tasks in {duration:.1f}s, '
+            f'admin {prefix}_admin password {admin_password} token {admin.auth_token.key}'
+        )
+
+    def insert_batch(self, prefix, start, counts):
+        """ insert the employees from `start` with their profils, tokens and `counts` tasks """
+        rows = self.random
+        users, profils, tokens, tasks = [], [], [], []
+        profil_stamps = iter(CollectionVersion.objects.reserve_stamps(len(counts)))
+        task_stamps = iter(CollectionVersion.objects.reserve_stamps(sum(counts)))
+        for index, count in enumerate(counts, start):
+            self.user_id += 1
+            first, last = rows.choice(FIRST_NAMES), rows.choice(LAST_NAMES)
+            users.append(User(
+                id=self.user_id, username=f'{prefix}_{index}', password=self.password,
+                first_name=first, last_name=last, email=f'{first}.{last}.{index}@example.com',
+                date_joined=self.base - timedelta(days=rows.randint(0, 3650), seconds=rows.randint(0, 86399)),
+            ))
+            self.profil_id += 1
+            has_picture = rows.random() < 0.8
+            sha = f'{rows.getrandbits(256):064x}'
+            profils.append(Profil(
+                id=self.profil_id, user_id=self.user_id, change_stamp=next(profil_stamps),
+                # log normal salaries, rounded to tens
+                salary=int(rows.lognormvariate(6.5, 0.4)) // 10 * 10,
+                picture=f'pictures/{sha[:2]}/{sha}.jpg' if has_picture else '',
+                picture_processed=has_picture,
+            ))
+            tokens.append(Token(user_id=self.user_id, key=Token.generate_key()))
+            for _ in range(count):
+                self.task_id += 1
+                tasks.append(Task(
+                    id=self.task_id, employee_id=self.user_id, change_stamp=next(task_stamps),
+                    title=f'{rows.choice(TASK_VERBS)} {rows.choice(TASK_OBJECTS)}',
+                    description=' '.join(rows.choices(WORDS, k=rows.randint(8, 40))),
+                    deadline=self.base + timedelta(minutes=rows.randint(-90 * 1440, 90 * 1440)),
+                ))
+        User.objects.bulk_create(users)
+        Profil.objects.bulk_create(profils)
+        Token.objects.bulk_create(tokens)
+        Task.objects.bulk_create(tasks, batch_size=5000)
+
+    def reset_sequences(self):
+        """ move the ids sequences past the explicit ids (postgresql) """
+        statements = connection.ops.sequence_reset_sql(no_style(), [User, Profil, Task])
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
@@ -0,0 +1,285 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+METRICS = {
+    'ENABLED': True,
+    # directory of the per process files summed by the metrics end point (the gunicorn
+    # workers of a host share it), None exposes the metrics of the serving process only
+    'DIRECTORY': None,
+    # seconds between two writes of the process file
+    'FLUSH_INTERVAL': 1.0,
+    # workers serving the requests, without DIRECTORY the end point refuses to answer
+    # for several workers (each answer would be one worker metrics)
+    'WORKERS': 1,
+}
+
+# name: (type, help, label names, histogram buckets)
+FAMILIES = {
+    'http_requests_total': (
+        'counter', 'Requests served per url name, method and status code.', ('url_name', 'method', 'status'), None,
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Requests wall time per url name.', ('url_name',),
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    ),
+    'db_queries_per_request': (
+        'histogram', 'Sql queries per request per url name.', ('url_name',), (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    ),
+    'db_query_duration_seconds': (
+        'histogram', 'Sql queries time per request per url name.', ('url_name',),
+        (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+    ),
+    'cache_requests_total': (
+        'counter', 'Cache lookups per cache, view and result (hit or miss).', ('cache', 'view', 'result'), None,
+    ),
+}
+
+# files of the exited processes, folded into the archive file by the metrics end point
+ARCHIVE = 'archive.json'
+
+
+def metrics_settings():
+    """ METRICS setting over the defaults """
+    return {**METRICS, **getattr(settings, 'METRICS', {})}
+
+
+def partial_metrics():
+    """ whether the metrics of this process only are known while several workers serve """
+    options = metrics_settings()
+    return not options['DIRECTORY'] and options['WORKERS'] > 1
+
+
+def merge(totals, values):
+    """ add the (name, labels, value) values (a number or the histogram counts and sum) to the totals """
+    for name, labels, value in values:
+        key = (name, tuple(labels))
+        if isinstance(value, list):
+            current = totals.setdefault(key, [0] * len(value))
+            for index, number in enumerate(value):
+                current[index] += number
+        else:
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def read_values(path):
+    """ the values of a metrics file, None when it is gone or unreadable """
+    try:
+        with open(path) as values:
+            return json.load(values)
+    except (OSError, ValueError):
+        return None
+
+
+def write_values(path, values):
+    """ replace the metrics file atomically, the readers never see a partial file """
+    temporary = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(values, output)
+    os.replace(temporary, path)
+
+
+def process_alive(pid):
+    """ whether the process (of this host) runs """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsStore:
+    """ process counters and histograms, the request threads update them in memory only, a
+        daemon thread writes them every FLUSH_INTERVAL to the process file of the metrics
+        directory where the metrics end point sums the files of every process """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ forget the values, a forked process starts its own ones (and file) """
+        self.lock = threading.Lock()
+        self.values = {}
+        self.dirty = False
+        self.flusher = None
+        self.path = None
+        self.pid = os.getpid()
+
+    def clear(self):
+        """ forget the values of the process """
+        with self.lock:
+            self.values = {}
+            self.dirty = True
+
+    def inc(self, name, labels, value=1):
+        """ add the value to a counter """
+        key = (name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+            self.dirty = True
+        if self.flusher is None:
+            self.start()
+
+    def observe(self, name, labels, value):
+        """ count the value in its histogram bucket """
+        buckets = FAMILIES[name][3]
+        key = (name, labels)
+        with self.lock:
+            # per bucket counts, the +Inf bucket count and the values sum
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(buckets) + 2)
+            counts[bisect_left(buckets, value)] += 1
+            counts[-1] += value
+            self.dirty = True
+        if self.flusher is None:
+            self.start()
+
+    def snapshot(self):
+        """ (name, labels, value) of every value """
+        with self.lock:
+            return [
+                [name, list(labels), list(value) if isinstance(value, list) else value]
+                for (name, labels), value in self.values.items()
+            ]
+
+    def start(self):
+        """ start the flusher thread of the process """
+        with self.lock:
+            if self.flusher is not None:
+                return
+            self.flusher = threading.Thread(target=self.flush_loop, name='metrics-flusher', daemon=True)
+        self.flusher.start()
+
+    def flush_loop(self):
+        """ write the values every FLUSH_INTERVAL """
+        while True:
+            time.sleep(metrics_settings()['FLUSH_INTERVAL'])
+            self.flush()
+
+    def flush(self):
+        """ write the changed values to the process file """
+        directory = metrics_settings()['DIRECTORY']
+        if not directory or not self.dirty:
+            return
+        with self.lock:
+            self.dirty = False
+            if self.path is None or os.path.dirname(self.path) != directory:
+                self.path = os.path.join(directory, f'{self.pid}-{uuid.uuid4().hex[:8]}.json')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            write_values(self.path, self.snapshot())
+        except OSError:
+            self.dirty = True
+
+    def collect(self):
+        """ the totals of every process, this process live values and the other processes files """
+        totals = merge({}, self.snapshot())
+        directory = metrics_settings()['DIRECTORY']
+        if not directory or not os.path.isdir(directory):
+            return totals
+        exited = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.endswith('.json') or name == ARCHIVE or path == self.path:
+                continue
+            pid = name.split('-', 1)[0]
+            if pid.isdigit() and not process_alive(int(pid)):
+                exited.append(path)
+                continue
+            merge(totals, read_values(path) or ())
+        return merge(totals, self.archive(directory, exited))
+
+    def archive(self, directory, exited):
+        """ fold the exited processes files into the archive file (so the directory does not grow
+            with the recycled workers), return the archive values """
+        path = os.path.join(directory, ARCHIVE)
+        if not exited or fcntl is None:
+            return [value for values_path in (path, *exited) for value in read_values(values_path) or ()]
+        with open(os.path.join(directory, 'archive.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            totals = merge({}, read_values(path) or ())
+            folded = [exited_path for exited_path in exited if os.path.exists(exited_path)]
+            for exited_path in folded:
+                merge(totals, read_values(exited_path) or ())
+            values = [[name, list(labels), value] for (name, labels), value in totals.items()]
+            if folded:
+                write_values(path, values)
+                for exited_path in folded:
+                    os.remove(exited_path)
+            return values
+
+
+store = MetricsStore()
+os.register_at_fork(after_in_child=store.reset)
+atexit.register(store.flush)
+
+
+def observe_request(record):
+    """ count an instrumentation request record (wall time, status, sql queries) per url name """
+    if not metrics_settings()['ENABLED']:
+        return
+    url_name = record['url_name'] or 'unresolved'
+    store.inc('http_requests_total', (url_name, record['method'], str(record['status'])))
+    store.observe('http_request_duration_seconds', (url_name,), record['wall_ms'] / 1000)
+    store.observe('db_queries_per_request', (url_name,), record['db_queries'])
+    store.observe('db_query_duration_seconds', (url_name,), record['db_ms'] / 1000)
+
+
+def count_cache(cache, view, hit):
+    """ count a cache lookup """
+    store.inc('cache_requests_total', (cache, view, 'hit' if hit else 'miss'))
+
+
+def label_value(value):
+    """ escaped label value of the text format """
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def sample(name, names, labels, value, extra=()):
+    """ sample line of the text format """
+    pairs = [f'{label}="{label_value(item)}"' for label, item in (*zip(names, labels), *extra)]
+    number = repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+    return f'{name}{{{",".join(pairs)}}} {number}' if pairs else f'{name} {number}'
+
+
+def exposition(totals):
+    """ prometheus text format (0.0.4) of the totals, with the cache hit ratios gauge """
+    lines = []
+    for family, (kind, text, names, buckets) in FAMILIES.items():
+        lines += [f'# HELP {family} {text}', f'# TYPE {family} {kind}']
+        for (name, labels), value in sorted(totals.items()):
+            if name != family:
+                continue
+            if kind == 'counter':
+                lines.append(sample(name, names, labels, value))
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value):
+                cumulative += count
+                lines.append(sample(f'{name}_bucket', names, labels, cumulative, [('le', bound)]))
+            lines.append(sample(f'{name}_sum', names, labels, value[-1]))
+            lines.append(sample(f'{name}_count', names, labels, cumulative))
+    lookups = {}
+    for (name, labels), value in totals.items():
+        if name == 'cache_requests_total':
+            cache, view, result = labels
+            lookups.setdefault((cache, view), {'hit': 0, 'miss': 0})[result] += value
+    lines += ['# HELP cache_hit_ratio Cache hits share of the lookups per cache and view.', '# TYPE cache_hit_ratio gauge']
+    for labels, results in sorted(lookups.items()):
+        ratio = results['hit'] / (results['hit'] + results['miss'])
+        lines.append(sample('cache_hit_ratio', ('cache', 'view'), labels, round(ratio, 6)))
+    return '\n'.join(lines) + '\n'
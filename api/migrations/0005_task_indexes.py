@@ -0,0 +1,21 @@
+# Generated by Django 3.1.7 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_collectionversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['employee', 'deadline'], name='api_task_employee_deadline'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['deadline'], name='api_task_deadline'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.1.7 on 2026-10-18 07:59
+
+from django.db import migrations, models
+
+
+def build_payroll_summary(apps, schema_editor):
+    """ build the payroll summary of the existing profils """
+    Profil = apps.get_model('api', 'Profil')
+    PayrollSummary = apps.get_model('api', 'PayrollSummary')
+    SalaryBucket = apps.get_model('api', 'SalaryBucket')
+    buckets = Profil.objects.values('salary').annotate(count=models.Count('id')).order_by('salary')
+    SalaryBucket.objects.bulk_create([SalaryBucket(salary=row['salary'], count=row['count']) for row in buckets])
+    PayrollSummary.objects.create(
+        pk=1,
+        headcount=sum(row['count'] for row in buckets),
+        total_salary=sum(row['salary'] * row['count'] for row in buckets)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_task_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('headcount', models.IntegerField(default=0)),
+                ('total_salary', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalaryBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('salary', models.IntegerField(unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_payroll_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_payroll_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profil',
+            name='picture_processed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
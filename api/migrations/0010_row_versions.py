@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_job_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profil',
+            name='version',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='version',
+            field=models.IntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+def stamp_existing_rows(apps, schema_editor):
+    """ give the existing tasks and profils distinct changes stamps """
+    CollectionVersion = apps.get_model('api', 'CollectionVersion')
+    stamp = 0
+    for model_name in ('Task', 'Profil'):
+        model = apps.get_model('api', model_name)
+        rows = list(model.objects.order_by('id').only('id'))
+        for row in rows:
+            stamp += 1
+            row.change_stamp = stamp
+        model.objects.bulk_update(rows, ['change_stamp'], batch_size=1000)
+    CollectionVersion.objects.update_or_create(name='change_stamps', defaults={'version': stamp})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_row_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=50)),
+                ('object_id', models.IntegerField()),
+                ('owner_id', models.IntegerField(null=True)),
+                ('change_stamp', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='profil',
+            name='change_stamp',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='change_stamp',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='profil',
+            index=models.Index(fields=['change_stamp'], name='api_profil_change_stamp'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['employee', 'change_stamp'], name='api_task_employee_stamp'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['change_stamp'], name='api_task_change_stamp'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['change_stamp'], name='api_tombstone_change_stamp'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['owner_id', 'change_stamp'], name='api_tombstone_owner_stamp'),
+        ),
+        migrations.RunPython(stamp_existing_rows, migrations.RunPython.noop),
+    ]
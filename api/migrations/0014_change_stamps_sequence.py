@@ -0,0 +1,46 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def create_sequence(apps, schema_editor):
+    """ on postgresql, move the changes stamps counter to a sequence started after it """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    CollectionVersion = apps.get_model('api', 'CollectionVersion')
+    last = CollectionVersion.objects.filter(name='change_stamps').values_list('version', flat=True).first() or 0
+    schema_editor.execute(f'CREATE SEQUENCE api_change_stamp_seq START WITH {last + 1}')
+
+
+def drop_sequence(apps, schema_editor):
+    """ on postgresql, move the changes stamps sequence back to the counter """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    CollectionVersion = apps.get_model('api', 'CollectionVersion')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT last_value FROM api_change_stamp_seq')
+        last, = cursor.fetchone()
+    CollectionVersion.objects.update_or_create(name='change_stamps', defaults={'version': last})
+    schema_editor.execute('DROP SEQUENCE api_change_stamp_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_event_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profil',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
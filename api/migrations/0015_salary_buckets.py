@@ -0,0 +1,45 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:37
+
+import math
+from django.db import migrations, models
+
+# api.payroll buckets of the 1% salaries error
+GAMMA = 1.01 / 0.99
+
+
+def count_buckets(apps, schema_editor, bucket_of):
+    """ count the profils salaries in the buckets of the salaries """
+    Profil = apps.get_model('api', 'Profil')
+    SalaryBucket = apps.get_model('api', 'SalaryBucket')
+    buckets = {}
+    for row in Profil.objects.values('salary').annotate(count=models.Count('id')):
+        bucket = bucket_of(row['salary'])
+        buckets[bucket] = buckets.get(bucket, 0) + row['count']
+    SalaryBucket.objects.all().delete()
+    SalaryBucket.objects.bulk_create([SalaryBucket(bucket=bucket, count=count) for bucket, count in buckets.items()])
+
+
+def logarithmic_buckets(apps, schema_editor):
+    """ count the salaries in logarithmic buckets """
+    count_buckets(apps, schema_editor, lambda salary: -1 if salary < 1 else math.ceil(math.log(salary, GAMMA)))
+
+
+def salary_buckets(apps, schema_editor):
+    """ count the salaries in one bucket per distinct salary """
+    count_buckets(apps, schema_editor, lambda salary: salary)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_change_stamps_sequence'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='salarybucket',
+            old_name='salary',
+            new_name='bucket',
+        ),
+        migrations.RunPython(logarithmic_buckets, salary_buckets),
+    ]
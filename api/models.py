@@ -1,29 +1,225 @@
-from django.db import models
+from django.db import connections, models, transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 # User model, this model represent the employee and the admins
 User = get_user_model()
 
+# counter (collection version name) of the rows changes stamps
+CHANGE_STAMPS = 'change_stamps'
+# database sequence of the rows changes stamps (postgresql)
+CHANGE_STAMPS_SEQUENCE = 'api_change_stamp_seq'
+
+
+# Change stamped rows, stamped from one counter on every write, for the clients delta sync
+class ChangeStamped(models.Model):
+    """ rows changes stamps abstract model """
+    change_stamp = models.BigIntegerField(default=0)
+    # stamp reservation time, the sync reads again the stamps of the look-back window
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        """ change stamped model Meta class """
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """ stamp the row in the transaction of its write, the stamp and its time
+            are added to the written columns """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if not update_fields:
+                return
+            kwargs['update_fields'] = {*update_fields, 'change_stamp', 'changed_at'}
+        with transaction.atomic(using=kwargs.get('using')):
+            self.change_stamp = CollectionVersion.objects.reserve_stamps(1)[0]
+            self.changed_at = timezone.now()
+            super().save(*args, **kwargs)
+
 
 # Employee task, represent a task that can be assigned to the employee by the admin
-class Task(models.Model):
+class Task(ChangeStamped):
     """ Employee tasks model """
     employee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='employee')
     title = models.CharField(max_length=100)
     description = models.TextField()
     deadline = models.DateTimeField()
+    # row version, incremented on every update, for the optimistic concurrency (If-Match)
+    version = models.IntegerField(default=1)
 
+    class Meta:
+        """ task model Meta class, indexes of the employee and deadline filters """
+        indexes = [
+            models.Index(fields=['employee', 'deadline'], name='api_task_employee_deadline'),
+            models.Index(fields=['deadline'], name='api_task_deadline'),
+            models.Index(fields=['employee', 'change_stamp'], name='api_task_employee_stamp'),
+            models.Index(fields=['change_stamp'], name='api_task_change_stamp'),
+        ]
 
 
 # Profil model represent the additinal information for the employee
-class Profil(models.Model):
+class Profil(ChangeStamped):
     """ Employee Profile, for additional informations for the user """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profil')
     picture = models.ImageField()
+    # resized webp variants of the picture generated
+    picture_processed = models.BooleanField(default=False)
     salary = models.IntegerField()
+    # employee (user and profil) row version, incremented on every update, for the optimistic concurrency (If-Match)
+    version = models.IntegerField(default=1)
+
+    class Meta:
+        """ profil model Meta class, index of the delta sync """
+        indexes = [
+            models.Index(fields=['change_stamp'], name='api_profil_change_stamp'),
+        ]
 
     def __str__(self):
         return f'{self.salary}'
 
 
 
+class CollectionVersionManager(models.Manager):
+    """ collection version model manager """
+
+    def increment(self, name, count=1):
+        """ add `count` to the named counter, return its new value, the counter row
+            stays locked until the end of the calling transaction """
+        with transaction.atomic():
+            if not self.filter(name=name).update(version=F('version') + count):
+                try:
+                    with transaction.atomic():
+                        return self.create(name=name, version=count).version
+                except IntegrityError:
+                    self.filter(name=name).update(version=F('version') + count)
+            return self.filter(name=name).values_list('version', flat=True).get()
+
+    def stamps_sequenced(self):
+        """ whether the changes stamps come from the database sequence (postgresql) """
+        return connections[self.db].vendor == 'postgresql'
+
+    def reserve_stamps(self, count):
+        """ reserve `count` rows changes stamps, return them ascending: from the sequence on
+            postgresql, no lock is held but the stamps are not committed in order (the sync
+            reads again a look-back window), elsewhere from the counter row, locked until the
+            commit (sqlite serializes the write transactions anyway) """
+        if self.stamps_sequenced():
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(%s::regclass) FROM generate_series(1, %s)', [CHANGE_STAMPS_SEQUENCE, count]
+                )
+                return sorted(stamp for stamp, in cursor.fetchall())
+        last = self.increment(CHANGE_STAMPS, count)
+        return range(last - count + 1, last + 1)
+
+
+# Collection version, bumped on every write of the collection (tasks, profils, users),
+# identifies the collection state for the conditional requests
+class CollectionVersion(models.Model):
+    """ collection writes version counter """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CollectionVersionManager()
+
+    def __str__(self):
+        return f'{self.name}({self.version})'
+
+
+# Payroll summary, single row with the employees headcount and salaries total,
+# maintained incrementally on every profil write
+class PayrollSummary(models.Model):
+    """ payroll headcount and salaries total """
+    headcount = models.IntegerField(default=0)
+    total_salary = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.headcount} employees, {self.total_salary}'
+
+
+# Salary bucket, employees count per logarithmic salaries bucket, the salaries histogram for the median and percentiles
+class SalaryBucket(models.Model):
+    """ salaries histogram logarithmic bucket (api.payroll.salary_bucket) """
+    bucket = models.IntegerField(unique=True)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.bucket}: {self.count}'
+
+
+# Background job, queued in the database and run by the `run_jobs` workers
+class Job(models.Model):
+    """ background job """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'queued'),
+        (RUNNING, 'running'),
+        (DONE, 'done'),
+        (FAILED, 'failed'),
+    )
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    # progress reported by the running job (rows done, rows total...)
+    progress = models.JSONField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    run_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        """ job model Meta class, index of the workers queued jobs lookup """
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='api_job_status_run_at'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}#{self.pk}({self.status})'
+
+
+# Tombstone, a deleted (or reassigned away) row, for the clients delta sync
+class Tombstone(models.Model):
+    """ deleted row tombstone """
+    collection = models.CharField(max_length=50)
+    object_id = models.IntegerField()
+    # employee the row belonged to, for the employees own changes
+    owner_id = models.IntegerField(null=True)
+    change_stamp = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """ tombstone model Meta class, indexes of the delta sync """
+        indexes = [
+            models.Index(fields=['change_stamp'], name='api_tombstone_change_stamp'),
+            models.Index(fields=['owner_id', 'change_stamp'], name='api_tombstone_owner_stamp'),
+        ]
+
+    def __str__(self):
+        return f'{self.collection}#{self.object_id}({self.change_stamp})'
+
+
+# Event, published through the database by the `database` events broker to the other processes
+class Event(models.Model):
+    """ published event """
+    channel = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """ event model Meta class, index of the pollers look-back window and the pruning """
+        indexes = [
+            models.Index(fields=['created_at'], name='api_event_created_at'),
+        ]
+
+    def __str__(self):
+        return f'{self.channel}#{self.pk}'
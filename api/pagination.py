@@ -0,0 +1,71 @@
+import json
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connections
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from .filters import TASK_ORDERINGS
+
+
+class KeysetPagination(CursorPagination):
+    """ keyset (cursor) pagination, every page costs the same whatever its depth """
+    page_size = getattr(settings, 'API_PAGE_SIZE', 100)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+    ordering_query_param = 'ordering'
+    total_query_param = 'total'
+    # allowed orderings, the first one is the default ordering
+    ordering_fields = (('id',),)
+
+    def get_ordering(self, request, queryset, view):
+        """ return the requested ordering if allowed, the default one otherwise """
+        requested = request.query_params.get(self.ordering_query_param)
+        for ordering in self.ordering_fields:
+            if ordering[0] == requested:
+                return ordering
+        return self.ordering_fields[0]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """ paginate the queryset and estimate the total count if asked """
+        self.approximate_total = None
+        if request.query_params.get(self.total_query_param) in ('1', 'true'):
+            self.approximate_total = approximate_count(queryset)
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        """ paginated response with the next, previous cursors links """
+        content = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.approximate_total is not None:
+            content['approximate_total'] = self.approximate_total
+        content['results'] = data
+        return Response(content)
+
+
+class EmployeeCursorPagination(KeysetPagination):
+    """ employees list pagination """
+    ordering_fields = (
+        ('id',),
+        ('-id',),
+    )
+
+
+class TaskCursorPagination(KeysetPagination):
+    """ tasks list pagination, by id or deadline (id as tie breaker) """
+    ordering_fields = TASK_ORDERINGS
+
+
+def approximate_count(queryset):
+    """ return the planner rows estimate on postgresql, the exact count elsewhere """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
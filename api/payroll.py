@@ -0,0 +1,138 @@
+import math
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from .models import Profil, PayrollSummary, SalaryBucket
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+# relative error of the median, percentiles, min and max salaries: the salaries are counted
+# in logarithmic buckets, about 800 buckets between 1 and 10 000 000 whatever the headcount
+SALARY_ERROR = 0.01
+GAMMA = (1 + SALARY_ERROR) / (1 - SALARY_ERROR)
+# bucket of the salaries below 1
+ZERO_BUCKET = -1
+
+
+def salary_bucket(salary):
+    """ bucket of the salary, the salaries in (GAMMA ** (bucket - 1), GAMMA ** bucket] """
+    if salary < 1:
+        return ZERO_BUCKET
+    return math.ceil(math.log(salary, GAMMA))
+
+
+def bucket_salary(bucket):
+    """ salary counted for the bucket, within SALARY_ERROR of its salaries (and 0.5 of rounding) """
+    if bucket == ZERO_BUCKET:
+        return 0
+    return round(2 * GAMMA ** bucket / (GAMMA + 1))
+
+
+def salary_buckets(salary_counts):
+    """ Counter {bucket: employees count} of the (salary, employees count) pairs """
+    buckets = Counter()
+    for salary, count in salary_counts:
+        buckets[salary_bucket(salary)] += count
+    return buckets
+
+
+def bucket_salaries(buckets):
+    """ (salary, count) ascending of the (bucket, count) ascending buckets """
+    return [(bucket_salary(bucket), count) for bucket, count in buckets if count > 0]
+
+
+def apply_salary_changes(changes):
+    """ apply a Counter {salary: employees count change} to the payroll summary,
+        with relative updates so concurrent writers do not lose changes """
+    changes = {salary: count for salary, count in changes.items() if count}
+    if not changes:
+        return
+    headcount = sum(changes.values())
+    total = sum(salary * count for salary, count in changes.items())
+    buckets = {bucket: count for bucket, count in salary_buckets(changes.items()).items() if count}
+    with transaction.atomic():
+        if not PayrollSummary.objects.filter(pk=1).update(
+            headcount=F('headcount') + headcount,
+            total_salary=F('total_salary') + total
+        ):
+            PayrollSummary.objects.create(pk=1, headcount=headcount, total_salary=total)
+        for bucket, count in buckets.items():
+            if SalaryBucket.objects.filter(bucket=bucket).update(count=F('count') + count):
+                continue
+            try:
+                with transaction.atomic():
+                    SalaryBucket.objects.create(bucket=bucket, count=count)
+            except IntegrityError:
+                SalaryBucket.objects.filter(bucket=bucket).update(count=F('count') + count)
+        SalaryBucket.objects.filter(bucket__in=list(buckets), count__lte=0).delete()
+
+
+def value_at_rank(buckets, rank):
+    """ salary of the 1-based rank in the (salary, count) ascending buckets """
+    seen = 0
+    for salary, count in buckets:
+        seen += count
+        if seen >= rank:
+            return salary
+    return None
+
+
+def summarize(headcount, total, buckets):
+    """ payroll summary of the headcount, salaries total and (salary, count) ascending buckets,
+        the headcount, total and mean are exact, the other salaries are the buckets ones """
+    if not headcount:
+        return {
+            'headcount': 0, 'total': 0, 'mean': None, 'median': None,
+            'min': None, 'max': None, 'percentiles': {},
+        }
+    if headcount % 2:
+        median = value_at_rank(buckets, (headcount + 1) // 2)
+    else:
+        median = (value_at_rank(buckets, headcount // 2) + value_at_rank(buckets, headcount // 2 + 1)) / 2
+    return {
+        'headcount': headcount,
+        'total': total,
+        'mean': round(total / headcount, 2),
+        'median': median,
+        'min': buckets[0][0],
+        'max': buckets[-1][0],
+        # nearest rank percentiles
+        'percentiles': {
+            f'p{percentile}': value_at_rank(buckets, max(1, -(-percentile * headcount // 100)))
+            for percentile in PERCENTILES
+        },
+    }
+
+
+def payroll_summary():
+    """ payroll summary from the maintained summary, one row and the salaries buckets,
+        bounded by the salaries range (not by the employees count) """
+    summary = PayrollSummary.objects.filter(pk=1).values_list('headcount', 'total_salary').first()
+    headcount, total = summary or (0, 0)
+    buckets = SalaryBucket.objects.filter(count__gt=0).order_by('bucket').values_list('bucket', 'count')
+    return summarize(headcount, total, bucket_salaries(buckets))
+
+
+def profils_salaries():
+    """ (salary, employees count) of the profils, scanning every row """
+    return Profil.objects.values('salary').annotate(count=Count('id')).values_list('salary', 'count')
+
+
+def live_payroll_summary():
+    """ payroll summary computed from the profils, scanning every row """
+    buckets = sorted(salary_buckets(profils_salaries()).items())
+    totals = Profil.objects.aggregate(headcount=Count('id'), total=Sum('salary'))
+    return summarize(totals['headcount'], totals['total'] or 0, bucket_salaries(buckets))
+
+
+def rebuild_payroll_summary():
+    """ replace the maintained summary with the profils live data """
+    with transaction.atomic():
+        salaries = list(profils_salaries())
+        SalaryBucket.objects.all().delete()
+        SalaryBucket.objects.bulk_create([
+            SalaryBucket(bucket=bucket, count=count) for bucket, count in salary_buckets(salaries).items()
+        ])
+        PayrollSummary.objects.update_or_create(pk=1, defaults={
+            'headcount': sum(count for _, count in salaries),
+            'total_salary': sum(salary * count for salary, count in salaries),
+        })
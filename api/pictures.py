@@ -0,0 +1,174 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .instrumentation import timed
+from .jobs import job, enqueue
+from .models import Profil, CollectionVersion
+from .versions import bump_versions, PROFILS
+
+logger = logging.getLogger(__name__)
+
+# square webp variants sizes, in pixels
+PICTURE_VARIANTS = {
+    'thumbnail': 40,
+    'small': 128,
+    'medium': 512,
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PICTURE_WORKERS', 2),
+    thread_name_prefix='pictures'
+)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """ media files storage of the names derived from the content, a name already taken holds
+        the same content: it is kept (no random suffix) and the file is written to a temporary
+        file then moved in place, the readers never see a partial file and concurrent writers of
+        the same name all succeed """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+
+picture_storage = ContentAddressedStorage()
+
+
+def picture_variants():
+    """ the PICTURE_VARIANTS setting, read per call """
+    return getattr(settings, 'PICTURE_VARIANTS', PICTURE_VARIANTS)
+
+
+def picture_name(upload):
+    """ storage name of the uploaded picture, derived from its content hash """
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    extension = os.path.splitext(upload.name or '')[1].lower() or '.jpg'
+    sha = digest.hexdigest()
+    return f'pictures/{sha[:2]}/{sha}{extension}'
+
+
+def store_picture(upload, name=None):
+    """ store the uploaded picture under its content hash (`name` when already known), an
+        already stored identical picture is reused, return the stored name """
+    with timed('storage'):
+        name = name or picture_name(upload)
+        if not picture_storage.exists(name):
+            upload.seek(0)
+            name = picture_storage.save(name, upload)
+        return name
+
+
+def picture_hash(name):
+    """ return the content hash of a stored picture name, None if not content addressed """
+    if not name or not name.startswith('pictures/'):
+        return None
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def variant_name(name, variant):
+    """ storage name of a picture variant """
+    sha = picture_hash(name)
+    return f'pictures/variants/{sha[:2]}/{sha}/{variant}.webp'
+
+
+@job('generate_picture_variants')
+def generate_variants(name):
+    """ generate the picture webp variants then flag the profils using it as processed """
+    with picture_storage.open(name) as original:
+        image = Image.open(original)
+        image.load()
+    image = ImageOps.exif_transpose(image).convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    for variant, size in picture_variants().items():
+        target = variant_name(name, variant)
+        if picture_storage.exists(target):
+            continue
+        content = io.BytesIO()
+        ImageOps.fit(image, (size, size), Image.LANCZOS).save(content, 'WEBP', quality=80)
+        picture_storage.save(target, ContentFile(content.getvalue()))
+    with transaction.atomic():
+        profils = Profil.objects.filter(picture=name, picture_processed=False)
+        # no signal from update(), the profils versions (responses caches, etags) are bumped here
+        user_ids = list(profils.select_for_update().values_list('user_id', flat=True))
+        if not user_ids:
+            return
+        Profil.objects.filter(picture=name, user_id__in=user_ids).update(
+            picture_processed=True, change_stamp=CollectionVersion.objects.reserve_stamps(1)[0],
+            changed_at=timezone.now()
+        )
+        bump_versions(PROFILS, *(f'{PROFILS}:{user_id}' for user_id in user_ids))
+
+
+def generate_variants_safely(name):
+    """ generate the picture variants, a failure is logged, the original picture stays in use """
+    try:
+        generate_variants(name)
+    except Exception:
+        logger.exception('picture %s variants generation failed', name)
+
+
+def run_in_worker(name):
+    """ worker thread job, the thread database connection is closed after the job """
+    try:
+        generate_variants_safely(name)
+    finally:
+        connections.close_all()
+
+
+def process_picture(name):
+    """ generate the picture variants off the request thread, on the pictures threads
+        pool ('thread' PICTURE_PROCESSING) or as a background job ('job'), or inline ('sync') """
+    if picture_hash(name) is None:
+        return
+    mode = getattr(settings, 'PICTURE_PROCESSING', 'thread')
+    if mode == 'sync':
+        generate_variants_safely(name)
+    elif mode == 'job':
+        enqueue('generate_picture_variants', name=name)
+    else:
+        executor.submit(run_in_worker, name)
+
+
+def picture_urls(profil):
+    """ urls of the original picture and its variants, the original stands in
+        for the variants not generated yet """
+    return stored_picture_urls(profil.picture.name, profil.picture_processed)
+
+
+def stored_picture_urls(name, processed):
+    """ urls of a stored picture name and its variants, None without picture """
+    if not name:
+        return None
+    original = picture_storage.url(name)
+    urls = {'original': original}
+    for variant in picture_variants():
+        urls[variant] = picture_storage.url(variant_name(name, variant)) if processed else original
+    return urls
@@ -0,0 +1,57 @@
+import logging
+import warnings
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """ raised when a view runs more sql queries than its budget """
+
+
+class QueryBudgetWarning(RuntimeWarning):
+    """ warned when a view runs more sql queries than its budget """
+
+
+class QueryCounter:
+    """ database execute wrapper counting the executed queries """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin:
+    """ api view mixin checking the view sql queries count against its
+        `query_budget` (None for no budget), the QUERY_BUDGET_MODE setting
+        choose between 'log' (production), 'warn' and 'raise' (tests) """
+    query_budget = None
+
+    def dispatch(self, request, *args, **kwargs):
+        """ count the queries run while dispatching the request """
+        if self.query_budget is None:
+            return super().dispatch(request, *args, **kwargs)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+        if counter.count > self.query_budget:
+            self.query_budget_exceeded(request, counter.count)
+        return response
+
+    def query_budget_exceeded(self, request, count):
+        """ report the exceeded query budget according to the budget mode """
+        message = (
+            f'{self.__class__.__name__} ran {count} queries '
+            f'for a budget of {self.query_budget} ({request.method} {request.path})'
+        )
+        mode = getattr(settings, 'QUERY_BUDGET_MODE', 'log')
+        if mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        if mode == 'warn':
+            warnings.warn(message, QueryBudgetWarning)
+        else:
+            logger.warning(message)
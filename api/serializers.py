@@ -1,6 +1,9 @@
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Task
+from .models import Task, Profil, Job
+from .instrumentation import timed
+from .pictures import picture_urls
 
 class AddNewEmployeeSerializer(serializers.Serializer):
     """ add new employee end point serializer """
@@ -10,6 +13,19 @@ class AddNewEmployeeSerializer(serializers.Serializer):
     picture = serializers.ImageField() 
 
 
+class BulkEmployeeRowSerializer(AddNewEmployeeSerializer):
+    """ bulk employees import row serializer, the picture is a file name in the pictures zip """
+    picture = serializers.CharField(required=False, allow_blank=True)
+
+
+class BulkAddEmployeesSerializer(serializers.Serializer):
+    """ bulk employees import end point serializer """
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=('csv', 'ndjson'), required=False)
+    pictures = serializers.FileField(required=False)
+    background = serializers.BooleanField(default=False)
+
+
 class UpdateEmployeeSerializer(serializers.Serializer):
     """ update employee end point serializer """
     employee_id = serializers.IntegerField()
@@ -19,41 +35,148 @@ class UpdateEmployeeSerializer(serializers.Serializer):
 
 
 
+class PatchEmployeeSerializer(serializers.Serializer):
+    """ partial update employee end point serializer, only the sent fields are written """
+    employee_id = serializers.IntegerField()
+    username = serializers.CharField(required=False)
+    salary = serializers.IntegerField(required=False)
+    picture = serializers.ImageField(required=False)
+    # expected row version, unless sent as the If-Match header
+    version = serializers.IntegerField(required=False)
+
+
 class DeleteEmployeeSerializer(serializers.Serializer):
     """ delete employee end point serializer """
     employee_id = serializers.IntegerField()
 
 
-class UserSerializer(serializers.ModelSerializer):
+def split_names(value):
+    """ names of a comma separated query parameter """
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """ list serializer timed as the instrumentation serializer phase """
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """ serializer timed as the instrumentation serializer phase, Meta `list_serializer_class`
+        is TimedListSerializer for the lists """
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+class SparseFieldsMixin:
+    """ model serializer trimmed to some of its fields (`fields` argument), the `fields` and
+        `exclude` query parameters select them and `sparse_queryset` reads only their columns,
+        Meta `sparse_columns` and `sparse_related` map the fields to the model columns and relations """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, query_params):
+        """ the fields kept by the `fields` and `exclude` query parameters, None for every field,
+            raise a ValidationError for an unknown field """
+        fields, exclude = split_names(query_params.get('fields')), split_names(query_params.get('exclude'))
+        if not fields and not exclude:
+            return None
+        unknown = [name for name in fields + exclude if name not in cls.Meta.fields]
+        if unknown:
+            raise serializers.ValidationError(
+                {'fields': [f'unknown fields {", ".join(unknown)}, expected some of {", ".join(cls.Meta.fields)}']}
+            )
+        return [name for name in cls.Meta.fields if (not fields or name in fields) and name not in exclude]
+
+    @classmethod
+    def sparse_queryset(cls, queryset, fields, columns=('id',)):
+        """ queryset joining the relations of the fields and, for some fields only, reading
+            only their columns (and the given columns, the pagination ordering) """
+        names = cls.Meta.fields if fields is None else fields
+        related = {relation for name in names for relation in cls.Meta.sparse_related.get(name, ())}
+        queryset = queryset.select_related(*sorted(related))
+        if fields is None:
+            return queryset
+        columns = {*columns, *(column for name in fields for column in cls.Meta.sparse_columns.get(name, (name,)))}
+        return queryset.only(*sorted(columns))
+
+
+class UserSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """ user model serializer """
     profil = serializers.StringRelatedField()
+    pictures = serializers.SerializerMethodField()
+    version = serializers.SerializerMethodField()
     class Meta:
         """ comment model serializer Meta class """
         model = User
+        list_serializer_class = TimedListSerializer
         fields = (
             'id',
             'username',
             'email',
             'profil',
+            'pictures',
+            'version',
             'date_joined',
             'last_login',
             'is_staff',
             'auth_token'
         )
+        sparse_columns = {
+            'profil': ('profil__salary',),
+            'pictures': ('profil__picture', 'profil__picture_processed'),
+            'version': ('profil__version',),
+            'auth_token': ('auth_token__key',),
+        }
+        sparse_related = {
+            'profil': ('profil',),
+            'pictures': ('profil',),
+            'version': ('profil',),
+            'auth_token': ('auth_token',),
+        }
+
+    def get_pictures(self, user):
+        """ profil picture original and resized variants urls """
+        profil = getattr(user, 'profil', None)
+        return picture_urls(profil) if profil is not None else None
 
-class TaskSerializer(serializers.ModelSerializer):
+    def get_version(self, user):
+        """ employee row version (If-Match of the employee updates) """
+        profil = getattr(user, 'profil', None)
+        return profil.version if profil is not None else None
+
+class TaskSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """ task model serializer """
     employee = serializers.StringRelatedField()
     class Meta:
         """ task model serializer Meta class """
         model = Task
+        list_serializer_class = TimedListSerializer
         fields = (
             'id',
             'title',
             'description',
             'deadline',
-            'employee'
+            'employee',
+            'version'
         )
+        sparse_columns = {
+            'employee': ('employee__username',),
+        }
+        sparse_related = {
+            'employee': ('employee',),
+        }
 
 
 class AddNewTaskSerializer(serializers.Serializer):
@@ -75,6 +198,158 @@ class UpdateTaskSerializer(serializers.Serializer):
 
 
 
+class PatchTaskSerializer(serializers.Serializer):
+    """ partial update task end point serializer, only the sent fields are written """
+    task_id = serializers.IntegerField()
+    title = serializers.CharField(required=False)
+    description = serializers.CharField(required=False)
+    deadline = serializers.DateTimeField(required=False)
+    # expected row version, unless sent as the If-Match header
+    version = serializers.IntegerField(required=False)
+
+
 class DeleteTaskSerializer(serializers.Serializer):
     """ delete task end point serializer """
     task_id = serializers.IntegerField()
+
+
+class BatchUpdateTaskSerializer(serializers.Serializer):
+    """ tasks batch update operation serializer """
+    task_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    title = serializers.CharField(required=False)
+    description = serializers.CharField(required=False)
+    deadline = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        """ at least one task field to update """
+        if not {'title', 'description', 'deadline'} & set(data):
+            raise serializers.ValidationError('no task field to update')
+        return data
+
+
+class BatchDeleteTaskSerializer(serializers.Serializer):
+    """ tasks batch delete operation serializer """
+    task_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class BatchReassignTaskSerializer(serializers.Serializer):
+    """ tasks batch reassign (every task of an employee to another) operation serializer """
+    from_employee_id = serializers.IntegerField()
+    to_employee_id = serializers.IntegerField()
+
+
+class TasksBatchSerializer(serializers.Serializer):
+    """ tasks batch end point serializer """
+    mode = serializers.ChoiceField(choices=('atomic', 'best_effort'), default='atomic')
+    operations = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=getattr(settings, 'TASK_BATCH_MAX_OPERATIONS', 1000)
+    )
+
+
+# delta synced collections, all synced by default
+SYNC_COLLECTIONS = ('task', 'profil')
+
+# session bootstrap sections, all included by default
+BOOTSTRAP_SECTIONS = ('user', 'roles', 'tasks', 'summary')
+
+
+class BootstrapSerializer(serializers.Serializer):
+    """ session bootstrap end point query parameters serializer """
+    include = serializers.CharField(required=False)
+    tasks_page_size = serializers.IntegerField(
+        min_value=1,
+        max_value=getattr(settings, 'API_MAX_PAGE_SIZE', 1000),
+        default=getattr(settings, 'API_PAGE_SIZE', 100)
+    )
+
+    def validate_include(self, value):
+        """ comma separated sections names """
+        sections = [section.strip() for section in value.split(',') if section.strip()]
+        unknown = [section for section in sections if section not in BOOTSTRAP_SECTIONS]
+        if unknown:
+            raise serializers.ValidationError(
+                f'unknown sections {", ".join(unknown)}, expected some of {", ".join(BOOTSTRAP_SECTIONS)}'
+            )
+        return sections
+
+
+class ExportSerializer(serializers.Serializer):
+    """ export end points query parameters serializer """
+    output = serializers.ChoiceField(choices=('csv', 'ndjson'), default='csv')
+    employee = serializers.IntegerField(required=False)
+
+
+class SyncProfilSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """ delta sync profil model serializer """
+    pictures = serializers.SerializerMethodField()
+    class Meta:
+        """ profil model serializer Meta class """
+        model = Profil
+        list_serializer_class = TimedListSerializer
+        fields = (
+            'id',
+            'user',
+            'salary',
+            'pictures',
+            'version'
+        )
+
+    def get_pictures(self, profil):
+        """ profil picture original and resized variants urls """
+        return picture_urls(profil)
+
+
+class ChangesSerializer(serializers.Serializer):
+    """ delta sync end point query parameters serializer """
+    since = serializers.CharField(required=False, allow_blank=True)
+    collections = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(
+        min_value=1,
+        max_value=getattr(settings, 'API_MAX_PAGE_SIZE', 1000),
+        default=getattr(settings, 'API_PAGE_SIZE', 100)
+    )
+
+    def validate_since(self, value):
+        """ sync token of the previous changes page, `<stamp>.<id>[.<floor>]`, as (stamp, id, floor) """
+        if not value:
+            return (0, 0, 0)
+        try:
+            stamp, row_id, *floor = (int(part) for part in value.split('.'))
+        except ValueError:
+            raise serializers.ValidationError('invalid sync token')
+        if len(floor) > 1:
+            raise serializers.ValidationError('invalid sync token')
+        return (stamp, row_id, min([stamp, *floor]))
+
+    def validate_collections(self, value):
+        """ comma separated collections names """
+        collections = [collection.strip() for collection in value.split(',') if collection.strip()]
+        unknown = [collection for collection in collections if collection not in SYNC_COLLECTIONS]
+        if unknown:
+            raise serializers.ValidationError(
+                f'unknown collections {", ".join(unknown)}, expected some of {", ".join(SYNC_COLLECTIONS)}'
+            )
+        return collections
+
+
+class JobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """ background job model serializer """
+    class Meta:
+        """ job model serializer Meta class """
+        model = Job
+        list_serializer_class = TimedListSerializer
+        fields = (
+            'id',
+            'name',
+            'status',
+            'attempts',
+            'max_attempts',
+            'progress',
+            'result',
+            'error',
+            'created_at',
+            'started_at',
+            'finished_at'
+        )
@@ -0,0 +1,105 @@
+from collections import Counter
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token, invalidate_user_token
+from .models import User, Profil, Task
+from .versions import bump_versions, TASKS, PROFILS, USERS
+from .payroll import apply_salary_changes
+from .sync import record_tombstones
+from .events import publish
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """ forget the deleted token (logout, token deletion, user deletion cascade) """
+    invalidate_token(instance.key, instance.user_id)
+    bump_versions(USERS, f'{USERS}:{instance.user_id}')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    """ forget the user token, the cached user (is_staff, is_active...) is outdated """
+    invalidate_user_token(instance.id)
+    bump_versions(USERS, f'{USERS}:{instance.id}')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """ forget the deleted user token """
+    invalidate_user_token(instance.id)
+    bump_versions(USERS, f'{USERS}:{instance.id}')
+
+
+@receiver(post_save, sender=Token)
+def token_saved(sender, instance, **kwargs):
+    """ the user auth_token changed """
+    bump_versions(USERS, f'{USERS}:{instance.user_id}')
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_changed(sender, instance, **kwargs):
+    """ the tasks collection and the employee tasks changed """
+    bump_versions(TASKS, f'{TASKS}:{instance.employee_id}')
+
+
+@receiver(post_save, sender=Profil)
+@receiver(post_delete, sender=Profil)
+def profil_changed(sender, instance, **kwargs):
+    """ the profils collection and the user profil changed """
+    bump_versions(PROFILS, f'{PROFILS}:{instance.user_id}')
+
+
+@receiver(post_save, sender=Task)
+def publish_task_saved(sender, instance, created, **kwargs):
+    """ notify the employee connected clients """
+    publish(f'{TASKS}:{instance.employee_id}', {
+        'type': 'task.created' if created else 'task.updated',
+        'task_id': instance.id,
+        'change_stamp': instance.change_stamp,
+    })
+
+
+@receiver(post_delete, sender=Task)
+def publish_task_deleted(sender, instance, **kwargs):
+    """ notify the employee connected clients """
+    publish(f'{TASKS}:{instance.employee_id}', {'type': 'task.deleted', 'task_id': instance.id})
+
+
+@receiver(post_delete, sender=Task)
+def task_tombstone(sender, instance, **kwargs):
+    """ record the deleted task for the delta sync """
+    record_tombstones(TASKS, [(instance.id, instance.employee_id)])
+
+
+@receiver(post_delete, sender=Profil)
+def profil_tombstone(sender, instance, **kwargs):
+    """ record the deleted profil for the delta sync """
+    record_tombstones(PROFILS, [(instance.id, instance.user_id)])
+
+
+@receiver(post_init, sender=Profil)
+def remember_salary(sender, instance, **kwargs):
+    """ remember the stored salary (unless deferred) for the payroll summary """
+    instance._payroll_salary = instance.__dict__.get('salary') if instance.pk else None
+
+
+@receiver(post_save, sender=Profil)
+def update_payroll(sender, instance, created, **kwargs):
+    """ count the new or changed salary in the payroll summary """
+    salary = instance.__dict__.get('salary')
+    if created:
+        apply_salary_changes(Counter({salary: 1}))
+    elif instance._payroll_salary is not None and salary is not None and salary != instance._payroll_salary:
+        apply_salary_changes(Counter({instance._payroll_salary: -1, salary: 1}))
+    if salary is not None:
+        instance._payroll_salary = salary
+
+
+@receiver(post_delete, sender=Profil)
+def remove_from_payroll(sender, instance, **kwargs):
+    """ uncount the deleted profil salary from the payroll summary """
+    salary = instance._payroll_salary if instance._payroll_salary is not None else instance.__dict__.get('salary')
+    if salary is not None:
+        apply_salary_changes(Counter({salary: -1}))
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedTokenAuthentication
+from .events import broker
+from .versions import TASKS
+
+# seconds between the keep alive comments of an idle stream
+HEARTBEAT_INTERVAL = 15
+
+
+def scope_token(scope):
+    """ token key of the `Authorization: Token <key>` header, or of the `token` query
+        parameter (the browsers EventSource can not send headers) """
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0].lower() == 'token':
+                return parts[1]
+    return parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+
+
+def authenticate(key):
+    """ return the active user of the token key or None """
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+async def wait_disconnect(receive):
+    """ wait for the client disconnection """
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def task_events(scope, receive, send):
+    """ asgi application streaming (server sent events) the changes of the
+        authenticated employee tasks """
+    key = scope_token(scope)
+    user = await sync_to_async(authenticate)(key) if key else None
+    if user is None:
+        await send({'type': 'http.response.start', 'status': 401, 'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': b'{"detail": "Invalid token."}'})
+        return
+    subscription = broker.subscribe(f'{TASKS}:{user.id}')
+    disconnect = asyncio.ensure_future(wait_disconnect(receive))
+    next_event = asyncio.ensure_future(subscription.get())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+        loop = asyncio.get_running_loop()
+        checked = loop.time()
+        while True:
+            done, _ = await asyncio.wait(
+                {disconnect, next_event}, timeout=HEARTBEAT_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                break
+            # the token is checked again every heartbeat interval, a deleted token or a
+            # deactivated user ends the stream (the client reconnection is refused)
+            if loop.time() - checked >= HEARTBEAT_INTERVAL:
+                checked = loop.time()
+                current = await sync_to_async(authenticate)(key)
+                if current is None or current.id != user.id:
+                    await send({'type': 'http.response.body', 'body': b': token revoked\n\n', 'more_body': False})
+                    break
+            if next_event in done:
+                event = next_event.result()
+                body = f'event: {event["type"]}\ndata: {json.dumps(event)}\n\n'
+                next_event = asyncio.ensure_future(subscription.get())
+            else:
+                body = ': ping\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+    finally:
+        subscription.close()
+        disconnect.cancel()
+        next_event.cancel()
@@ -0,0 +1,166 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from heapq import merge
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from .models import CollectionVersion, Profil, Task, Tombstone
+from .serializers import TaskSerializer, SyncProfilSerializer
+from .versions import TASKS, PROFILS
+
+# counter (collection version name) of the newest pruned tombstone stamp
+TOMBSTONES_HORIZON = 'tombstones_horizon'
+
+_deferred = threading.local()
+
+
+class SyncTokenExpired(Exception):
+    """ raised for a sync token older than the pruned tombstones, a full sync is needed """
+
+
+@contextmanager
+def deferred_tombstones():
+    """ collect the tombstones of the block (cascade deletes send one signal per row)
+        and record them together at the block exit, to use inside the deletes transaction,
+        a failed block records none """
+    if getattr(_deferred, 'rows', None) is not None:
+        yield
+        return
+    _deferred.rows = []
+    try:
+        yield
+    except BaseException:
+        _deferred.rows = None
+        raise
+    rows, _deferred.rows = _deferred.rows, None
+    for collection in sorted({collection for collection, _, _ in rows}):
+        record_tombstones(collection, [
+            (object_id, owner_id) for row_collection, object_id, owner_id in rows if row_collection == collection
+        ])
+
+
+def record_tombstones(collection, rows):
+    """ record the tombstones of the deleted (object id, owner id) rows """
+    deferred = getattr(_deferred, 'rows', None)
+    if deferred is not None:
+        deferred.extend((collection, object_id, owner_id) for object_id, owner_id in rows)
+        return
+    rows = list(rows)
+    if not rows:
+        return
+    with transaction.atomic():
+        stamps = CollectionVersion.objects.reserve_stamps(len(rows))
+        Tombstone.objects.bulk_create([
+            Tombstone(collection=collection, object_id=object_id, owner_id=owner_id, change_stamp=stamp)
+            for (object_id, owner_id), stamp in zip(rows, stamps)
+        ])
+
+
+def sync_token(stamp, row_id, floor=None):
+    """ sync token of a changes position, with the stamp above which the changes are read
+        again (look-back window) when it is below the position """
+    if floor is None or floor >= stamp:
+        return f'{stamp}.{row_id}'
+    return f'{stamp}.{row_id}.{floor}'
+
+
+def after(position):
+    """ filter of the rows changed after the (stamp, id) position, the stamps of two
+        collections never collide, the id only orders the rows of one statement """
+    stamp, row_id = position
+    return Q(change_stamp__gte=stamp) & (Q(change_stamp__gt=stamp) | Q(id__gt=row_id))
+
+
+def between(floor, position):
+    """ filter of the rows changed after the floor stamp up to the (stamp, id) position """
+    return Q(change_stamp__gt=floor) & ~after(position)
+
+
+def sync_lookback():
+    """ seconds of changes read again by every sync: the stamps of the sequence are not
+        committed in order, a stamp reserved before a sent one can be committed after it,
+        the counter stamps are committed in order (no look-back) """
+    if not CollectionVersion.objects.stamps_sequenced():
+        return 0
+    return getattr(settings, 'SYNC_LOOKBACK', 10)
+
+
+def changes_since(user, collections, position, limit, lookback=None):
+    """ the rows of the collections changed after the (stamp, id, floor) position, visible by
+        the user (every row for the admins, their own rows for the employees), in changes order,
+        one query per collection and one for the tombstones, return (changes, next position,
+        has more); the rows changed after the floor up to the position are sent again (one more
+        query each), the floor moves up to the changes older than the look-back window """
+    stamp, row_id, floor = position
+    lookback = sync_lookback() if lookback is None else lookback
+    cutoff = timezone.now() - timedelta(seconds=lookback)
+    horizon = CollectionVersion.objects.filter(name=TOMBSTONES_HORIZON).values_list('version', flat=True).first()
+    if position != (0, 0, 0) and horizon and floor < horizon:
+        raise SyncTokenExpired(horizon)
+    windows = [after((stamp, row_id))]
+    if floor < stamp:
+        windows.insert(0, between(floor, (stamp, row_id)))
+    sources = []
+    for index, window in enumerate(windows):
+        # the rows sent again are all sent, the new rows by page
+        size = limit + 1 if index == len(windows) - 1 else None
+        if TASKS in collections:
+            tasks = Task.objects.select_related('employee').filter(window)
+            if not user.is_staff:
+                tasks = tasks.filter(employee_id=user.id)
+            sources.append([
+                (task.change_stamp, task.id, task.changed_at,
+                 {'collection': TASKS, 'id': task.id, 'deleted': False, 'data': data})
+                for task, data in rows_data(tasks.order_by('change_stamp', 'id')[:size], TaskSerializer)
+            ])
+        if PROFILS in collections:
+            profils = Profil.objects.filter(window)
+            if not user.is_staff:
+                profils = profils.filter(user_id=user.id)
+            sources.append([
+                (profil.change_stamp, profil.id, profil.changed_at,
+                 {'collection': PROFILS, 'id': profil.id, 'deleted': False, 'data': data})
+                for profil, data in rows_data(profils.order_by('change_stamp', 'id')[:size], SyncProfilSerializer)
+            ])
+        tombstones = Tombstone.objects.filter(window, collection__in=collections)
+        if not user.is_staff:
+            tombstones = tombstones.filter(owner_id=user.id)
+        sources.append([
+            (change_stamp, tombstone_id, deleted_at, {'collection': collection, 'id': object_id, 'deleted': True})
+            for tombstone_id, collection, object_id, change_stamp, deleted_at in tombstones.order_by(
+                'change_stamp', 'id'
+            ).values_list('id', 'collection', 'object_id', 'change_stamp', 'deleted_at')[:size]
+        ])
+    changes = list(merge(*sources, key=lambda change: change[:2]))
+    again = [change for change in changes if change[:2] <= (stamp, row_id)]
+    new = [change for change in changes if change[:2] > (stamp, row_id)]
+    page = again + new[:limit]
+    next_stamp, next_id = new[:limit][-1][:2] if new else (stamp, row_id)
+    if lookback:
+        # the stamps below a change reserved before the window are committed
+        floor = min(next_stamp, max([floor, *(change[0] for change in page if change[2] < cutoff)]))
+    else:
+        floor = next_stamp
+    return [change for *_, change in page], (next_stamp, next_id, floor), len(new) > limit
+
+
+def rows_data(rows, serializer_class):
+    """ (row, serialized data) of the rows """
+    rows = list(rows)
+    return zip(rows, serializer_class(rows, many=True).data)
+
+
+def prune_tombstones(before):
+    """ delete the tombstones recorded before the date, the sync tokens older than
+        the newest deleted tombstone need a full sync, return the deleted count """
+    with transaction.atomic():
+        horizon = Tombstone.objects.filter(deleted_at__lt=before).aggregate(horizon=Max('change_stamp'))['horizon']
+        if horizon is None:
+            return 0
+        count, _ = Tombstone.objects.filter(change_stamp__lte=horizon).delete()
+        current = CollectionVersion.objects.filter(name=TOMBSTONES_HORIZON).values_list('version', flat=True).first()
+        if current is None or current < horizon:
+            CollectionVersion.objects.update_or_create(name=TOMBSTONES_HORIZON, defaults={'version': horizon})
+    return count
@@ -1,15 +1,80 @@
-from datetime import datetime
-from django.test import TestCase
+from datetime import datetime, timedelta
+from collections import Counter
+import asyncio
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, TransactionTestCase, LiveServerTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, IntegrityError
 from django.core.files.uploadedfile import SimpleUploadedFile
-from rest_framework.test import APITestCase, APIClient
-from .serializers import AddNewEmployeeSerializer
-from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_403_FORBIDDEN
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory, force_authenticate
+from rest_framework.authtoken.models import Token
+from .serializers import AddNewEmployeeSerializer, UserSerializer, TaskSerializer
+from .values import VALUES_SERIALIZERS
+from rest_framework.renderers import JSONRenderer
+from .renderers import FastJSONRenderer
+from django.utils.translation import gettext_lazy
+from decimal import Decimal
+import gzip
+import pytz
+from .pictures import variant_name, picture_name, store_picture, generate_variants, stored_picture_urls, picture_storage
+from rest_framework.status import HTTP_200_OK, HTTP_202_ACCEPTED, HTTP_400_BAD_REQUEST, HTTP_410_GONE, HTTP_412_PRECONDITION_FAILED, HTTP_401_UNAUTHORIZED, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_403_FORBIDDEN, HTTP_503_SERVICE_UNAVAILABLE
 from django.shortcuts import reverse
-from .models import User, Profil, Task
+from .models import User, Profil, Task, Job, Event, Tombstone, SalaryBucket
+from .payroll import apply_salary_changes, payroll_summary
+from .jobs import JOBS, job, enqueue, run_pending_jobs, requeue_stale_jobs
+from .querybudget import QueryBudgetExceeded
+from .events import DatabaseBroker, schedule_events_pruning
+from .streams import task_events
+from .asyncviews import async_view
+from .views import GetEmployeeTasks
+from .views import GetTasksView
+from .views import ChangesView
+from .dashboard import deadline_bounds
+from .sync import changes_since
+from .authentication import LRUTokenCache
+from .bulk import EmployeesImport
+from .instrumentation import InstrumentationMiddleware, view_stats
+from .metrics import store as metrics_store
+from . import urls as api_urls
 from PIL import Image
+import importlib.util
 import io
+import json
+import os
+import subprocess
+import sys
+import shutil
+import tempfile
+import zipfile
+from unittest import mock, skipUnless
+
+# the files written by the tests (pictures, imports uploads, metrics) go to a temporary directory,
+# never to the MEDIA_ROOT or the METRICS_DIR of the host
+tests_folder = tempfile.TemporaryDirectory()
+tests_directories = override_settings(
+    MEDIA_ROOT=os.path.join(tests_folder.name, 'media'),
+    METRICS={'DIRECTORY': os.path.join(tests_folder.name, 'metrics')},
+)
+
+
+def setUpModule():
+    """ point the media storage and the metrics store to the temporary directory """
+    tests_directories.enable()
+
+
+def tearDownModule():
+    """ forget the tests metrics (not written at exit) and remove the temporary directory """
+    tests_directories.disable()
+    metrics_store.reset()
+    tests_folder.cleanup()
+
 
 # employees management tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
 class EmployeeTestCase(APITestCase):
     """ employee management test case """
     def setUp(self):
@@ -65,8 +130,58 @@ class EmployeeTestCase(APITestCase):
         }
         response = self.api_client.post(self.add_employee_url, data)
         self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertTrue(User.objects.get(username='lay').check_password('kjksdfklj'))
 
 
+    def test_add_new_employee_picture_variants(self):
+        """ test the employee picture is stored once by content and resized in webp variants
+        (request) -> 200 with the variants urls exposed """
+        user = User.objects.create(is_staff=True, username='test user', password='jkld')
+        self.api_client.force_authenticate(user=user)
+        for username in ('lay', 'kofi'):
+            data = {'username': username, 'password': 'password', 'salary': 300, 'picture': self.generate_photo_file()}
+            response = self.api_client.post(self.add_employee_url, data)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+        lay, kofi = Profil.objects.get(user__username='lay'), Profil.objects.get(user__username='kofi')
+        self.assertEqual(lay.picture.name, kofi.picture.name)
+        self.assertTrue(lay.picture_processed)
+        pictures = UserSerializer(lay.user).data['pictures']
+        self.assertTrue(pictures['thumbnail'].endswith('/thumbnail.webp'))
+        thumbnail = Image.open(default_storage.open(variant_name(lay.picture.name, 'thumbnail')))
+        self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (40, 40)))
+
+    @override_settings(PICTURE_PROCESSING='job')
+    def test_picture_variants_outdate_cached_user(self):
+        """ test the variants generation outdates the cached user response and its etag
+        (request) -> original picture urls, then the variants urls and a new etag """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=admin)
+        data = {'username': 'lay', 'password': 'password', 'salary': 300, 'picture': self.generate_photo_file()}
+        self.api_client.post(self.add_employee_url, data)
+        self.api_client.force_authenticate(user=User.objects.get(username='lay'))
+        response = self.api_client.get(reverse('api:get_user'))
+        self.assertFalse(response.data['pictures']['thumbnail'].endswith('.webp'))
+        self.assertEqual(run_pending_jobs(), 1)
+        self.api_client.force_authenticate(user=User.objects.get(username='lay'))
+        response = self.api_client.get(reverse('api:get_user'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertTrue(response.data['pictures']['thumbnail'].endswith('/thumbnail.webp'))
+
+    def test_content_addressed_pictures_storage(self):
+        """ test a stored picture name is kept when stored again (no random suffix, no partial
+        file left) and the variants follow the PICTURE_VARIANTS setting of the call """
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media, PICTURE_VARIANTS={'tiny': 16}):
+            names = {store_picture(SimpleUploadedFile('lay.png', self.generate_photo_file().read())) for _ in range(2)}
+            name, = names
+            self.assertEqual(picture_storage.save(name, self.generate_photo_file()), name)
+            directory = os.path.dirname(picture_storage.path(name))
+            self.assertEqual(os.listdir(directory), [os.path.basename(name)])
+            generate_variants(name)
+            self.assertEqual(Image.open(picture_storage.open(variant_name(name, 'tiny'))).size, (16, 16))
+            self.assertEqual(set(stored_picture_urls(name, True)), {'original', 'tiny'})
+
     def test_get_employees(self):
         """ test the employees avaialble getting 
         (request) -> 200 """
@@ -83,6 +198,190 @@ class EmployeeTestCase(APITestCase):
         self.assertEqual(employees_after_user_created, employees_before_employee_created + 1)
 
 
+    def test_get_employees_paginated(self):
+        """ test the employees list is paginated with an opaque cursor
+        (request) -> 200 with next cursor link """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        for index in range(3):
+            employee = User.objects.create(username=f'employee {index}', password='password')
+            Profil.objects.create(user=employee, salary=400)
+        self.api_client.force_authenticate(user=admin)
+        response = self.api_client.get(self.get_employees_url, {'page_size': 2})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNone(response.json()['previous'])
+        response = self.api_client.get(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNone(response.json()['next'])
+
+
+    def test_get_employees_queries_count(self):
+        """ test the employees list queries count does not grow with the employees
+        (request) -> 1 query for the page """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        for index in range(5):
+            employee = User.objects.create(username=f'employee {index}', password='password')
+            Profil.objects.create(user=employee, salary=400)
+            Token.objects.create(user=employee)
+        self.api_client.force_authenticate(user=admin)
+        with self.assertNumQueries(2):
+            response = self.api_client.get(self.get_employees_url)
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertEqual(response.json()['results'][0]['profil'], '400')
+
+
+    def test_get_employees_sparse_fields(self):
+        """ test the employees list fields parameter skips the profil and token joins
+        (request) -> 200 with the kept fields only """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        employee = User.objects.create(username='employee', password='password')
+        Profil.objects.create(user=employee, salary=400)
+        Token.objects.create(user=employee)
+        self.api_client.force_authenticate(user=admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api_client.get(self.get_employees_url, {'fields': 'id,username'})
+        self.assertEqual(response.json()['results'], [{'id': employee.id, 'username': 'employee'}])
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in queries.captured_queries))
+        response = self.api_client.get(self.get_employees_url, {'exclude': 'auth_token'})
+        self.assertNotIn('auth_token', response.json()['results'][0])
+        self.assertEqual(response.json()['results'][0]['profil'], '400')
+
+
+    def test_bulk_add_employees_csv(self):
+        """ test the employees csv bulk import with pictures zip and invalid rows
+        (request) -> 200 with the rows errors report """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        User.objects.create(username='taken', password='password')
+        self.api_client.force_authenticate(user=admin)
+        pictures = io.BytesIO()
+        with zipfile.ZipFile(pictures, 'w') as archive:
+            archive.writestr('lay.png', self.generate_photo_file().read())
+        pictures.name = 'pictures.zip'
+        pictures.seek(0)
+        rows = (
+            'username,password,salary,picture\n'
+            'lay,password,300,lay.png\n'
+            'kofi,password,400,\n'
+            'taken,password,400,\n'
+            'ama,password,not a salary,\n'
+            'lay,password,300,\n'
+        )
+        data = {
+            'file': SimpleUploadedFile('employees.csv', rows.encode(), content_type='text/csv'),
+            'pictures': pictures
+        }
+        response = self.api_client.post(reverse('api:bulk_add_employees'), data)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['rows'], 5)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4, 5])
+        self.assertEqual(Profil.objects.get(user__username='kofi').salary, 400)
+        self.assertTrue(Profil.objects.get(user__username='lay').picture.name.endswith('.png'))
+        self.assertTrue(picture_storage.exists(Profil.objects.get(user__username='lay').picture.name))
+        self.assertTrue(User.objects.get(username='kofi').check_password('password'))
+        call_command('rebuild_payroll_summary', '--check', stdout=io.StringIO())
+
+    def test_bulk_add_employees_rolled_back_pictures(self):
+        """ test a chunk whose insert is rolled back stores none of its pictures
+        (rows) -> the rows reported as errors, no picture stored """
+        # a picture no other test stores
+        picture = io.BytesIO()
+        Image.new('RGB', size=(10, 10), color=(1, 2, 3)).save(picture, 'png')
+        pictures = io.BytesIO()
+        with zipfile.ZipFile(pictures, 'w') as archive:
+            archive.writestr('lay.png', picture.getvalue())
+        pictures.seek(0)
+        employees_import = EmployeesImport(pictures=pictures)
+        name = picture_name(employees_import.get_picture('lay.png'))
+        rows = [(1, {'username': 'lay', 'password': 'password', 'salary': 300, 'picture': 'lay.png'})]
+        with mock.patch.object(Profil.objects, 'bulk_create', side_effect=IntegrityError):
+            report = employees_import.run(rows)
+        self.assertEqual(report['errors'], [{'row': 1, 'errors': {'row': ['could not be inserted']}}])
+        self.assertFalse(User.objects.filter(username='lay').exists())
+        self.assertFalse(picture_storage.exists(name))
+
+    def test_bulk_add_employees_ndjson(self):
+        """ test the employees ndjson bulk import
+        (request) -> 200 """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=admin)
+        rows = '{"username": "lay", "password": "password", "salary": 300}\nnot json\n'
+        data = {'file': SimpleUploadedFile('employees.ndjson', rows.encode())}
+        response = self.api_client.post(reverse('api:bulk_add_employees'), data)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+
+    def test_bulk_add_employees_concurrent_insert(self):
+        """ test a username inserted by a concurrent request between the check and the insert
+        (rows) -> the row reported as error, the other rows inserted """
+        insert_rows = EmployeesImport.insert_rows
+        def racing_insert(employees_import, rows):
+            if not User.objects.filter(username='lay').exists():
+                User.objects.create(username='lay', password='password')
+            return insert_rows(employees_import, rows)
+        rows = [(1, {'username': 'lay', 'password': 'password', 'salary': 300}),
+                (2, {'username': 'kofi', 'password': 'password', 'salary': 400})]
+        with mock.patch.object(EmployeesImport, 'insert_rows', racing_insert):
+            report = EmployeesImport().run(rows)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['errors'], [{'row': 1, 'errors': {'username': ['username already exists']}}])
+        self.assertEqual(Profil.objects.get(user__username='kofi').salary, 400)
+        self.assertFalse(Profil.objects.filter(user__username='lay').exists())
+
+
+    def test_export_employees(self):
+        """ test the employees csv streaming export with the salaries
+        (request) -> 200 """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        employee = User.objects.create(username='employee', password='password')
+        Profil.objects.create(user=employee, salary=400)
+        self.api_client.force_authenticate(user=admin)
+        response = self.api_client.get(reverse('api:export_employees'))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f'{employee.id},employee,,400,'))
+
+
+    def test_payroll_summary(self):
+        """ test the payroll summary follows the employees adds, updates and deletes
+        (request) -> 200 with the live data summary """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=admin)
+        for username, salary in (('ama', 100), ('kofi', 200), ('lay', 400)):
+            data = {'username': username, 'password': 'password', 'salary': salary, 'picture': self.generate_photo_file()}
+            self.api_client.post(self.add_employee_url, data)
+        employee = User.objects.get(username='ama')
+        data = {'employee_id': employee.id, 'username': 'ama', 'salary': 300, 'picture': self.generate_photo_file()}
+        self.api_client.put(self.update_employee_url, data)
+        self.api_client.delete(self.delete_employee_url, {'employee_id': User.objects.get(username='kofi').id})
+        run_pending_jobs()
+        response = self.api_client.get(reverse('api:payroll_summary'))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['headcount'], 2)
+        self.assertEqual(response.data['total'], 700)
+        self.assertAlmostEqual(response.data['median'], 350, delta=3.5)
+        self.assertAlmostEqual(response.data['percentiles']['p90'], 400, delta=4)
+        output = io.StringIO()
+        call_command('rebuild_payroll_summary', '--check', stdout=output)
+        self.assertIn('matches', output.getvalue())
+
+    def test_payroll_summary_buckets(self):
+        """ test the payroll percentiles are read from a bounded count of salaries buckets,
+        within 1% of the exact salaries
+        (payroll_summary) -> the percentiles within 1% """
+        salaries = [1000 + index * 37 for index in range(5000)]
+        apply_salary_changes(Counter(salaries))
+        summary = payroll_summary()
+        self.assertEqual(summary['headcount'], 5000)
+        self.assertEqual(summary['total'], sum(salaries))
+        self.assertLess(SalaryBucket.objects.count(), 400)
+        for percentile in (10, 50, 90, 99):
+            exact = salaries[-(-percentile * len(salaries) // 100) - 1]
+            self.assertAlmostEqual(summary['percentiles'][f'p{percentile}'], exact, delta=exact * 0.01 + 0.5)
+        self.assertAlmostEqual(summary['max'], salaries[-1], delta=salaries[-1] * 0.01 + 0.5)
+
     def test_delete_employee_with_wrong_employee_id(self):
         """ test employee delete with wrong empoyee id 
         (request) -> 400 as response status code """
@@ -108,14 +407,17 @@ class EmployeeTestCase(APITestCase):
         response = self.api_client.delete(self.delete_employee_url, data)
         self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
 
+    @override_settings(EMPLOYEE_DELETE_CHUNK_SIZE=2)
     def test_delete_employee_with_success(self):
-        """ test done delete employee
-        (request) -> 2OO as response status code """
+        """ test done delete employee, hidden right away then deleted by the background job
+        (request) -> 2O2 as response status code, then the job progress """
         #admin
         admin = User.objects.create(is_staff=True, username='admin', password='password')
         #employee
         employee = User.objects.create(is_staff=False, username='employee', password='password')
         Profil.objects.create(user=employee, salary=400)
+        for index in range(5):
+            Task.objects.create(employee=employee, title=f'task {index}', description='description', deadline=timezone.now())
         #employees counts after a new added employee
         employees_count_before_employee_deleted = User.objects.filter(is_staff=False).count()
         self.api_client.force_authenticate(user=admin)
@@ -123,9 +425,17 @@ class EmployeeTestCase(APITestCase):
             'employee_id':employee.id
         }
         response = self.api_client.delete(self.delete_employee_url, data)
+        self.assertEqual(response.status_code, HTTP_202_ACCEPTED)
+        status_url = response.data['status_url']
+        self.assertEqual(self.api_client.get(self.get_employees_url).json()['results'], [])
+        self.assertEqual(self.api_client.get(reverse('api:get_tasks')).json()['results'], [])
+        self.assertEqual(run_pending_jobs(), 1)
         employees_count_after_employee_added = User.objects.filter(is_staff=False).count()
-        self.assertEqual(response.status_code, HTTP_200_OK)
         self.assertEqual(employees_count_before_employee_deleted, employees_count_after_employee_added + 1)
+        self.assertFalse(Task.objects.exists())
+        response = self.api_client.get(status_url)
+        self.assertEqual(response.data['status'], Job.DONE)
+        self.assertEqual(response.data['progress'], {'tasks_deleted': 5, 'tasks_total': 5})
         
 
 
@@ -146,10 +456,42 @@ class EmployeeTestCase(APITestCase):
         response = self.api_client.put(self.update_employee_url, data)
         self.assertEqual(response.status_code, 400)
 
+    def test_employee_partial_update(self):
+        """ test the employee salary only update, the picture untouched, and a stale version refused
+        (request) -> 200 with the new version etag, then 412 """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=admin)
+        data = {'username': 'lay', 'password': 'password', 'salary': 300, 'picture': self.generate_photo_file()}
+        self.api_client.post(self.add_employee_url, data)
+        profil = Profil.objects.get(user__username='lay')
+        response = self.api_client.patch(
+            self.update_employee_url, {'employee_id': profil.user_id, 'salary': 400}, HTTP_IF_MATCH='"1"'
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual((response.data['username'], response.data['version']), ('lay', 2))
+        updated = Profil.objects.get(id=profil.id)
+        self.assertEqual((updated.salary, updated.picture.name, updated.picture_processed), (400, profil.picture.name, True))
+        response = self.api_client.patch(
+            self.update_employee_url, {'employee_id': profil.user_id, 'username': 'kofi', 'version': 1}
+        )
+        self.assertEqual(response.status_code, HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(response.data['version'], 2)
+        self.assertEqual(User.objects.get(id=profil.user_id).username, 'lay')
+        # a user only change stamps the profil with its new version, the delta sync sends it
+        response = self.api_client.patch(
+            self.update_employee_url, {'employee_id': profil.user_id, 'username': 'kofi'}, HTTP_IF_MATCH='"2"'
+        )
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        renamed = Profil.objects.get(id=profil.id)
+        self.assertEqual(renamed.version, 3)
+        self.assertGreater(renamed.change_stamp, updated.change_stamp)
+
 
 
 
 # tasks management tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
 class TaskTestCase(APITestCase):
     """ task management test case """
     def setUp(self):
@@ -183,6 +525,42 @@ class TaskTestCase(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(tasks_after_task_created, tasks_before_task_created + 1)
 
+
+    def test_get_tasks_pages_by_deadline(self):
+        """ test the tasks cursor pagination ordered by deadline
+        (request) -> 200 with every task once, sorted by deadline """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=admin)
+        employee = User.objects.create(username='employee', password='password')
+        for day in (5, 3, 3, 1, 4):
+            Task.objects.create(
+                title=f'task {day}',
+                description='test task description',
+                employee=employee,
+                deadline=f'2021-03-{day:02d}T11:09:00Z'
+            )
+        url = f'{self.get_tasks_url}?ordering=deadline&page_size=2&total=1'
+        deadlines = []
+        while url:
+            response = self.api_client.get(url)
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertEqual(response.data['approximate_total'], 5)
+            self.assertLessEqual(len(response.data['results']), 2)
+            deadlines += [task['deadline'] for task in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(deadlines), 5)
+        self.assertEqual(deadlines, sorted(deadlines))
+
+    def test_get_tasks_over_query_budget(self):
+        """ test a view running more queries than its budget fails in tests
+        (request) -> QueryBudgetExceeded """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        request = APIRequestFactory().get(self.get_tasks_url)
+        force_authenticate(request, user=admin)
+        view = GetTasksView.as_view(query_budget=0)
+        with self.assertRaises(QueryBudgetExceeded):
+            view(request)
+
     
     def test_add_new_task_with_invalid_employee_id(self):
         """ test the new task to an invalid employee id  
@@ -263,6 +641,21 @@ class TaskTestCase(APITestCase):
         self.assertEqual(response.status_code, HTTP_200_OK)
         self.assertEqual(Task.objects.all().count(), 1)
 
+    def test_task_partial_update(self):
+        """ test the task title only update writes the changed column, a stale version is refused
+        (request) -> 200 with the new version etag, then 412 """
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        task = Task.objects.create(employee=employee, title='test task', description='description', deadline='2021-03-30T11:09:00Z')
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=admin)
+        response = self.api_client.patch(self.update_task_url, {'task_id': task.id, 'title': 'updated'}, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual((response.data['title'], response.data['description']), ('updated', 'description'))
+        response = self.api_client.patch(self.update_task_url, {'task_id': task.id, 'title': 'lost'}, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Task.objects.get(id=task.id).title, 'updated')
+
 
 
     def test_delete_task(self):
@@ -288,3 +681,903 @@ class TaskTestCase(APITestCase):
         self.assertEqual(response.status_code, HTTP_200_OK)
         self.assertEqual(Task.objects.all().count(), 0)
         
+
+    def test_tasks_batch(self):
+        """ test the tasks batch operations in atomic mode
+        (request) -> 200 with every operation applied """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        leaving = User.objects.create(is_staff=False, username='leaving', password='password')
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        task = Task.objects.create(employee=leaving, title='task', description='description', deadline='2021-03-30T11:09:00Z')
+        old_task = Task.objects.create(employee=employee, title='old', description='description', deadline='2021-03-30T11:09:00Z')
+        self.api_client.force_authenticate(user=admin)
+        new_task = {'title': 'new', 'description': 'description', 'deadline': '2021-04-30T11:09:00Z'}
+        data = {'operations': [
+            {'op': 'create', 'employee_id': leaving.id, **new_task},
+            {'op': 'create', 'employee_id': employee.id, **new_task},
+            {'op': 'reassign', 'from_employee_id': leaving.id, 'to_employee_id': employee.id},
+            {'op': 'update', 'task_ids': [task.id], 'title': 'task updated'},
+            {'op': 'delete', 'task_ids': [old_task.id]},
+        ]}
+        response = self.api_client.post(reverse('api:tasks_batch'), data, format='json')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual([result['count'] for result in response.data['results']], [1, 1, 2, 1, 1])
+        self.assertEqual(Task.objects.filter(employee=employee).count(), 3)
+        self.assertEqual(Task.objects.get(id=task.id).title, 'task updated')
+
+    def test_tasks_batch_set_based_delete(self):
+        """ test the batch deletion runs a fixed number of statements whatever the tasks count,
+        with the tombstones of the deleted tasks
+        (request) -> 200 with the deleted count """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        self.api_client.force_authenticate(user=admin)
+        task_ids = [
+            Task.objects.create(employee=employee, title=f'task {index}', description='description', deadline=timezone.now()).id
+            for index in range(50)
+        ]
+        data = {'operations': [{'op': 'delete', 'task_ids': task_ids}]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api_client.post(reverse('api:tasks_batch'), data, format='json')
+        self.assertEqual(response.data['results'][0]['count'], 50)
+        self.assertLess(len(queries.captured_queries), 15)
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(Tombstone.objects.filter(collection='task', owner_id=employee.id).count(), 50)
+
+    def test_tasks_batch_atomic_and_best_effort(self):
+        """ test an invalid operation cancels an atomic batch only
+        (request) -> 400 then 200 with the operation error """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        self.api_client.force_authenticate(user=admin)
+        operations = [
+            {'op': 'create', 'employee_id': employee.id, 'title': 'new', 'description': 'description', 'deadline': '2021-04-30T11:09:00Z'},
+            {'op': 'create', 'employee_id': admin.id, 'title': 'new', 'description': 'description', 'deadline': '2021-04-30T11:09:00Z'},
+        ]
+        response = self.api_client.post(reverse('api:tasks_batch'), {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual(Task.objects.count(), 0)
+        data = {'mode': 'best_effort', 'operations': operations}
+        response = self.api_client.post(reverse('api:tasks_batch'), data, format='json')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual([result['status'] for result in response.data['results']], ['ok', 'error'])
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_export_tasks(self):
+        """ test the tasks streaming export with employee and deadline filters
+        (request) -> 200 with the matching rows """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        other = User.objects.create(is_staff=False, username='other', password='password')
+        for day in (1, 10, 20):
+            Task.objects.create(employee=employee, title=f'task {day}', description='description', deadline=f'2021-03-{day:02d}T11:09:00Z')
+        Task.objects.create(employee=other, title='other', description='description', deadline='2021-03-10T11:09:00Z')
+        self.api_client.force_authenticate(user=admin)
+        params = {'employee': employee.id, 'deadline_after': '2021-03-05T00:00:00Z', 'deadline_before': '2021-03-15T00:00:00Z'}
+        response = self.api_client.get(reverse('api:export_tasks'), params)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,title,description,deadline,employee_id,employee')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('2021-03-10T11:09:00Z', lines[1])
+        response = self.api_client.get(reverse('api:export_tasks'), {'output': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['employee'], 'employee')
+
+    def test_employee_tasks_conditional_get(self):
+        """ test the employee tasks etag, not modified until a task changes
+        (request) -> 304 without the tasks query, then 200 """
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        Task.objects.create(employee=employee, title='task', description='description', deadline='2021-03-30T11:09:00Z')
+        self.api_client.force_authenticate(user=employee)
+        url = reverse('api:get_employee_tasks')
+        response = self.api_client.get(url)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(1):
+            response = self.api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Task.objects.create(employee=employee, title='new task', description='description', deadline='2021-03-30T11:09:00Z')
+        response = self.api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tasks_filters_and_ordering(self):
+        """ test the tasks deadline range, title prefix filters and deadline ordering
+        (request) -> 200 with the matching tasks, 400 for an invalid filter """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        for day, title in ((20, 'review code'), (10, 'review docs'), (5, 'deploy')):
+            Task.objects.create(employee=employee, title=title, description='description', deadline=f'2021-03-{day:02d}T11:09:00Z')
+        self.api_client.force_authenticate(user=admin)
+        params = {'title': 'review', 'deadline_after': '2021-03-01T00:00:00Z', 'ordering': '-deadline'}
+        response = self.api_client.get(self.get_tasks_url, params)
+        self.assertEqual([task['title'] for task in response.data['results']], ['review code', 'review docs'])
+        response = self.api_client.get(self.get_tasks_url, {'deadline_before': 'not a date'})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.api_client.force_authenticate(user=employee)
+        params = {'deadline_before': '2021-03-15T00:00:00Z', 'ordering': 'deadline'}
+        response = self.api_client.get(reverse('api:get_employee_tasks'), params)
+        self.assertEqual([task['title'] for task in response.json()], ['deploy', 'review docs'])
+
+    def test_tasks_sparse_fields(self):
+        """ test the tasks list fields and exclude parameters
+        (request) -> 200 with the kept fields only, the other columns not read, 400 for an unknown field """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        Task.objects.create(employee=employee, title='deploy', description='description', deadline='2021-03-05T11:09:00Z')
+        self.api_client.force_authenticate(user=admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api_client.get(self.get_tasks_url, {'fields': 'id,title'})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        self.assertFalse(any('"description"' in query['sql'] for query in queries.captured_queries))
+        response = self.api_client.get(self.get_tasks_url, {'fields': 'id,salary'})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.api_client.force_authenticate(user=employee)
+        response = self.api_client.get(reverse('api:get_employee_tasks'), {'exclude': 'description,employee'})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertNotIn('description', response.json()[0])
+        self.assertNotIn('employee', response.json()[0])
+        self.assertEqual(response.json()[0]['title'], 'deploy')
+
+    def test_task_indexes_query_plans(self):
+        """ test the tasks filters query plans use the task indexes """
+        output = io.StringIO()
+        call_command('check_task_indexes', stdout=output)
+        self.assertNotIn('MISSING', output.getvalue())
+
+    def test_tasks_dashboard(self):
+        """ test the per employee deadline buckets counts
+        (request) -> 200 with the overdue, due today and due this week counts """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        employee = User.objects.create(is_staff=False, username='employee', password='password')
+        now = timezone.now()
+        tomorrow, next_week = deadline_bounds(now)
+        deadlines = [now - timedelta(days=3), now - timedelta(minutes=1), now + (tomorrow - now) / 2, next_week + timedelta(days=1)]
+        for deadline in deadlines:
+            Task.objects.create(employee=employee, title='task', description='description', deadline=deadline)
+        self.api_client.force_authenticate(user=admin)
+        response = self.api_client.get(reverse('api:tasks_dashboard'))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['employees'], [{
+            'employee_id': employee.id,
+            'employee': 'employee',
+            'overdue': 2,
+            'due_today': 1,
+            'due_this_week': 1,
+        }])
+        with self.assertNumQueries(1):
+            self.api_client.get(reverse('api:tasks_dashboard'))
+
+
+# cached token authentication tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class TokenAuthenticationTestCase(APITestCase):
+    """ cached token authentication test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.is_admin_url = reverse('api:is_admin')
+        self.delete_employee_url = reverse('api:delete_employee')
+        self.employee = User.objects.create(username='employee', password='password')
+        self.token = Token.objects.create(user=self.employee)
+        self.api_client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_authentication(self):
+        """ test the token lookup is cached after the first request
+        (request) -> 200 without query """
+        response = self.api_client.get(self.is_admin_url)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.api_client.get(self.is_admin_url)
+            self.assertEqual(len(queries.captured_queries), 0)
+            self.assertEqual(response.json(), {'is_admin': False})
+
+    def test_other_process_invalidation(self):
+        """ test the cached entries are outdated by an invalidation made in another process
+        sharing the django cache (the signals clear that process token cache) -> 200 as admin, then 401 """
+        self.api_client.get(self.is_admin_url)
+        with mock.patch('api.authentication.token_cache', LRUTokenCache(100, 300, 'default')):
+            self.employee.is_staff = True
+            self.employee.save()
+        self.assertEqual(self.api_client.get(self.is_admin_url).json(), {'is_admin': True})
+        with mock.patch('api.authentication.token_cache', LRUTokenCache(100, 300, 'default')):
+            self.token.delete()
+        response = self.api_client.get(self.is_admin_url)
+        self.assertEqual(response.status_code, HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_invalidation(self):
+        """ test a deleted token (logout) is no longer accepted
+        (request) -> 401 """
+        self.api_client.get(self.is_admin_url)
+        self.token.delete()
+        response = self.api_client.get(self.is_admin_url)
+        self.assertEqual(response.status_code, HTTP_401_UNAUTHORIZED)
+
+    def test_user_changes_invalidation(self):
+        """ test the is_staff, is_active changes are seen immediately
+        (request) -> 200 as admin, then 401 once inactive """
+        self.api_client.get(self.is_admin_url)
+        self.employee.is_staff = True
+        self.employee.save()
+        response = self.api_client.get(self.is_admin_url)
+        self.assertEqual(response.json(), {'is_admin': True})
+        self.employee.is_active = False
+        self.employee.save()
+        response = self.api_client.get(self.is_admin_url)
+        self.assertEqual(response.status_code, HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_employee_invalidation(self):
+        """ test a deleted employee token is no longer accepted
+        (request) -> 401 """
+        Profil.objects.create(user=self.employee, salary=400)
+        self.api_client.get(self.is_admin_url)
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        admin_client = APIClient()
+        admin_client.force_authenticate(user=admin)
+        response = admin_client.delete(self.delete_employee_url, {'employee_id': self.employee.id})
+        self.assertEqual(response.status_code, HTTP_202_ACCEPTED)
+        response = self.api_client.get(self.is_admin_url)
+        self.assertEqual(response.status_code, HTTP_401_UNAUTHORIZED)
+
+
+# session bootstrap tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class SessionBootstrapTestCase(APITestCase):
+    """ session bootstrap end point test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.bootstrap_url = reverse('api:session_bootstrap')
+        self.employee = User.objects.create(username='employee', password='password')
+        Profil.objects.create(user=self.employee, salary=400)
+        for index in range(3):
+            Task.objects.create(employee=self.employee, title=f'task {index}', description='description', deadline=timezone.now())
+
+    def test_employee_bootstrap(self):
+        """ test the employee gets its user, roles and first tasks page, without the admin summary
+        (request) -> 200 in 2 queries """
+        self.api_client.force_authenticate(user=self.employee)
+        with self.assertNumQueries(2):
+            response = self.api_client.get(self.bootstrap_url, {'tasks_page_size': 2})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'employee')
+        self.assertEqual(response.data['roles'], {'is_admin': False, 'is_employee': True})
+        self.assertEqual([task['title'] for task in response.data['tasks']['results']], ['task 0', 'task 1'])
+        self.assertTrue(response.data['tasks']['has_more'])
+        self.assertNotIn('summary', response.data)
+
+    def test_admin_bootstrap_sections(self):
+        """ test the admin chooses the sections, an unknown section is refused
+        (request) -> 200 with the roles and summary only, then 400 """
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=admin)
+        with self.assertNumQueries(3):
+            response = self.api_client.get(self.bootstrap_url, {'include': 'roles,summary'})
+        self.assertEqual(set(response.data), {'roles', 'summary'})
+        self.assertEqual(response.data['summary'], {'employees': 1, 'tasks': 3, 'overdue_tasks': 3})
+        response = self.api_client.get(self.bootstrap_url, {'include': 'roles,salaries'})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+
+# delta sync tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class DeltaSyncTestCase(APITestCase):
+    """ tasks and profils delta sync test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.changes_url = reverse('api:changes')
+        self.employee = User.objects.create(username='employee', password='password')
+        self.profil = Profil.objects.create(user=self.employee, salary=400)
+        self.tasks = [
+            Task.objects.create(employee=self.employee, title=f'task {index}', description='description', deadline=timezone.now())
+            for index in range(3)
+        ]
+        self.api_client.force_authenticate(user=self.employee)
+
+    def test_changes_since_token(self):
+        """ test the employee gets its rows, then only its rows changed or deleted after the token
+        (request) -> 200 with the changes pages, then the changes only """
+        response = self.api_client.get(self.changes_url, {'page_size': 3})
+        self.assertEqual([(change['collection'], change['id']) for change in response.data['changes']], [
+            ('profil', self.profil.id), ('task', self.tasks[0].id), ('task', self.tasks[1].id),
+        ])
+        self.assertEqual(response.data['changes'][0]['data']['salary'], 400)
+        self.assertTrue(response.data['has_more'])
+        response = self.api_client.get(self.changes_url, {'since': response.data['next']})
+        self.assertEqual([change['id'] for change in response.data['changes']], [self.tasks[2].id])
+        self.assertFalse(response.data['has_more'])
+        token = response.data['next']
+
+        self.tasks[0].title = 'updated'
+        self.tasks[0].save(update_fields=['title'])
+        deleted_id = self.tasks[1].id
+        self.tasks[1].delete()
+        other = User.objects.create(username='other', password='password')
+        Task.objects.create(employee=other, title='other task', description='description', deadline=timezone.now())
+        response = self.api_client.get(self.changes_url, {'since': token})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.data['changes'], [
+            {'collection': 'task', 'id': self.tasks[0].id, 'deleted': False, 'data': response.data['changes'][0]['data']},
+            {'collection': 'task', 'id': deleted_id, 'deleted': True},
+        ])
+        self.assertEqual(response.data['changes'][0]['data']['title'], 'updated')
+        response = self.api_client.get(self.changes_url, {'since': response.data['next']})
+        self.assertEqual(response.data['changes'], [])
+
+    def test_reassigned_tasks_and_expired_token(self):
+        """ test the tasks reassigned away are deleted for the employee, a token older than the
+        pruned tombstones needs a full sync
+        (request) -> 200 with the tombstones, then 410 """
+        token = self.api_client.get(self.changes_url).data['next']
+        other = User.objects.create(username='other', password='password')
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        admin_client = APIClient()
+        admin_client.force_authenticate(user=admin)
+        operations = [{'op': 'reassign', 'from_employee_id': self.employee.id, 'to_employee_id': other.id}]
+        admin_client.post(reverse('api:tasks_batch'), {'operations': operations}, format='json')
+        response = self.api_client.get(self.changes_url, {'since': token})
+        self.assertEqual([change['deleted'] for change in response.data['changes']], [True, True, True])
+        call_command('prune_tombstones', '--days', '-1', stdout=io.StringIO())
+        response = self.api_client.get(self.changes_url, {'since': token})
+        self.assertEqual(response.status_code, HTTP_410_GONE)
+        response = self.api_client.get(self.changes_url, {'collections': 'task'})
+        self.assertEqual(response.data['changes'], [])
+
+    def test_changes_lookback_window(self):
+        """ test the changes of the look-back window are sent again, a stamp committed after a
+        newer sent one is not missed, the window moves once the changes are older
+        (changes_since) -> the window changes again with the late one, then none """
+        changes, position, _ = changes_since(self.employee, ('task',), (0, 0, 0), 10, lookback=10)
+        self.assertEqual([change['id'] for change in changes], [task.id for task in self.tasks])
+        self.assertEqual(position[2], 0)
+        # stamp reserved before the last sent one, committed after the sync
+        late = Task.objects.create(employee=self.employee, title='late', description='description', deadline=timezone.now())
+        Task.objects.filter(id=late.id).update(change_stamp=self.tasks[1].change_stamp)
+        changes, position, _ = changes_since(self.employee, ('task',), position, 10, lookback=10)
+        self.assertEqual(sorted(change['id'] for change in changes), sorted([late.id, *(task.id for task in self.tasks)]))
+        Task.objects.update(changed_at=timezone.now() - timedelta(minutes=1))
+        changes, position, _ = changes_since(self.employee, ('task',), position, 10, lookback=10)
+        self.assertEqual(position[2], position[0])
+        changes, position, _ = changes_since(self.employee, ('task',), position, 10, lookback=10)
+        self.assertEqual(changes, [])
+
+
+# tasks events tests, the events are published once the transactions are committed
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class TaskEventsTestCase(TransactionTestCase):
+    """ tasks events stream test case """
+    def setUp(self):
+        """ base setup values """
+        self.employee = User.objects.create(username='employee', password='password')
+        self.token = Token.objects.create(user=self.employee)
+
+    def stream(self, query_string, action):
+        """ run the events stream until `action` result is sent, return the sent messages """
+        scope = {'type': 'http', 'path': '/api/events', 'headers': [], 'query_string': query_string.encode()}
+        sent = []
+        async def scenario():
+            disconnected = asyncio.Event()
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+            async def send(message):
+                sent.append(message)
+                if b'event:' in message.get('body', b'') or message.get('status', 200) != 200:
+                    disconnected.set()
+            stream = asyncio.ensure_future(task_events(scope, receive, send))
+            while not sent:
+                await asyncio.sleep(0.01)
+            await sync_to_async(action)()
+            await asyncio.wait_for(stream, 5)
+        async_to_sync(scenario)()
+        return sent
+
+    def test_task_created_event(self):
+        """ test the employee stream receives its new task
+        (request) -> 200 event stream with the task.created event """
+        other = User.objects.create(username='other', password='password')
+        def assign():
+            Task.objects.create(employee=other, title='other task', description='description', deadline=timezone.now())
+            return Task.objects.create(employee=self.employee, title='task', description='description', deadline=timezone.now())
+        sent = self.stream(f'token={self.token.key}', assign)
+        self.assertEqual(sent[0]['status'], 200)
+        events = [message['body'] for message in sent[1:] if message['body'].startswith(b'event:')]
+        self.assertEqual(len(events), 1)
+        self.assertIn(b'event: task.created', events[0])
+        self.assertIn(f'"task_id": {Task.objects.get(employee=self.employee).id}'.encode(), events[0])
+
+    def test_invalid_token(self):
+        """ test the stream refuses an unknown token
+        (request) -> 401 """
+        sent = self.stream('token=unknown', lambda: None)
+        self.assertEqual(sent[0]['status'], 401)
+
+    def test_revoked_token_stream(self):
+        """ test the stream ends at the next heartbeat once its token is deleted
+        (request) -> 200 event stream closed after the token revocation """
+        with mock.patch('api.streams.HEARTBEAT_INTERVAL', 0.05):
+            sent = self.stream(f'token={self.token.key}', self.token.delete)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual((sent[-1]['body'], sent[-1]['more_body']), (b': token revoked\n\n', False))
+
+    def test_prune_events_job(self):
+        """ test the pruning job deletes the expired events only and queues its next run """
+        expired = Event.objects.create(channel='task:1', payload={'task_id': 1})
+        Event.objects.filter(id=expired.id).update(created_at=timezone.now() - timedelta(hours=2))
+        kept = Event.objects.create(channel='task:1', payload={'task_id': 2})
+        schedule_events_pruning()
+        schedule_events_pruning()
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(list(Event.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(Job.objects.get(status=Job.DONE).result, {'deleted': 1})
+        self.assertGreater(Job.objects.get(name='prune_events', status=Job.QUEUED).run_at, timezone.now())
+
+    def test_database_broker_late_commit(self):
+        """ test the database broker polling dispatches an event committed after a newer id """
+        broker = DatabaseBroker(poll_interval=0.01)
+        Event.objects.create(id=10, channel='task:1', payload={'task_id': 2})
+        last, seen = broker.position()
+        self.assertEqual((last, set(seen)), (10, {10}))
+        Event.objects.create(id=5, channel='task:1', payload={'task_id': 1})
+        Event.objects.create(id=11, channel='task:1', payload={'task_id': 3})
+        events = broker.events_after(last, seen)
+        self.assertEqual([(event_id, payload) for event_id, _, payload, _ in events], [(5, {'task_id': 1}), (11, {'task_id': 3})])
+        seen.update((event_id, created_at) for event_id, _, _, created_at in events)
+        self.assertEqual(broker.events_after(11, seen), [])
+
+    def test_database_broker(self):
+        """ test the database broker delivers the events stored by any process """
+        broker = DatabaseBroker(poll_interval=0.01)
+        async def scenario():
+            subscription = broker.subscribe('task:1')
+            await asyncio.sleep(0.05)
+            await sync_to_async(broker.publish)('task:2', {'type': 'task.created', 'task_id': 1})
+            await sync_to_async(broker.publish)('task:1', {'type': 'task.created', 'task_id': 2})
+            event = await asyncio.wait_for(subscription.get(), 5)
+            subscription.close()
+            return event
+        self.assertEqual(async_to_sync(scenario)(), {'type': 'task.created', 'task_id': 2})
+
+
+# async read views tests, the views run on the database threads pool (own connections)
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class AsyncViewsTestCase(TransactionTestCase):
+    """ async read views test case """
+    def test_async_employee_tasks(self):
+        """ test the async view answers the sync view response, for concurrent requests
+        (request) -> 200 with the same content """
+        employee = User.objects.create(username='employee', password='password')
+        for index in range(3):
+            Task.objects.create(employee=employee, title=f'task {index}', description='description', deadline=timezone.now())
+        factory = APIRequestFactory()
+        def request():
+            request = factory.get(reverse('api:get_employee_tasks'))
+            force_authenticate(request, user=employee)
+            return request
+        expected = GetEmployeeTasks.as_view()(request()).render().content
+        view = async_view(GetEmployeeTasks.as_view())
+        async def concurrent_requests():
+            return await asyncio.gather(*(view(request()) for _ in range(8)))
+        for response in async_to_sync(concurrent_requests)():
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertEqual(response.content, expected)
+
+
+    def test_async_view_instrumentation(self):
+        """ test the queries of an async view, run on the database threads, are recorded by the instrumentation """
+        employee = User.objects.create(username='employee', password='password')
+        Task.objects.create(employee=employee, title='task', description='description', deadline=timezone.now())
+        request = APIRequestFactory().get(reverse('api:changes'))
+        force_authenticate(request, user=employee)
+        view = async_view(ChangesView.as_view())
+        async def get_response(request):
+            return await view(request)
+        response = async_to_sync(InstrumentationMiddleware(get_response))(request)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertIn('serializer', view_stats.recent[-1]['phases'])
+        self.assertGreater(view_stats.recent[-1]['db_queries'], 0)
+
+
+# values() list serializers tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class ValuesSerializersTestCase(APITestCase):
+    """ values() rows list serializers test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.admin = User.objects.create(is_staff=True, username='admin', password='password')
+        for index in range(3):
+            employee = User.objects.create(username=f'employee {index}', password='password', email=f'employee{index}@example.com')
+            Profil.objects.create(user=employee, salary=400 + index, picture=f'pictures/ab/ab{index}.jpg' if index else '', picture_processed=index == 2)
+            Task.objects.create(employee=employee, title=f'task {index}', description='description', deadline=f'2021-03-0{index + 1}T11:09:00.12345{index}Z')
+        Token.objects.create(user=employee)
+        User.objects.filter(id=employee.id).update(last_login=timezone.now())
+
+    def assertSameRendering(self, serializer_class, queryset, fields=None):
+        """ assert the values() serializer renders the model serializer bytes """
+        values_serializer = VALUES_SERIALIZERS[serializer_class]
+        expected = serializer_class(serializer_class.sparse_queryset(queryset, fields), many=True, fields=fields).data
+        data = values_serializer(values_serializer.sparse_queryset(queryset, fields), many=True, fields=fields).data
+        self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_values_serializers_output(self):
+        """ test the values() serializers output is the model serializers output, for some fields,
+        every field and another timezone """
+        employees = User.objects.filter(profil__isnull=False).order_by('id')
+        tasks = Task.objects.order_by('id')
+        for fields in (None, ['id', 'pictures', 'auth_token'], ['username', 'last_login']):
+            self.assertSameRendering(UserSerializer, employees, fields)
+        for fields in (None, ['deadline', 'employee']):
+            self.assertSameRendering(TaskSerializer, tasks, fields)
+        with timezone.override('America/New_York'):
+            self.assertSameRendering(TaskSerializer, tasks)
+            self.assertSameRendering(UserSerializer, employees)
+
+    def test_values_list_end_points(self):
+        """ test the tasks list end point answers the same bytes with the values() serializers
+        (request) -> same content, the cursor included """
+        self.api_client.force_authenticate(user=self.admin)
+        params = {'page_size': 2, 'ordering': '-deadline'}
+        response = self.api_client.get(reverse('api:get_tasks'), params)
+        with self.settings(VALUES_LIST_SERIALIZERS=False):
+            expected = self.api_client.get(reverse('api:get_tasks'), params)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+# json rendering and compression tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class RenderingTestCase(APITestCase):
+    """ json renderer and responses compression test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.employee = User.objects.create(username='employee', password='password')
+        Task.objects.bulk_create(
+            Task(employee=self.employee, title=f'task {index}', description='description', deadline=timezone.now())
+            for index in range(50)
+        )
+        self.api_client.force_authenticate(user=self.admin)
+
+    def test_fast_json_renderer_output(self):
+        """ test the fast json renderer renders the rest framework renderer bytes """
+        moment = datetime(2021, 3, 5, 11, 9, 0, 123450)
+        data = {
+            'utc': timezone.make_aware(moment, timezone.utc),
+            'offset': timezone.make_aware(moment, pytz.timezone('America/New_York')),
+            'naive': moment,
+            'date': moment.date(),
+            'decimal': Decimal('10.5'),
+            'lazy': gettext_lazy('This field is required.'),
+            'separators': 'line\u2028paragraph\u2029',
+            1: [None, True, 1.5, 'é'],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=4'), JSONRenderer().render(data, 'application/json; indent=4'))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_negotiated_compression(self):
+        """ test the responses are compressed with the negotiated encoding above the size threshold
+        (request) -> gzip or identity content """
+        expected = self.api_client.get(reverse('api:get_tasks')).content
+        response = self.api_client.get(reverse('api:get_tasks'), HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), expected)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+        response = self.api_client.get(reverse('api:get_tasks'), HTTP_ACCEPT_ENCODING='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.api_client.get(reverse('api:get_tasks'), {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        with override_settings(RESPONSE_COMPRESSION={'MIN_SIZE': 1}):
+            response = self.api_client.get(reverse('api:get_tasks'), {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        response = self.api_client.get(reverse('api:export_tasks'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode().count('task '), 50)
+
+    @skipUnless(importlib.util.find_spec('brotli'), 'brotli is not installed')
+    def test_brotli_compression(self):
+        """ test brotli is preferred at equal qualities
+        (request) -> brotli content """
+        import brotli
+        expected = self.api_client.get(reverse('api:get_tasks')).content
+        response = self.api_client.get(reverse('api:get_tasks'), HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), expected)
+
+
+# requests instrumentation tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class InstrumentationTestCase(APITestCase):
+    """ per request instrumentation middleware test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.token = Token.objects.create(user=self.admin)
+        employee = User.objects.create(username='employee', password='password')
+        for index in range(3):
+            Task.objects.create(employee=employee, title=f'task {index}', description='description', deadline=timezone.now())
+        self.api_client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        view_stats.clear()
+
+    def test_server_timing_and_view_stats(self):
+        """ test the responses Server-Timing header and the per view stats end point
+        (request) -> timings of the sql queries, auth, serializer and render phases """
+        response = self.api_client.get(reverse('api:get_tasks'))
+        timings = {timing.split(';')[0]: timing for timing in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(timings), {'total', 'db', 'auth', 'serializer', 'render'})
+        self.assertRegex(timings['db'], r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+        response = self.api_client.get(reverse('api:instrumentation'))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        stats = response.json()['views']['GetTasksView']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['avg_db_queries'], 0)
+        self.assertGreater(stats['avg_response_bytes'], 0)
+        self.assertIn('avg_serializer_ms', stats)
+        record = response.json()['recent'][0]
+        self.assertEqual((record['url_name'], record['status']), ('api:get_tasks', 200))
+        self.api_client.credentials()
+        self.api_client.force_authenticate(user=User.objects.get(username='employee'))
+        self.assertEqual(self.api_client.get(reverse('api:instrumentation')).status_code, HTTP_403_FORBIDDEN)
+        # the timings are not sent to the other users, unless asked with the profile key
+        self.assertFalse(self.api_client.get(reverse('api:get_employee_tasks')).has_header('Server-Timing'))
+        with self.settings(INSTRUMENTATION={'PROFILE_KEY': 'secret'}):
+            response = self.api_client.get(reverse('api:get_employee_tasks'), HTTP_X_PROFILE='wrong')
+            self.assertFalse(response.has_header('Server-Timing'))
+            response = self.api_client.get(reverse('api:get_employee_tasks'), HTTP_X_PROFILE='secret')
+            self.assertTrue(response.has_header('Server-Timing'))
+
+    def test_profiled_requests(self):
+        """ test the requests with the profile header and key are profiled and dumped to the profiles directory
+        (request) -> profile of the request in the stats """
+        with tempfile.TemporaryDirectory() as folder:
+            options = {'PROFILE_KEY': 'secret', 'PROFILE_DIR': folder}
+            with self.settings(INSTRUMENTATION=options):
+                self.api_client.get(reverse('api:get_tasks'), HTTP_X_PROFILE='wrong')
+                self.api_client.get(reverse('api:get_tasks'), HTTP_X_PROFILE='secret')
+                profiles = self.api_client.get(reverse('api:instrumentation')).json()['profiles']
+            self.assertEqual(len(profiles), 1)
+            self.assertIn('get', profiles[0]['profile']['top'])
+            self.assertEqual(os.listdir(folder), [os.path.basename(profiles[0]['profile']['file'])])
+        with self.settings(INSTRUMENTATION={'PROFILE_SAMPLE_RATE': 1.0}):
+            self.api_client.get(reverse('api:get_tasks'))
+        self.assertEqual(len(view_stats.profiles), 2)
+
+# metrics tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class MetricsTestCase(APITestCase):
+    """ prometheus metrics end point test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.token = Token.objects.create(user=self.admin)
+        for index in range(3):
+            Task.objects.create(employee=self.admin, title=f'task {index}', description='description', deadline=timezone.now())
+        self.api_client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        metrics_settings = override_settings(METRICS={'DIRECTORY': self.folder.name})
+        metrics_settings.enable()
+        self.addCleanup(metrics_settings.disable)
+        metrics_store.clear()
+
+    def metrics(self):
+        """ metrics end point samples by name and labels """
+        response = self.api_client.get(reverse('api:metrics'))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return dict(
+            line.rsplit(' ', 1) for line in response.content.decode().splitlines() if not line.startswith('#')
+        )
+
+    def test_requests_and_caches_metrics(self):
+        """ test the per url name requests, latency and sql queries histograms and the caches hit ratios
+        (requests) -> counted requests, observed durations and queries, lookups hits and misses """
+        self.api_client.get(reverse('api:get_tasks'))
+        self.api_client.get(reverse('api:get_employee_tasks'))
+        self.api_client.get(reverse('api:get_employee_tasks'))
+        self.api_client.post(reverse('api:add_task'), {}, format='json')
+        samples = self.metrics()
+        self.assertEqual(samples['http_requests_total{url_name="api:get_tasks",method="GET",status="200"}'], '1')
+        self.assertEqual(samples['http_requests_total{url_name="api:get_employee_tasks",method="GET",status="200"}'], '2')
+        self.assertEqual(samples['http_requests_total{url_name="api:add_task",method="POST",status="400"}'], '1')
+        self.assertEqual(samples['http_request_duration_seconds_bucket{url_name="api:get_tasks",le="+Inf"}'], '1')
+        self.assertEqual(samples['http_request_duration_seconds_count{url_name="api:get_employee_tasks"}'], '2')
+        self.assertEqual(samples['db_queries_per_request_bucket{url_name="api:get_tasks",le="0"}'], '0')
+        self.assertGreater(int(samples['db_queries_per_request_sum{url_name="api:get_tasks"}']), 0)
+        self.assertIn('db_query_duration_seconds_sum{url_name="api:get_tasks"}', samples)
+        self.assertEqual(samples['cache_requests_total{cache="response",view="GetEmployeeTasks",result="hit"}'], '1')
+        self.assertEqual(samples['cache_hit_ratio{cache="response",view="GetEmployeeTasks"}'], '0.5')
+        self.assertIn('cache_hit_ratio{cache="token",view=""}', samples)
+        self.api_client.credentials()
+        self.api_client.force_authenticate(user=User.objects.create(username='employee', password='password'))
+        self.assertEqual(self.api_client.get(reverse('api:metrics')).status_code, HTTP_403_FORBIDDEN)
+
+    def test_several_workers_without_directory(self):
+        """ test the end point refuses the metrics of one worker when several serve the requests
+        (request) -> 503 without directory, 200 with a single worker """
+        with override_settings(METRICS={'DIRECTORY': None, 'WORKERS': 2}):
+            response = self.api_client.get(reverse('api:metrics'))
+            self.assertEqual(response.status_code, HTTP_503_SERVICE_UNAVAILABLE)
+        with override_settings(METRICS={'DIRECTORY': None, 'WORKERS': 1}):
+            self.assertEqual(self.api_client.get(reverse('api:metrics')).status_code, HTTP_200_OK)
+
+    def test_processes_files_aggregation(self):
+        """ test the metrics of the running and exited processes files are summed, the exited ones archived
+        (processes files) -> summed requests, archived exited files """
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+        values = [['http_requests_total', ['api:get_tasks', 'GET', '200'], 5]]
+        for pid in (os.getppid(), exited.pid):
+            with open(os.path.join(self.folder.name, f'{pid}-worker.json'), 'w') as output:
+                json.dump(values, output)
+        self.api_client.get(reverse('api:get_tasks'))
+        metrics_store.flush()
+        key = 'http_requests_total{url_name="api:get_tasks",method="GET",status="200"}'
+        self.assertEqual(self.metrics()[key], '11')
+        self.assertEqual(
+            sorted(os.listdir(self.folder.name)),
+            sorted(['archive.json', 'archive.lock', f'{os.getppid()}-worker.json', os.path.basename(metrics_store.path)])
+        )
+        self.assertEqual(self.metrics()[key], '11')
+
+# responses cache tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class ResponseCacheTestCase(APITestCase):
+    """ read end points responses cache test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.get_user_url = reverse('api:get_user')
+        self.employee = User.objects.create(username='employee', password='password')
+        self.profil = Profil.objects.create(user=self.employee, salary=400)
+        self.api_client.force_authenticate(user=self.employee)
+
+    def test_cached_user_invalidated_by_profil_change(self):
+        """ test the authenticated user response is served from the cache until the profil changes
+        (request) -> cached response, then the new salary """
+        self.api_client.get(self.get_user_url)
+        with self.assertNumQueries(1):
+            response = self.api_client.get(self.get_user_url)
+        self.assertEqual(response.json()['profil'], '400')
+        self.profil.salary = 500
+        self.profil.save()
+        response = self.api_client.get(self.get_user_url)
+        self.assertEqual(response.json()['profil'], '500')
+
+    def test_cache_stats(self):
+        """ test the cache hits and misses are reported to the admins
+        (request) -> 200 with the view counters """
+        self.api_client.get(self.get_user_url)
+        self.api_client.get(self.get_user_url)
+        admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=admin)
+        response = self.api_client.get(reverse('api:cache_stats'))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertGreaterEqual(response.data['views']['GetAuthenticatedUser']['hits'], 1)
+        self.assertGreaterEqual(response.data['views']['GetAuthenticatedUser']['misses'], 1)
+
+
+# benchmark rows and end points suite tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class BenchmarkTestCase(LiveServerTestCase):
+    """ seed_bench rows generator and bench_endpoints suite test case """
+
+    def seeded_rows(self):
+        """ the generated employees salaries and tasks """
+        employees = User.objects.filter(username__startswith='bench_', is_staff=False).order_by('username')
+        return (
+            list(employees.values_list('username', 'email', 'profil__salary')),
+            list(Task.objects.filter(employee__in=employees).order_by('employee__username', 'id').values_list('title', 'deadline')),
+        )
+
+    def test_seed_bench_rows(self):
+        """ test the benchmark rows counts, the tasks spread, the same rows for the same seed and
+        random credentials, the command refused without DEBUG or --force """
+        with self.assertRaises(CommandError):
+            call_command('seed_bench', employees=1, tasks=1, stdout=io.StringIO())
+        self.assertFalse(User.objects.exists())
+        call_command('seed_bench', employees=20, tasks=101, seed=7, batch_size=8, base_date=datetime(2021, 3, 1).date(), force=True, stdout=io.StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='bench_', profil__isnull=False).count(), 20)
+        self.assertEqual(Task.objects.count(), 101)
+        self.assertEqual(Task.objects.filter(employee__username='bench_0').count(), 6)
+        self.assertEqual(Task.objects.filter(employee__username='bench_19').count(), 5)
+        self.assertTrue(Token.objects.filter(user__username='bench_admin', user__is_staff=True).exists())
+        self.assertFalse(User.objects.get(username='bench_admin').check_password('bench'))
+        self.assertFalse(User.objects.get(username='bench_0').has_usable_password())
+        self.assertEqual(self.api_client_summary()['headcount'], 20)
+        rows, tokens = self.seeded_rows(), set(Token.objects.values_list('key', flat=True))
+        User.objects.filter(username__startswith='bench_').delete()
+        call_command('seed_bench', employees=20, tasks=101, seed=7, batch_size=5, base_date=datetime(2021, 3, 1).date(), force=True, stdout=io.StringIO())
+        self.assertEqual(self.seeded_rows(), rows)
+        self.assertFalse(tokens & set(Token.objects.values_list('key', flat=True)))
+        with self.assertRaises(CommandError):
+            call_command('seed_bench', employees=1, tasks=1, force=True, stdout=io.StringIO())
+
+    def api_client_summary(self):
+        """ payroll summary of the seeded admin """
+        api_client = APIClient()
+        api_client.force_authenticate(user=User.objects.get(username='bench_admin'))
+        return api_client.get(reverse('api:payroll_summary')).json()
+
+    def test_bench_endpoints_suite(self):
+        """ test the suite loads every api url and reports their throughput and latency as json """
+        call_command('seed_bench', employees=10, tasks=50, force=True, stdout=io.StringIO())
+        output = io.StringIO()
+        call_command('bench_endpoints', url=self.live_server_url, duration=0.1, connections=1, stdout=output, stderr=io.StringIO())
+        results = json.loads(output.getvalue())
+        self.assertEqual(set(results['endpoints']), {pattern.name for pattern in api_urls.urlpatterns})
+        self.assertEqual(results['run']['tasks'], 50)
+        for name, summary in results['endpoints'].items():
+            self.assertGreater(summary['requests'], 0, name)
+            self.assertEqual(summary['errors'], 0, name)
+            self.assertTrue(all(status.startswith('2') for status in summary['statuses']), (name, summary['statuses']))
+            self.assertIsNotNone(summary['p99_ms'])
+
+
+# background jobs tests
+@override_settings(QUERY_BUDGET_MODE='raise', PICTURE_PROCESSING='sync')
+class JobTestCase(APITestCase):
+    """ background jobs test case """
+    def setUp(self):
+        """ base setup values """
+        self.api_client = APIClient()
+        self.admin = User.objects.create(is_staff=True, username='admin', password='password')
+        self.api_client.force_authenticate(user=self.admin)
+
+    def test_background_bulk_import(self):
+        """ test the background employees import is queued then run by a worker
+        (request) -> 202 with the job status url, then the job report """
+        rows = 'username,password,salary\nlay,password,300\n'
+        data = {'file': SimpleUploadedFile('employees.csv', rows.encode()), 'background': True}
+        response = self.api_client.post(reverse('api:bulk_add_employees'), data)
+        self.assertEqual(response.status_code, HTTP_202_ACCEPTED)
+        self.assertFalse(User.objects.filter(username='lay').exists())
+        self.assertEqual(run_pending_jobs(), 1)
+        response = self.api_client.get(response.data['status_url'])
+        self.assertEqual(response.data['status'], Job.DONE)
+        self.assertEqual(response.data['result']['created'], 1)
+        self.assertTrue(User.objects.filter(username='lay').exists())
+
+    def test_job_retries(self):
+        """ test a failing job is retried until its last attempt then failed """
+        job('always_failing', max_attempts=2)(lambda: 1 / 0)
+        self.addCleanup(JOBS.pop, 'always_failing')
+        failing = enqueue('always_failing')
+        run_pending_jobs()
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), (Job.QUEUED, 1))
+        Job.objects.filter(id=failing.id).update(run_at=timezone.now())
+        run_pending_jobs()
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), (Job.FAILED, 2))
+        self.assertIn('ZeroDivisionError', failing.error)
+        response = self.api_client.get(reverse('api:job_metrics'))
+        self.assertEqual(response.data['depth'][Job.FAILED], 1)
+
+    def test_stale_jobs(self):
+        """ test the jobs lost by a crashed worker are queued again, failed at their last attempt """
+        started_at = timezone.now() - timedelta(hours=2)
+        lost, crashing, running = (
+            Job.objects.create(name='generate_picture_variants', payload={}, max_attempts=3, attempts=attempts,
+                               status=Job.RUNNING, run_at=started, started_at=started)
+            for attempts, started in ((1, started_at), (3, started_at), (1, timezone.now()))
+        )
+        self.assertEqual(requeue_stale_jobs(timedelta(hours=1)), (1, 1))
+        for instance in (lost, crashing, running):
+            instance.refresh_from_db()
+        self.assertEqual((lost.status, lost.attempts), (Job.QUEUED, 1))
+        self.assertEqual((crashing.status, crashing.attempts), (Job.FAILED, 3))
+        self.assertIn('lost', crashing.error)
+        self.assertEqual(running.status, Job.RUNNING)
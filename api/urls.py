@@ -1,21 +1,35 @@
 from django.urls import path
 from . import views
+from .asyncviews import read_view
 
 app_name = "api"
 
 urlpatterns = [
-    path('is-admin/', views.UserIsAnAdminView.as_view(), name='is_admin'),
-    path('user/', views.GetAuthenticatedUser.as_view(), name='get_user'),
-    path('employees', views.GetEmployeesView.as_view(), name='get_employees'),
+    path('is-admin/', read_view(views.UserIsAnAdminView.as_view()), name='is_admin'),
+    path('user/', read_view(views.GetAuthenticatedUser.as_view()), name='get_user'),
+    path('bootstrap', read_view(views.SessionBootstrapView.as_view()), name='session_bootstrap'),
+    path('employees', read_view(views.GetEmployeesView.as_view()), name='get_employees'),
     path('employees/add', views.AddNewEmployeeView.as_view(), name='add_employee'),
+    path('employees/payroll', read_view(views.PayrollSummaryView.as_view()), name='payroll_summary'),
+    path('employees/export', views.ExportEmployeesView.as_view(), name='export_employees'),
+    path('employees/bulk', views.BulkAddEmployeesView.as_view(), name='bulk_add_employees'),
     path('employees/update', views.UpdateEmployeeView.as_view(), name='update_employee'),
     path('employees/delete', views.DeleteEmployeeView.as_view(), name='delete_employee'),
 
-    path('tasks', views.GetTasksView.as_view(), name='get_tasks'),
+    path('tasks', read_view(views.GetTasksView.as_view()), name='get_tasks'),
     path('tasks/add', views.AddNewTaskView.as_view(), name='add_task'),
     path('tasks/update', views.UpdateTaskView.as_view(), name='update_task'),
     path('tasks/delete', views.DeleteTaskView.as_view(), name='delete_task'),
-    path('employee/tasks', views.GetEmployeeTasks.as_view(), name='get_employee_tasks'),
+    path('tasks/export', views.ExportTasksView.as_view(), name='export_tasks'),
+    path('tasks/dashboard', read_view(views.TasksDashboardView.as_view()), name='tasks_dashboard'),
+    path('tasks/batch', views.TasksBatchView.as_view(), name='tasks_batch'),
+    path('employee/tasks', read_view(views.GetEmployeeTasks.as_view()), name='get_employee_tasks'),
+    path('changes', read_view(views.ChangesView.as_view()), name='changes'),
+    path('jobs/metrics', views.JobMetricsView.as_view(), name='job_metrics'),
+    path('jobs/<int:pk>', views.JobStatusView.as_view(), name='job_status'),
+    path('cache/stats', views.ResponseCacheStatsView.as_view(), name='cache_stats'),
+    path('instrumentation', views.InstrumentationView.as_view(), name='instrumentation'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     
     path('profil/<int:pk>', views.UserProfilView.as_view(), name='user_profil')
 ]
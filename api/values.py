@@ -0,0 +1,114 @@
+from operator import itemgetter
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.settings import api_settings, ISO_8601
+from .instrumentation import timed
+from .pictures import stored_picture_urls
+from .serializers import UserSerializer, TaskSerializer
+
+
+def datetime_converter():
+    """ DateTimeField representation of the values, the iso format in the current timezone
+        is built directly, other formats go through the rest framework field """
+    field = serializers.DateTimeField()
+    output_timezone = field.default_timezone()
+    if api_settings.DATETIME_FORMAT is None or api_settings.DATETIME_FORMAT.lower() != ISO_8601 or output_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        value = value.astimezone(output_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def column(name, converter=None):
+    """ field read from one column, its non null values converted by the `converter` factory result """
+    def compile():
+        if converter is None:
+            return itemgetter(name)
+        convert = converter()
+        return lambda row: None if row[name] is None else convert(row[name])
+    return (name,), compile
+
+
+def pictures(name, processed):
+    """ picture urls field read from the picture name and processed columns """
+    def compile():
+        return lambda row: stored_picture_urls(row[name], row[processed])
+    return (name, processed), compile
+
+
+class ValuesSerializer:
+    """ read only list serializer of values() rows, same output as its model serializer
+        (`serializer_class`) without the fields machinery nor the model instances,
+        `columns` maps every serializer field to its columns and compiled converter """
+    serializer_class = None
+    columns = {}
+
+    def __init__(self, rows, many=True, fields=None):
+        self.rows = rows
+        self.getters = [
+            (name, self.columns[name][1]())
+            for name in (self.serializer_class.Meta.fields if fields is None else fields)
+        ]
+
+    @classmethod
+    def requested_fields(cls, query_params):
+        """ the fields kept by the `fields` and `exclude` query parameters """
+        return cls.serializer_class.requested_fields(query_params)
+
+    @classmethod
+    def sparse_queryset(cls, queryset, fields, columns=('id',)):
+        """ values() queryset of the fields columns (and the given columns, the pagination ordering) """
+        names = cls.serializer_class.Meta.fields if fields is None else fields
+        columns = {*columns, *(column for name in names for column in cls.columns[name][0])}
+        return queryset.values(*sorted(columns))
+
+    @property
+    def data(self):
+        getters = self.getters
+        with timed('serializer'):
+            return [{name: get(row) for name, get in getters} for row in self.rows]
+
+
+class UserValuesSerializer(ValuesSerializer):
+    """ UserSerializer of values() rows """
+    serializer_class = UserSerializer
+    columns = {
+        'id': column('id'),
+        'username': column('username'),
+        'email': column('email'),
+        'profil': column('profil__salary', lambda: str),
+        'pictures': pictures('profil__picture', 'profil__picture_processed'),
+        'version': column('profil__version'),
+        'date_joined': column('date_joined', datetime_converter),
+        'last_login': column('last_login', datetime_converter),
+        'is_staff': column('is_staff'),
+        'auth_token': column('auth_token__key'),
+    }
+
+
+class TaskValuesSerializer(ValuesSerializer):
+    """ TaskSerializer of values() rows """
+    serializer_class = TaskSerializer
+    columns = {
+        'id': column('id'),
+        'title': column('title'),
+        'description': column('description'),
+        'deadline': column('deadline', datetime_converter),
+        'employee': column('employee__username'),
+        'version': column('version'),
+    }
+
+
+VALUES_SERIALIZERS = {
+    UserSerializer: UserValuesSerializer,
+    TaskSerializer: TaskValuesSerializer,
+}
+
+
+def list_serializer(serializer_class):
+    """ serializer of the list end points, the values() one when VALUES_LIST_SERIALIZERS is set """
+    if getattr(settings, 'VALUES_LIST_SERIALIZERS', False):
+        return VALUES_SERIALIZERS.get(serializer_class, serializer_class)
+    return serializer_class
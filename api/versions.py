@@ -0,0 +1,155 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from .models import CollectionVersion
+
+TASKS = 'task'
+PROFILS = 'profil'
+USERS = 'user'
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_versions():
+    """ collect the versions bumps of the block (cascade deletes send one signal
+        per row) and bump each collection once at the block exit """
+    if getattr(_deferred, 'names', None) is not None:
+        yield
+        return
+    _deferred.names = set()
+    try:
+        yield
+    finally:
+        names, _deferred.names = _deferred.names, None
+        if names:
+            bump_versions(*sorted(names))
+
+
+def bump_versions(*names):
+    """ increment the collections versions, to call after every write """
+    deferred = getattr(_deferred, 'names', None)
+    if deferred is not None:
+        deferred.update(names)
+        return
+    now = timezone.now()
+    for name in names:
+        updated = CollectionVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    CollectionVersion.objects.create(name=name, version=1, updated_at=now)
+            except IntegrityError:
+                CollectionVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now)
+
+
+def own(collection):
+    """ scope of the authenticated user rows of a collection (tasks of the employee...) """
+    def scope(request):
+        return f'{collection}:{request.user.pk}'
+    return scope
+
+
+def resolve_scopes(request, scopes):
+    """ return the versions names of the scopes, collections names or request functions """
+    return tuple(scope(request) if callable(scope) else scope for scope in scopes)
+
+
+def get_versions(request, names):
+    """ return the collections {name: (version, updated_at)}, fetched in one query,
+        memoized on the request for the etag, last modified and cache functions """
+    known = getattr(request, '_collection_versions', None)
+    if known is None:
+        known = request._collection_versions = {}
+    missing = [name for name in names if name not in known]
+    if missing:
+        known.update({name: (0, None) for name in missing})
+        for name, version, updated_at in CollectionVersion.objects.filter(name__in=missing).values_list(
+            'name', 'version', 'updated_at'
+        ):
+            known[name] = (version, updated_at)
+    return {name: known[name] for name in names}
+
+
+def version_tokens(versions):
+    """ key parts of the versions, the update date guards against reused counters
+        (restored database, rolled back test transactions) """
+    return [
+        f'{name}:{version}:{updated_at.timestamp() if updated_at else ""}'
+        for name, (version, updated_at) in versions.items()
+    ]
+
+
+def collections_etag(*scopes):
+    """ etag function of a response depending on the collections, the user and the request """
+    def etag(request, *args, **kwargs):
+        names = resolve_scopes(request, scopes)
+        versions = get_versions(request, names)
+        key = '|'.join([
+            request.path,
+            request.META.get('QUERY_STRING', ''),
+            request.META.get('HTTP_ACCEPT', ''),
+            str(request.user.pk),
+            *version_tokens(versions),
+        ])
+        return hashlib.sha1(key.encode()).hexdigest()
+    return etag
+
+
+def collections_last_modified(*scopes):
+    """ last modified function of a response depending on the collections """
+    def last_modified(request, *args, **kwargs):
+        versions = get_versions(request, resolve_scopes(request, scopes))
+        dates = [updated_at for _, updated_at in versions.values() if updated_at]
+        return max(dates) if dates else None
+    return last_modified
+
+
+def conditional(*scopes):
+    """ api view method decorator answering 304 (not modified) from the collections
+        versions, before running the view queries and serializer """
+    return method_decorator(condition(
+        etag_func=collections_etag(*scopes),
+        last_modified_func=collections_last_modified(*scopes)
+    ))
+
+
+def requested_version(request):
+    """ row version the request expects (If-Match etag or `version` field),
+        None for an unconditional write, 0 (never a version) when unreadable """
+    value = request.META.get('HTTP_IF_MATCH')
+    if value is None:
+        value = request.data.get('version')
+    elif value.strip() == '*':
+        return None
+    if value in (None, ''):
+        return None
+    try:
+        return int(str(value).strip().replace('W/', '', 1).strip('"'))
+    except ValueError:
+        return 0
+
+
+def row_etag(version):
+    """ etag of a row version """
+    return f'"{version}"'
+
+
+def claim_row_version(model, pk, expected=None):
+    """ increment a row version, when it is still the expected one if given, and stamp the
+        change in the same update (the delta sync sees the new version even when only related
+        rows are written after), to call in the transaction of the row update (the row stays
+        locked until its end), return the new version, None if the row changed meanwhile """
+    rows = model.objects.filter(pk=pk)
+    if expected is not None:
+        rows = rows.filter(version=expected)
+    if not rows.update(
+        version=F('version') + 1, change_stamp=CollectionVersion.objects.reserve_stamps(1)[0], changed_at=timezone.now()
+    ):
+        return None
+    return expected + 1 if expected is not None else model.objects.filter(pk=pk).values_list('version', flat=True).get()
@@ -1,38 +1,115 @@
+import csv
+import uuid
+import zipfile
 from django.shortcuts import render
+from django.http import HttpResponse
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.db.utils import IntegrityError
 from django.contrib.auth.models import User
+from django.contrib.auth.hashers import make_password
 from django.core import serializers
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.shortcuts import reverse
+from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.generics import RetrieveUpdateDestroyAPIView
 from .serializers import (AddNewEmployeeSerializer, 
+                            BulkAddEmployeesSerializer,
                             UpdateEmployeeSerializer, 
+                            PatchEmployeeSerializer,
                             DeleteEmployeeSerializer, 
                             UserSerializer,
                             AddNewTaskSerializer,
                             UpdateTaskSerializer,
+                            PatchTaskSerializer,
                             DeleteTaskSerializer,
+                            TasksBatchSerializer,
+                            ExportSerializer,
+                            BootstrapSerializer,
+                            BOOTSTRAP_SECTIONS,
+                            ChangesSerializer,
+                            SYNC_COLLECTIONS,
+                            JobSerializer,
                             TaskSerializer
                             )
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_200_OK
-from .models import Profil, Task
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_200_OK, HTTP_202_ACCEPTED, HTTP_410_GONE, HTTP_412_PRECONDITION_FAILED, HTTP_503_SERVICE_UNAVAILABLE
+from .models import Profil, Task, Job
+from .pagination import EmployeeCursorPagination, TaskCursorPagination
+from .querybudget import QueryBudgetMixin
+from .bulk import EmployeesImport, TasksBatch, detect_format, iter_rows
+from .exports import stream_export
+from .filters import filter_tasks, order_tasks
+from .versions import conditional, get_versions, version_tokens, requested_version, row_etag, claim_row_version, own, TASKS, PROFILS, USERS
+from .cache import cached_response, cache_stats
+from .instrumentation import view_stats
+from .metrics import store as metrics_store, exposition, count_cache, partial_metrics
+from .dashboard import deadline_dashboard
+from .bootstrap import session_bootstrap
+from .sync import changes_since, sync_token, SyncTokenExpired
+from .payroll import payroll_summary
+from .pictures import store_picture, process_picture
+from .values import list_serializer
+from .jobs import enqueue, job_metrics
+
+def precondition_failed_response(model, pk):
+    """ 412 response of a write expecting an outdated row version """
+    version = model.objects.filter(pk=pk).values_list('version', flat=True).first()
+    return Response(
+        data={'text':'modified meanwhile, get the current version', 'version': version},
+        status=HTTP_412_PRECONDITION_FAILED,
+        headers={'ETag': row_etag(version)}
+    )
+
+
+def job_accepted_response(request, job):
+    """ 202 response of an operation queued as a background job """
+    return Response(
+        data={'job_id': job.id, 'status_url': reverse('api:job_status', kwargs={'pk': job.id})},
+        status=HTTP_202_ACCEPTED
+    )
+
 
 class GetAuthenticatedUser(APIView):
     """ authenticated user getting view """
     permission_classes = (IsAuthenticated,)
 
+    @conditional(own(USERS), own(PROFILS))
+    @cached_response(own(USERS), own(PROFILS))
     def get(self, request, *args, **kwargs):
         """ post request method """
         user = request.user
         serializer = UserSerializer(user)
         return Response(data=serializer.data, status=HTTP_200_OK)
 
+class SessionBootstrapView(QueryBudgetMixin, APIView):
+    """ client start data (user, roles, first tasks page, admin summary) in one request view """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BootstrapSerializer
+    # token authentication, user, tasks page, admin summary (2)
+    query_budget = 5
+
+    def get(self, request, *args, **kwargs):
+        """ get request method, `include` selects the sections """
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = session_bootstrap(
+            request.user,
+            serializer.validated_data.get('include', BOOTSTRAP_SECTIONS),
+            serializer.validated_data['tasks_page_size'],
+            request.query_params
+        )
+        return Response(data=data, status=HTTP_200_OK)
+
+
 class UserIsAnAdminView(APIView):
     """ employee getting by admin view """
     permission_classes = (IsAuthenticated,)
 
+    @cached_response(per_user=False)
     def get(self, request, *args, **kwargs):
         """ post request method """
         user = request.user
@@ -40,15 +117,53 @@ class UserIsAnAdminView(APIView):
         
         return Response(data={'is_admin': is_staff}, status=HTTP_200_OK)
 
-class GetEmployeesView(APIView):
+class GetEmployeesView(QueryBudgetMixin, APIView):
     """ employee getting by admin view """
     permission_classes = (IsAdminUser,)
+    # token authentication, collections versions, approximate total, employees page
+    query_budget = 4
 
+    @cached_response(USERS, PROFILS, per_user=False)
     def get(self, request, *args, **kwargs):
         """ post request method """
-        employees = User.objects.filter(profil__isnull=False)
-        serializer = UserSerializer(employees, many=True)
-        return Response(data=serializer.data, status=HTTP_200_OK)
+        serializer_class = list_serializer(UserSerializer)
+        fields = serializer_class.requested_fields(request.query_params)
+        employees = serializer_class.sparse_queryset(User.objects.filter(profil__isnull=False, is_active=True), fields)
+        paginator = EmployeeCursorPagination()
+        page = paginator.paginate_queryset(employees, request, view=self)
+        serializer = serializer_class(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+class ExportEmployeesView(APIView):
+    """ employees (with salary) csv/ndjson streaming export by admin view """
+    permission_classes = (IsAdminUser,)
+    serializer_class = ExportSerializer
+    fields = ('id', 'username', 'email', 'profil__salary', 'profil__picture', 'date_joined', 'is_staff')
+    columns = ('id', 'username', 'email', 'salary', 'picture', 'date_joined', 'is_staff')
+
+    def get(self, request, *args, **kwargs):
+        """ get request method """
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        employees = User.objects.filter(profil__isnull=False, is_active=True).order_by('id')
+        if 'employee' in serializer.validated_data:
+            employees = employees.filter(id=serializer.validated_data['employee'])
+        return stream_export(
+            employees, self.fields, self.columns,
+            serializer.validated_data['output'], 'employees'
+        )
+
+
+class PayrollSummaryView(QueryBudgetMixin, APIView):
+    """ payroll headcount, total, mean, median and percentiles salaries by admin view """
+    permission_classes = (IsAdminUser,)
+    # token authentication, summary row, salaries histogram
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        """ get request method """
+        return Response(data=payroll_summary(), status=HTTP_200_OK)
+
 
 #
 class AddNewEmployeeView(APIView):
@@ -67,34 +182,81 @@ class AddNewEmployeeView(APIView):
         username = serializer.data.get('username')
         password = serializer.data.get('password')
         salary = serializer.data.get('salary')
-        picture = request.data.get('picture')
-        employee = User.objects.create(username=username, password=password)
+        picture = store_picture(request.data.get('picture'))
+        employee = User.objects.create(username=username, password=make_password(password))
         profil = Profil.objects.create(user=employee, salary=salary, picture=picture)
+        process_picture(picture)
 
         return Response(data=serializer.data, status=HTTP_200_OK)
 
         
 
 
+class BulkAddEmployeesView(APIView):
+    """ employees bulk import (csv or ndjson, pictures in an optional zip) by admin view """
+    permission_classes = (IsAdminUser,)
+    serializer_class = BulkAddEmployeesSerializer
+
+    def post(self, request, *args, **kwargs):
+        """ post request method """
+        serializer = self.serializer_class(
+            data=request.data,
+            context={'request':request}
+        )
+        serializer.is_valid(raise_exception=True)
+        #
+        upload = serializer.validated_data.get('file')
+        file_format = detect_format(upload, serializer.validated_data.get('format'))
+        if serializer.validated_data.get('background'):
+            folder = f'imports/{uuid.uuid4().hex}'
+            pictures = serializer.validated_data.get('pictures')
+            job = enqueue(
+                'import_employees',
+                file=default_storage.save(f'{folder}/{upload.name}', upload),
+                file_format=file_format,
+                pictures=default_storage.save(f'{folder}/{pictures.name}', pictures) if pictures else None
+            )
+            return job_accepted_response(request, job)
+        try:
+            employees_import = EmployeesImport(pictures=serializer.validated_data.get('pictures'))
+        except zipfile.BadZipFile as error:
+            return Response(data={'text':'pictures is not a valid zip file'}, status=HTTP_400_BAD_REQUEST)
+        try:
+            report = employees_import.run(iter_rows(upload, file_format))
+        except (UnicodeDecodeError, csv.Error) as error:
+            return Response(data={'text':f'invalid {file_format} file: {error}'}, status=HTTP_400_BAD_REQUEST)
+        return Response(data=report, status=HTTP_200_OK)
+
+
 class UpdateEmployeeView(APIView):
     """ employee updating management by admin view """
     permission_classes = (IsAdminUser,)
     serializer_class = UpdateEmployeeSerializer
+    patch_serializer_class = PatchEmployeeSerializer
 
     def put(self, request, *args, **kwargs):
-        """ post request method """
+        """ put request method, every field is sent """
         serializer = self.serializer_class(
             data=request.data,
             context={'request':request}
         )
         serializer.is_valid(raise_exception=True)
-        #
-        employee_id = serializer.data.get('employee_id')
-        username = serializer.data.get('username')
-        salary = serializer.data.get('salary')
-        picture = request.data.get('picture')
+        return self.update(request, serializer.validated_data, serializer.data)
+
+    def patch(self, request, *args, **kwargs):
+        """ patch request method, only the sent fields are written """
+        serializer = self.patch_serializer_class(
+            data=request.data,
+            context={'request':request}
+        )
+        serializer.is_valid(raise_exception=True)
+        return self.update(request, serializer.validated_data)
+
+    def update(self, request, data, response_data=None):
+        """ write the employee changed columns if its version is the expected one,
+            answer the response data (the updated employee by default) with the version etag """
         try:
-            employee = User.objects.get(id=employee_id)
+            employee = User.objects.get(id=data['employee_id'])
         except ObjectDoesNotExist as error:
             return Response(data={'text':'employee not exists'}, status=HTTP_400_BAD_REQUEST)
         
@@ -102,16 +264,44 @@ class UpdateEmployeeView(APIView):
             profil = Profil.objects.get(user=employee)
         except ObjectDoesNotExist as error:
             return Response(data={'text':'this user it not an employee'}, status=HTTP_400_BAD_REQUEST)
-        try: 
-            employee.username = username
-            employee.save()
-        except IntegrityError as error:
-            return Response(data={'text':'username already exists'}, status=HTTP_400_BAD_REQUEST)
-
-        profil.salary = salary
-        profil.picture = picture
-        profil.save()
-        return Response(data=serializer.data, status=HTTP_200_OK)
+        expected = requested_version(request)
+        if expected is not None and expected != profil.version:
+            return precondition_failed_response(Profil, profil.pk)
+
+        user_fields = []
+        if 'username' in data and data['username'] != employee.username:
+            employee.username = data['username']
+            user_fields.append('username')
+        profil_fields = []
+        if 'salary' in data and data['salary'] != profil.salary:
+            profil.salary = data['salary']
+            profil_fields.append('salary')
+        # no picture sent, no picture file read or written
+        picture = store_picture(data['picture']) if 'picture' in data else profil.picture.name
+        if picture != profil.picture.name:
+            profil.picture = picture
+            profil.picture_processed = False
+            profil_fields.extend(('picture', 'picture_processed'))
+        if user_fields or profil_fields:
+            try:
+                with transaction.atomic():
+                    version = claim_row_version(Profil, profil.pk, expected)
+                    if version is None:
+                        return precondition_failed_response(Profil, profil.pk)
+                    profil.version = version
+                    if user_fields:
+                        employee.save(update_fields=user_fields)
+                    if profil_fields:
+                        profil.save(update_fields=profil_fields)
+            except IntegrityError as error:
+                return Response(data={'text':'username already exists'}, status=HTTP_400_BAD_REQUEST)
+            if 'picture' in profil_fields:
+                process_picture(picture)
+        return Response(
+            data=response_data if response_data is not None else UserSerializer(employee).data,
+            status=HTTP_200_OK,
+            headers={'ETag': row_etag(profil.version)}
+        )
 
 class DeleteEmployeeView(APIView):
     """ employee deleting management by admin view """
@@ -137,20 +327,51 @@ class DeleteEmployeeView(APIView):
         except ObjectDoesNotExist as error:
             return Response(data={'text':f'this user{employee} it not an employee'}, status=HTTP_400_BAD_REQUEST)
 
-        employee.delete()
-        return Response(data={'text':f'employee({employee}) deleted successfully'}, status=HTTP_200_OK)
+        # hidden from the lists and logged out right away, the rows are deleted in the background
+        employee.is_active = False
+        employee.save(update_fields=['is_active'])
+        job = enqueue('delete_employee', employee_id=employee.id)
+        return job_accepted_response(request, job)
 
 
 
-class GetTasksView(APIView):
+class GetTasksView(QueryBudgetMixin, APIView):
     """ tasks getting by admin view """
     permission_classes = (IsAdminUser,)
+    # token authentication, collections versions, approximate total, tasks page
+    query_budget = 4
 
+    @conditional(TASKS, USERS)
     def get(self, request, *args, **kwargs):
         """ post request method """
-        tasks = Task.objects.all()
-        serializer = TaskSerializer(tasks, many=True)
-        return Response(data=serializer.data, status=HTTP_200_OK)
+        serializer_class = list_serializer(TaskSerializer)
+        fields = serializer_class.requested_fields(request.query_params)
+        tasks = serializer_class.sparse_queryset(
+            Task.objects.filter(employee__is_active=True), fields, columns=('id', 'deadline')
+        )
+        tasks = filter_tasks(tasks, request.query_params)
+        paginator = TaskCursorPagination()
+        page = paginator.paginate_queryset(tasks, request, view=self)
+        serializer = serializer_class(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+class ExportTasksView(APIView):
+    """ tasks csv/ndjson streaming export (employee and deadline range filters) by admin view """
+    permission_classes = (IsAdminUser,)
+    serializer_class = ExportSerializer
+    fields = ('id', 'title', 'description', 'deadline', 'employee_id', 'employee__username')
+    columns = ('id', 'title', 'description', 'deadline', 'employee_id', 'employee')
+
+    def get(self, request, *args, **kwargs):
+        """ get request method """
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        tasks = filter_tasks(Task.objects.filter(employee__is_active=True).order_by('id'), request.query_params)
+        return stream_export(
+            tasks, self.fields, self.columns,
+            serializer.validated_data['output'], 'tasks'
+        )
+
 
 #
 class AddNewTaskView(APIView):
@@ -171,7 +392,7 @@ class AddNewTaskView(APIView):
         description = request.data.get('description')
         deadline = request.data.get('deadline')
         try:
-            employee = User.objects.get(id=employee_id, is_staff=False)
+            employee = User.objects.get(id=employee_id, is_staff=False, is_active=True)
         except ObjectDoesNotExist as error:
             return Response(data={'text':'employee not exists'}, status=HTTP_400_BAD_REQUEST)
         Task.objects.create(employee=employee, title=title, description=description, deadline=deadline)
@@ -183,30 +404,55 @@ class UpdateTaskView(APIView):
     """ task updating management by admin view """
     permission_classes = (IsAdminUser,)
     serializer_class = UpdateTaskSerializer
+    patch_serializer_class = PatchTaskSerializer
 
     def put(self, request, *args, **kwargs):
-        """ post request method """
+        """ put request method, every field is sent """
         serializer = self.serializer_class(
             data=request.data,
             context={'request':request}
         )
         serializer.is_valid(raise_exception=True)
-        #
-        task_id = serializer.data.get('task_id')
-        title = serializer.data.get('title')
-        description = serializer.data.get('description')
-        deadline = request.data.get('deadline')
+        return self.update(request, serializer.validated_data, serializer.data)
+
+    def patch(self, request, *args, **kwargs):
+        """ patch request method, only the sent fields are written """
+        serializer = self.patch_serializer_class(
+            data=request.data,
+            context={'request':request}
+        )
+        serializer.is_valid(raise_exception=True)
+        return self.update(request, serializer.validated_data)
+
+    def update(self, request, data, response_data=None):
+        """ write the task changed columns if its version is the expected one,
+            answer the response data (the updated task by default) with the version etag """
         try:
-            task = Task.objects.get(id=task_id)
+            task = Task.objects.select_related('employee').get(id=data['task_id'])
         except ObjectDoesNotExist as error:
             return Response(data={'text':'task not exists'}, status=HTTP_400_BAD_REQUEST)
-
-        
-        task.title = title
-        task.description = description
-        task.deadline = deadline
-        task.save()
-        return Response(data=serializer.data, status=HTTP_200_OK)
+        expected = requested_version(request)
+        if expected is not None and expected != task.version:
+            return precondition_failed_response(Task, task.pk)
+
+        fields = [
+            name for name in ('title', 'description', 'deadline')
+            if name in data and data[name] != getattr(task, name)
+        ]
+        if fields:
+            with transaction.atomic():
+                version = claim_row_version(Task, task.pk, expected)
+                if version is None:
+                    return precondition_failed_response(Task, task.pk)
+                task.version = version
+                for name in fields:
+                    setattr(task, name, data[name])
+                task.save(update_fields=fields)
+        return Response(
+            data=response_data if response_data is not None else TaskSerializer(task).data,
+            status=HTTP_200_OK,
+            headers={'ETag': row_etag(task.version)}
+        )
 
 class DeleteTaskView(APIView):
     """ task deleting management by admin view """
@@ -231,18 +477,148 @@ class DeleteTaskView(APIView):
         return Response(data={'text':f'task({task.title}) deleted successfully'}, status=HTTP_200_OK)
 
 
-class GetEmployeeTasks(APIView):
+class TasksBatchView(APIView):
+    """ tasks batch operations (create, update, delete, reassign) by admin view """
+    permission_classes = (IsAdminUser,)
+    serializer_class = TasksBatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        """ post request method """
+        serializer = self.serializer_class(
+            data=request.data,
+            context={'request':request}
+        )
+        serializer.is_valid(raise_exception=True)
+        #
+        batch = TasksBatch(
+            serializer.validated_data.get('operations'),
+            atomic=serializer.validated_data.get('mode') == 'atomic'
+        )
+        done = batch.run()
+        if not done and batch.atomic:
+            return Response(data={'results': batch.results}, status=HTTP_400_BAD_REQUEST)
+        return Response(data={'results': batch.results}, status=HTTP_200_OK)
+
+
+class TasksDashboardView(QueryBudgetMixin, APIView):
+    """ per employee overdue, due today and due this week tasks counts by admin view """
+    permission_classes = (IsAdminUser,)
+    # token authentication, collections versions, grouped counts
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        """ get request method """
+        versions = get_versions(request, (TASKS, USERS))
+        key = 'dashboard:' + ':'.join(version_tokens(versions))
+        cache = caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+        data = cache.get(key)
+        count_cache('dashboard', self.__class__.__name__, data is not None)
+        if data is None:
+            data = deadline_dashboard()
+            cache.set(key, data, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 30))
+        return Response(data=data, status=HTTP_200_OK)
+
+
+class GetEmployeeTasks(QueryBudgetMixin, APIView):
     """ tasks getting by admin view """
     permission_classes = (IsAuthenticated,)
+    # token authentication, collections versions, employee tasks
+    query_budget = 3
 
+    @conditional(own(TASKS), own(USERS))
+    @cached_response(own(TASKS), own(USERS))
     def get(self, request, *args, **kwargs):
         """ post request method """
-        tasks = Task.objects.filter(employee=request.user)
-        serializer = TaskSerializer(tasks, many=True)
+        serializer_class = list_serializer(TaskSerializer)
+        fields = serializer_class.requested_fields(request.query_params)
+        tasks = serializer_class.sparse_queryset(Task.objects.filter(employee=request.user), fields)
+        tasks = order_tasks(filter_tasks(tasks, request.query_params), request.query_params)
+        serializer = serializer_class(tasks, many=True, fields=fields)
         return Response(data=serializer.data, status=HTTP_200_OK)
 
 
 
+class ChangesView(QueryBudgetMixin, APIView):
+    """ tasks and profils delta sync view, every row for the admins, their own rows for the employees """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = ChangesSerializer
+    # token authentication, tombstones horizon, tasks, profils, tombstones (the look-back window ones too)
+    query_budget = 8
+
+    def get(self, request, *args, **kwargs):
+        """ get request method, the rows changed after the `since` sync token """
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        position = serializer.validated_data.get('since', (0, 0, 0))
+        try:
+            changes, position, has_more = changes_since(
+                request.user,
+                serializer.validated_data.get('collections', SYNC_COLLECTIONS),
+                position,
+                serializer.validated_data['page_size']
+            )
+        except SyncTokenExpired as error:
+            return Response(data={'text':'sync token expired, sync again without token'}, status=HTTP_410_GONE)
+        return Response(
+            data={'changes': changes, 'next': sync_token(*position), 'has_more': has_more},
+            status=HTTP_200_OK
+        )
+
+
+class ResponseCacheStatsView(APIView):
+    """ responses cache hits and misses (of the serving process) by admin view """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        """ get request method """
+        return Response(data=cache_stats(), status=HTTP_200_OK)
+
+
+class InstrumentationView(APIView):
+    """ per view requests timings, recent requests and profiles (of the serving process) by admin view """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        """ get request method """
+        return Response(data=view_stats.summary(), status=HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    """ requests, sql queries and caches metrics of every process in the prometheus text format by admin view """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        """ get request method """
+        if partial_metrics():
+            return Response(
+                data={'text':'several workers serve the requests, set METRICS_DIR to sum their metrics'},
+                status=HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return HttpResponse(exposition(metrics_store.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class JobStatusView(APIView):
+    """ background job status getting by admin view """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, pk, *args, **kwargs):
+        """ get request method """
+        try:
+            job = Job.objects.get(id=pk)
+        except ObjectDoesNotExist as error:
+            return Response(data={'text':'job not exists'}, status=HTTP_400_BAD_REQUEST)
+        return Response(data=JobSerializer(job).data, status=HTTP_200_OK)
+
+
+class JobMetricsView(APIView):
+    """ background jobs queue depth and latency by admin view """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        """ get request method """
+        return Response(data=job_metrics(), status=HTTP_200_OK)
+
+
 class UserProfilView(RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
     queryset = User.objects.all()
@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'companymanagementapi.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once the apps are loaded
+from api.streams import task_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """ the events stream (a long lived response) is served out of the django views """
+    if scope['type'] == 'http' and scope['path'] == '/api/events':
+        return await task_events(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -40,7 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'api',
+    'api.apps.ApiConfig',
 
     'django.contrib.sites',
     'allauth',
@@ -60,7 +60,9 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -145,10 +147,129 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 #rest-framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication'
+        'api.authentication.CachedTokenAuthentication'
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer'
     ]
 }
 
+# responses brotli (when installed) or gzip compression, negotiated from the Accept-Encoding header
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+}
+
+# token -> user authentication cache, 'lru' (in-process) or 'django' (CACHES backend), a
+# cache hit reads no row: the invalidations reach the other processes through CACHE_ALIAS,
+# with an in-process CACHES backend (locmem) their entries are used until the TIMEOUT
+TOKEN_AUTHENTICATION_CACHE = {
+    'BACKEND': 'lru',
+    'TIMEOUT': 60,
+    'MAX_ENTRIES': 10000,
+    'CACHE_ALIAS': 'default',
+}
+
+# read end points responses cache, 'lru' (in-process) or 'django' (CACHES backend)
+RESPONSE_CACHE = {
+    'BACKEND': 'lru',
+    'TIMEOUT': 60,
+    'MAX_ENTRIES': 1000,
+    'CACHE_ALIAS': 'default',
+}
+
+# tasks deadline dashboard cache, the counts drift with the time for at most the timeout
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_CACHE_TIMEOUT = 30
+
+# profils pictures webp variants (square sizes in pixels), generated by a pool of
+# PICTURE_WORKERS threads ('thread'), by the background jobs workers ('job') or inline ('sync')
+PICTURE_VARIANTS = {
+    'thumbnail': 40,
+    'small': 128,
+    'medium': 512,
+}
+PICTURE_PROCESSING = 'thread'
+PICTURE_WORKERS = 2
+
+# background jobs worker (manage.py run_jobs) defaults
+JOBS_WORKER = {
+    'WORKERS': 4,
+    'POOL': 'thread',
+    'POLL_INTERVAL': 1.0,
+    'STALE_TIMEOUT': 3600,
+    'STALE_CHECK_INTERVAL': 60,
+}
+
+# list endpoints keyset pagination
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# employees bulk import rows per validation/insert transaction
+BULK_IMPORT_CHUNK_SIZE = 500
+
+# tasks events pub/sub: 'database' (shared by the processes through the events table, polled,
+# the deployments run several processes: web workers, jobs workers) or 'local' (subscribers of
+# the publishing process only, for a single process server), the pollers read again the events
+# of the last LOOKBACK seconds (ids committed out of order), the events older than RETENTION
+# seconds are deleted every PRUNE_INTERVAL seconds by the prune_events job (run_jobs workers)
+EVENTS_BROKER = {
+    'BACKEND': os.environ.get('EVENTS_BROKER', 'database'),
+    'POLL_INTERVAL': 1.0,
+    'RETENTION': 3600,
+    'LOOKBACK': 10,
+    'PRUNE_INTERVAL': 600,
+}
+
+# delta sync deleted rows tombstones kept (days) by the prune_tombstones command
+SYNC_TOMBSTONES_RETENTION_DAYS = 30
+
+# delta sync changes sent again (seconds), when the changes stamps come from the sequence (postgresql)
+SYNC_LOOKBACK = 10
+
+# tasks deleted per transaction by the background employee deletion
+EMPLOYEE_DELETE_CHUNK_SIZE = 500
+
+# tasks batch end point maximum operations count
+TASK_BATCH_MAX_OPERATIONS = 1000
+
+# read end points served as async views (opt-in, ASYNC_READ_VIEWS=1 with the asgi application),
+# their queries run on a pool of ASYNC_DB_THREADS threads (database connections) per process
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+ASYNC_DB_THREADS = 16
+
+# list end points serialized from values() rows (same output as the model serializers,
+# without the model instances nor the serializers fields machinery)
+VALUES_LIST_SERIALIZERS = True
+
+# per request instrumentation: Server-Timing header and per view stats (/api/instrumentation),
+# cProfile of a PROFILE_SAMPLE_RATE share of the requests and of the requests sent with the
+# PROFILE_HEADER header set to PROFILE_KEY (any value with DEBUG), dumped to PROFILE_DIR when set
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_HEADER': 'X-Profile',
+    'PROFILE_KEY': os.environ.get('PROFILE_KEY'),
+    'PROFILE_DIR': None,
+}
+
+# per url name requests, sql queries and caches metrics (/api/metrics), each process writes
+# its values every FLUSH_INTERVAL seconds to its file of DIRECTORY (of this deployment only,
+# shared by the workers of the host), the metrics end point sums the files, None exposes the
+# metrics of the serving process only
+METRICS = {
+    'ENABLED': True,
+    'DIRECTORY': os.environ.get('METRICS_DIR'),
+    'FLUSH_INTERVAL': 1.0,
+    # the gunicorn workers count default
+    'WORKERS': int(os.environ.get('WEB_CONCURRENCY', 1)),
+}
+
+# views sql queries budget check mode: 'log', 'warn' or 'raise'
+QUERY_BUDGET_MODE = 'log'
 
 #
 MEDIA_URL = '/media/'